@@ -0,0 +1,98 @@
+"""Measure TorchTOSDataset images/s with and without prefetching and batched decoding.
+
+Runs against an in-process S3 stand-in (moto) with an artificial per-request
+latency, so no TOS credentials are needed:
+
+    python samples/tos_dataset_benchmark/benchmark.py --latency-ms 20 --prefetch 1 8 32
+
+``--decode-size`` additionally runs each setting with ``ImageDecoder``, which
+decodes whole batches in a thread pool at a reduced JPEG scale.
+"""
+import argparse
+import io
+import time
+
+import numpy as np
+from moto import mock_aws
+from PIL import Image
+from volcengine import Credentials
+
+import volcengine_ml_platform
+from volcengine_ml_platform.io import tos
+from volcengine_ml_platform.io.tos_dataset import TorchTOSDataset
+from volcengine_ml_platform.io.tos_decode import ImageDecoder
+
+parser = argparse.ArgumentParser(
+    description="TorchTOSDataset prefetch benchmark",
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+)
+parser.add_argument("--num-images", type=int, default=512, help="number of images")
+parser.add_argument("--image-size", type=int, default=128, help="width and height of the jpeg images")
+parser.add_argument("--batch-size", type=int, default=64, help="indices per __getitems__ call")
+parser.add_argument("--latency-ms", type=float, default=20, help="simulated latency of each GET")
+parser.add_argument(
+    "--prefetch", type=int, nargs="+", default=[1, 8, 32], help="prefetch settings to compare, 1 is the baseline",
+)
+parser.add_argument(
+    "--decode-size", type=int, default=0, help="also benchmark ImageDecoder with this target size, 0 to skip",
+)
+args = parser.parse_args()
+
+BUCKET = "tos-dataset-benchmark"
+
+
+def make_client():
+    credentials = Credentials.Credentials(ak="ak", sk="sk", service="ml_platform", region="us-east-1")
+    client = tos.TOSClient(credentials=credentials)
+
+    def add_latency(**kwargs):
+        time.sleep(args.latency_ms / 1000)
+
+    # the boto3 client is shared between TOSClient instances, register the hook once
+    client.s3_client.meta.events.register("before-call.s3.GetObject", add_latency, unique_id="benchmark-latency")
+    return client
+
+
+def prepare(client):
+    client.create_bucket(BUCKET)
+    rng = np.random.default_rng(0)
+    manifest_info = {"buckets": [], "keys": [], "annotations": []}
+    for i in range(args.num_images):
+        pixels = rng.integers(0, 255, size=(args.image_size, args.image_size, 3), dtype=np.uint8)
+        buf = io.BytesIO()
+        Image.fromarray(pixels).save(buf, format="JPEG", quality=90)
+        client.put_object(BUCKET, f"images/{i:06d}.jpg", buf.getvalue())
+        manifest_info["buckets"].append(BUCKET)
+        manifest_info["keys"].append(f"images/{i:06d}.jpg")
+        manifest_info["annotations"].append({"Result": [{"Data": [{"Label": str(i % 10)}]}]})
+    return manifest_info
+
+
+def run(manifest_info, prefetch, decode=None):
+    dataset = TorchTOSDataset(manifest_info, decode=decode, prefetch=prefetch, client_factory=make_client)
+    indices = np.random.default_rng(1).permutation(len(dataset)).tolist()
+    start = time.perf_counter()
+    for i in range(0, len(indices), args.batch_size):
+        dataset.__getitems__(indices[i:i + args.batch_size])
+    return len(indices) / (time.perf_counter() - start)
+
+
+def main():
+    # moto only intercepts the default AWS endpoints
+    volcengine_ml_platform.get_tos_endpoint_url = lambda: None
+    volcengine_ml_platform.get_session_token = lambda: None
+    with mock_aws():
+        manifest_info = prepare(make_client())
+        baseline = None
+        for prefetch in args.prefetch:
+            rate = run(manifest_info, prefetch)
+            baseline = baseline or rate
+            print(f"prefetch={prefetch:<4d} {rate:8.1f} images/s  x{rate / baseline:.2f}")
+            if args.decode_size:
+                decoder = ImageDecoder(size=(args.decode_size, args.decode_size))
+                rate = run(manifest_info, prefetch, decoder)
+                print(f"prefetch={prefetch:<4d} {rate:8.1f} images/s  x{rate / baseline:.2f}  ImageDecoder")
+
+
+if __name__ == "__main__":
+    main()
@@ -22,7 +22,13 @@ install_requires = [
 ]
 
 pytorch_requires = ["torch==1.8.0"]
-full_requires = list(set(pytorch_requires))
+async_requires = ["aiobotocore>=2.0.0"]
+metrics_requires = ["opentelemetry-api>=1.0.0"]
+zstd_requires = ["zstandard>=0.15.0"]
+turbojpeg_requires = ["PyTurboJPEG>=1.6.0"]
+full_requires = list(
+    set(pytorch_requires + async_requires + metrics_requires + zstd_requires + turbojpeg_requires),
+)
 
 package_root = os.path.abspath(os.path.dirname(__file__))
 readme_filename = os.path.join(package_root, "README.md")
@@ -50,6 +56,10 @@ setuptools.setup(
     extras_require={
         "full": full_requires,
         "pytorch": pytorch_requires,
+        "async": async_requires,
+        "metrics": metrics_requires,
+        "zstd": zstd_requires,
+        "turbojpeg": turbojpeg_requires,
     },
     python_requires=">=3.6",
     scripts=[],
@@ -0,0 +1,24 @@
+import pytest
+from moto import mock_aws
+from volcengine import Credentials
+
+import volcengine_ml_platform
+from volcengine_ml_platform.io import tos
+
+bucket = "ml-platform-unit-test"
+
+
+def make_credentials(ak="ak"):
+    return Credentials.Credentials(ak=ak, sk="sk", service="ml_platform", region="us-east-1")
+
+
+@pytest.fixture
+def tos_cli(monkeypatch):
+    # moto only intercepts the default AWS endpoints, so drop the TOS endpoint
+    monkeypatch.setattr(volcengine_ml_platform, "get_tos_endpoint_url", lambda: None)
+    monkeypatch.setattr(volcengine_ml_platform, "get_session_token", lambda: None)
+    tos.clear_client_cache()
+    with mock_aws():
+        cli = tos.TOSClient(credentials=make_credentials())
+        assert cli.create_bucket(bucket)
+        yield cli
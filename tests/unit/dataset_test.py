@@ -0,0 +1,164 @@
+import json
+import os
+import time
+
+import pytest
+
+from tests.unit.conftest import bucket
+from volcengine_ml_platform.datasets import dataset
+from volcengine_ml_platform.io import tos_shards
+
+
+def test_manifest_line_offsets(tmp_path):
+    manifest_path = str(tmp_path / "local_metadata.manifest")
+    lines = [{"Data": {"FilePath": f"{i}.jpg"}, "Annotation": "标注" * i} for i in range(10)]
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+    offsets = dataset.manifest_line_offsets(manifest_path)
+    assert len(offsets) == len(lines) + 1
+    assert offsets[-1] == os.path.getsize(manifest_path)
+    with open(manifest_path, "rb") as f:
+        f.seek(int(offsets[7]))
+        assert json.loads(f.readline()) == lines[7]
+    assert os.path.exists(manifest_path + dataset.MANIFEST_INDEX_SUFFIX)
+
+    # a rewritten manifest invalidates the cached index
+    with open(manifest_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(lines[0]) + "\n")
+    assert len(dataset.manifest_line_offsets(manifest_path)) == len(lines) + 2
+
+    ds = dataset._Dataset.__new__(dataset._Dataset)
+    ds.local_path = str(tmp_path)
+    assert list(ds._iter_manifest(offset=8, limit=2)) == lines[8:10]
+    assert list(ds._iter_manifest(offset=9, limit=-1)) == lines[9:] + lines[:1]
+    assert list(ds._iter_manifest(offset=20)) == []
+
+
+@pytest.mark.parametrize("limit,dedup_capacity", [(-1, 100), (7, 100), (-1, 1)])
+def test_create_manifest_dataset(tos_cli, tmp_path, limit, dedup_capacity):
+    # repeated urls, including ones at the very end, are downloaded once but keep their lines
+    names = [0, 1, 2, 1, 3, 4, 0, 5, 6, 7, 8, 9, 9, 2, 2]
+    lines = [
+        {"Data": {"ImageURL": f"tos://{bucket}/images/{n}.jpg"}, "Annotation": i}
+        for i, n in enumerate(names)
+    ]
+    for n in set(names):
+        tos_cli.put_object(bucket, f"images/{n}.jpg", str(n).encode())
+    tos_cli.put_object(bucket, "train.manifest", "".join(json.dumps(line) + "\n" for line in lines).encode())
+
+    downloads = []
+    download_file = tos_cli.download_file
+    tos_cli.download_file = lambda **kwargs: downloads.append(kwargs.get("tos_url")) or download_file(**kwargs)
+
+    ds = dataset._Dataset.__new__(dataset._Dataset)
+    ds.local_path = str(tmp_path / "local")
+    ds.tos_client = tos_cli
+    ds.tos_source = None
+    ds._get_detail = lambda: None
+    ds._get_storage_path = lambda: f"tos://{bucket}/train.manifest"
+    ds._create_manifest_dataset("ImageURL", limit=limit, parallelism=3, dedup_capacity=dedup_capacity)
+
+    expected = lines if limit == -1 else lines[:limit]
+    image_downloads = [url for url in downloads if url.endswith(".jpg")]
+    if dedup_capacity == 100:
+        assert len(image_downloads) == len({line["Data"]["ImageURL"] for line in expected})
+    else:
+        # only the download window is remembered, repeats further apart are fetched again
+        assert len(image_downloads) > len(set(names))
+    assert ds.created and ds.data_count == len(expected)
+    local_lines = list(ds._iter_manifest())
+    assert [line["Annotation"] for line in local_lines] == [line["Annotation"] for line in expected]
+    for line, n in zip(local_lines, names):
+        with open(line["Data"]["FilePath"], "rb") as f:
+            assert f.read() == str(n).encode()
+
+
+def test_create_manifest_dataset_stalled_download(tos_cli, tmp_path):
+    # a slow first file followed by many repeats of another one
+    names = [0] + [1] * 50 + list(range(2, 6))
+    lines = [{"Data": {"ImageURL": f"tos://{bucket}/images/{n}.jpg"}, "Annotation": i} for i, n in enumerate(names)]
+    for n in set(names):
+        tos_cli.put_object(bucket, f"images/{n}.jpg", str(n).encode())
+    tos_cli.put_object(bucket, "train.manifest", "".join(json.dumps(line) + "\n" for line in lines).encode())
+
+    downloads = []
+    seen_while_stalled = []
+    download_file = tos_cli.download_file
+
+    def slow_download_file(**kwargs):
+        downloads.append(kwargs.get("tos_url"))
+        if kwargs.get("tos_url", "").endswith("/0.jpg"):
+            time.sleep(0.2)
+            seen_while_stalled.extend(downloads)
+        return download_file(**kwargs)
+
+    tos_cli.download_file = slow_download_file
+    ds = dataset._Dataset.__new__(dataset._Dataset)
+    ds.local_path = str(tmp_path / "local")
+    ds.tos_client = tos_cli
+    ds.tos_source = f"tos://{bucket}/train.manifest"
+    ds._create_manifest_dataset("ImageURL", parallelism=3, max_pending_lines=4)
+
+    # parsing paused at 4 pending lines, so nothing after the repeats was submitted meanwhile
+    assert [url.rsplit("/", 1)[-1] for url in seen_while_stalled if url.endswith(".jpg")] == ["0.jpg", "1.jpg"]
+    assert ds.data_count == len(lines)
+    assert [line["Annotation"] for line in ds._iter_manifest()] == list(range(len(lines)))
+
+
+@pytest.mark.parametrize("limit", [-1, 5])
+def test_create_shard_dataset(tos_cli, tmp_path, limit):
+    names = [0, 1, 0, 2, 1, 3, 3]
+    lines = [{"Data": {"ImageURL": f"tos://{bucket}/images/{n}.jpg"}, "Annotation": i} for i, n in enumerate(names)]
+    for n in set(names):
+        tos_cli.put_object(bucket, f"images/{n}.jpg", str(n).encode() * 100)
+    prefix = f"tos://{bucket}/packed"
+    index = tos_shards.pack_manifest(iter(lines), "ImageURL", prefix, tos_client=tos_cli, max_samples_per_shard=2)
+    # repeated urls share the data of their first occurrence
+    assert index.offsets[2] == index.offsets[0] and index.shard_ids[2] == index.shard_ids[0]
+    assert [i for i, _, _ in tos_shards.ShardReader(index, tos_cli)] == [0, 1, 3, 5]
+
+    ds = dataset._Dataset.__new__(dataset._Dataset)
+    ds.local_path = str(tmp_path / "local")
+    ds.tos_client = tos_cli
+    ds._create_shard_dataset(tos_shards.index_url(prefix), "ImageURL", limit=limit)
+
+    expected = lines if limit == -1 else lines[:limit]
+    local_lines = list(ds._iter_manifest())
+    assert ds.data_count == len(expected)
+    assert [line["Annotation"] for line in local_lines] == [line["Annotation"] for line in expected]
+    for line, n in zip(local_lines, names):
+        with open(line["Data"]["FilePath"], "rb") as f:
+            assert f.read() == str(n).encode() * 100
+
+
+def test_iter_np_batches(tmp_path, monkeypatch):
+    pytest.importorskip("torch")
+    from PIL import Image
+
+    from volcengine_ml_platform.datasets.image_dataset import ImageDataset
+
+    manifest_path = tmp_path / "local_metadata.manifest"
+    with open(manifest_path, "w") as f:
+        for i in range(5):
+            file_path = str(tmp_path / f"{i}.png")
+            Image.new("RGB", (4, 3), (i, 0, 0)).save(file_path)
+            f.write(json.dumps({"Data": {"FilePath": file_path}, "Annotation": i}) + "\n")
+
+    ds = ImageDataset.__new__(ImageDataset)
+    ds.local_path = str(tmp_path)
+    loaded = []
+    load_image = ImageDataset._load_image
+
+    def recording_load(file_path, *args):
+        loaded.append(file_path)
+        return load_image(file_path, *args)
+
+    monkeypatch.setattr(ImageDataset, "_load_image", staticmethod(recording_load))
+    batches = [(images.copy(), annotations) for images, annotations in ds.iter_np_batches(batch_size=2)]
+    assert [annotations for _, annotations in batches] == [[0, 1], [2, 3], [4]]
+    assert [int(v) for images, _ in batches for v in images[:, 0, 0, 0]] == [0, 1, 2, 3, 4]
+    assert batches[0][0].shape == (2, 3, 4, 3)
+    # the first image, decoded to find the shape, is not decoded again
+    assert len(loaded) == 5
@@ -0,0 +1,73 @@
+import pytest
+from botocore.exceptions import ClientError
+from botocore.exceptions import EndpointConnectionError
+
+from volcengine_ml_platform.util.retry import is_retryable_error
+from volcengine_ml_platform.util.retry import RetryBudget
+from volcengine_ml_platform.util.retry import RetryPolicy
+
+
+def client_error(code, status):
+    return ClientError(
+        {"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": status}},
+        "GetObject",
+    )
+
+
+def flaky(errors):
+    calls = []
+
+    def f():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return len(calls)
+    return f, calls
+
+
+def test_classifier():
+    assert is_retryable_error(client_error("SlowDown", 503))
+    assert is_retryable_error(client_error("InternalError", 500))
+    assert is_retryable_error(EndpointConnectionError(endpoint_url="http://tos"))
+    assert not is_retryable_error(client_error("NoSuchKey", 404))
+    assert not is_retryable_error(client_error("PreconditionFailed", 412))
+    assert not is_retryable_error(ValueError())
+
+
+def test_retry_policy():
+    policy = RetryPolicy(max_attempts=3, base_delay=0.001)
+    f, calls = flaky([client_error("SlowDown", 503), client_error("InternalError", 500)])
+    assert policy.call(f) == 3
+
+    f, calls = flaky([client_error("SlowDown", 503)] * 3)
+    with pytest.raises(ClientError):
+        policy(f)()
+    assert len(calls) == 3
+
+    # fatal errors are raised at once
+    f, calls = flaky([client_error("NoSuchKey", 404)])
+    with pytest.raises(ClientError):
+        policy.call(f)
+    assert len(calls) == 1
+
+
+def test_full_jitter():
+    policy = RetryPolicy(base_delay=1, max_delay=4)
+    assert all(0 <= policy.backoff(1) <= 1 for _ in range(100))
+    assert all(0 <= policy.backoff(10) <= 4 for _ in range(100))
+
+
+def test_retry_budget():
+    budget = RetryBudget(ratio=0.5, min_retries_per_second=0, max_balance=2)
+    assert budget.try_withdraw()
+    assert budget.try_withdraw()
+    assert not budget.try_withdraw()
+    budget.deposit()
+    budget.deposit()
+    assert budget.try_withdraw()
+
+    policy = RetryPolicy(base_delay=0.001, budget=RetryBudget(min_retries_per_second=0, max_balance=1))
+    f, calls = flaky([client_error("SlowDown", 503)] * 3)
+    with pytest.raises(ClientError):
+        policy.call(f)
+    assert len(calls) == 2
@@ -0,0 +1,69 @@
+import mmap
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from volcengine_ml_platform.datasets.sample_store import SampleStore
+from volcengine_ml_platform.datasets.sample_store import SampleStoreWriter
+
+
+def test_sample_store(tmp_path):
+    path = str(tmp_path / "store")
+    rng = np.random.default_rng(0)
+    samples = [
+        rng.integers(0, 255, size=(5, 7, 3), dtype=np.uint8),
+        rng.integers(0, 255, size=(4, 4), dtype=np.uint8),
+        rng.random((3, 2)).astype(np.float32),
+        b"raw jpeg bytes",
+        np.zeros((0, 3), dtype=np.uint8),
+        rng.integers(0, 255, size=(9, 3, 3), dtype=np.uint8)[::2],
+    ]
+    with SampleStoreWriter(path, shard_size=100) as writer:
+        for i, sample in enumerate(samples):
+            assert writer.add(sample, {"Label": i} if i != 1 else None) == i
+
+    store = SampleStore(path)
+    assert len(store) == len(samples)
+    assert len(set(store.shard_ids.tolist())) > 1
+    for i, sample in enumerate(samples):
+        if isinstance(sample, bytes):
+            assert store.view(i).tobytes() == sample
+            assert store.shape(i) is None
+            continue
+        array = store[i]
+        assert array.dtype == sample.dtype and array.shape == sample.shape
+        np.testing.assert_array_equal(array, sample)
+        assert not array.flags.writeable
+        assert array.ctypes.data % 64 == 0 or not array.size
+    assert store.annotation(0) == {"Label": 0}
+    assert store.annotation(1) is None
+
+    # views point into the shared mapping rather than a private copy
+    assert isinstance(store._maps[0], mmap.mmap)
+    assert np.shares_memory(store[0], np.frombuffer(store._maps[0], dtype=np.uint8))
+
+    clone = pickle.loads(pickle.dumps(store))
+    assert clone._maps == {}
+    np.testing.assert_array_equal(clone[5], samples[5])
+    with pytest.raises(IndexError):
+        store[len(samples)]
+    store.close()
+
+
+def test_failed_write_leaves_no_store(tmp_path):
+    path = str(tmp_path / "store")
+    with SampleStoreWriter(path) as writer:
+        writer.add(np.arange(4, dtype=np.uint8))
+    SampleStore(path).close()
+
+    # rewriting the same directory fails half-way
+    with pytest.raises(RuntimeError):
+        with SampleStoreWriter(path, shard_size=1) as writer:
+            writer.add(np.arange(8, dtype=np.uint8))
+            writer.add(b"raw")
+            raise RuntimeError("decode failed")
+    with pytest.raises(FileNotFoundError):
+        SampleStore(path)
+    assert os.listdir(path) == []
@@ -0,0 +1,133 @@
+import asyncio
+import os
+
+import pytest
+from moto.server import ThreadedMotoServer
+
+import volcengine_ml_platform
+from tests.unit.conftest import bucket
+from tests.unit.conftest import make_credentials
+from volcengine_ml_platform.io import tos_compression
+from volcengine_ml_platform.io.tos_async import AsyncTOSClient
+
+
+@pytest.fixture
+def endpoint(monkeypatch):
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    url = f"http://{host}:{port}"
+    monkeypatch.setattr(volcengine_ml_platform, "get_tos_endpoint_url", lambda: url)
+    monkeypatch.setattr(volcengine_ml_platform, "get_session_token", lambda: None)
+    yield url
+    server.stop()
+
+
+def make_client(max_concurrence=8):
+    return AsyncTOSClient(credentials=make_credentials(), max_concurrence=max_concurrence, addressing_style="path")
+
+
+def test_async_tos_client(endpoint, tmp_path):
+    keys = [f"samples/{i:03d}.bin" for i in range(50)]
+
+    async def run():
+        async with make_client() as client:
+            await client.s3_client.create_bucket(Bucket=bucket)
+            await asyncio.gather(*[client.put_object(bucket, k, k.encode()) for k in keys])
+
+            datas = await asyncio.gather(*[client.get_object(bucket, k) for k in keys])
+            assert datas == [k.encode() for k in keys]
+            assert await client.get_object(bucket, keys[0], start=8, end=10) == b"000"
+            assert await client.get_object(bucket, keys[0], start=11) == b".bin"
+
+            listed = [record.key async for record in client.iter_objects(bucket, prefix="samples/", page_size=7)]
+            assert listed == keys
+
+            paths = await client.download_files(bucket, keys[:5], str(tmp_path))
+            for k, path in zip(keys[:5], paths):
+                with open(path, "rb") as f:
+                    assert f.read() == k.encode()
+        assert client.s3_client is None
+
+    asyncio.run(run())
+    assert len(os.listdir(tmp_path / "samples")) == 5
+
+
+def test_download_files_rejects_unsafe_keys(endpoint, tmp_path):
+    target = tmp_path / "target"
+
+    async def run():
+        async with make_client() as client:
+            await client.s3_client.create_bucket(Bucket=bucket)
+            await client.put_object(bucket, "a/../../escape", b"x")
+            for key in ["a/../../escape", "../escape", "/etc/escape", "a/.."]:
+                with pytest.raises(ValueError, match="outside"):
+                    await client.download_files(bucket, ["ok", key], str(target))
+            await client.put_object(bucket, "a/../b", b"b")
+            assert await client.download_files(bucket, ["a/../b"], str(target)) == [str(target / "b")]
+
+    asyncio.run(run())
+    assert not (tmp_path / "escape").exists()
+    assert os.listdir(target) == ["b"]
+
+
+@pytest.mark.parametrize("codec", ["gzip", "zstd"])
+def test_compressed_objects(endpoint, tmp_path, codec):
+    payload = os.urandom(1000) * 300
+
+    async def run():
+        async with make_client() as client:
+            await client.s3_client.create_bucket(Bucket=bucket)
+            await client.s3_client.put_object(
+                Bucket=bucket, Key="packed", Body=tos_compression.compress_bytes(payload, codec),
+                Metadata=tos_compression.metadata(codec, len(payload)),
+            )
+            assert await client.get_object(bucket, "packed") == payload
+            # ranges address the uncompressed content, also beyond the compressed size
+            assert await client.get_object(bucket, "packed", start=10, end=19) == payload[10:20]
+            assert await client.get_object(bucket, "packed", start=len(payload) - 5) == payload[-5:]
+            path = await client.download_file(bucket, "packed", str(tmp_path / "packed"))
+            with open(path, "rb") as f:
+                assert f.read() == payload
+
+    asyncio.run(run())
+
+
+class _BrokenBody:
+    def __init__(self):
+        self.reads = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def read(self, size=-1):
+        self.reads += 1
+        if self.reads > 1:
+            raise ConnectionError("connection reset")
+        return b"partial"
+
+
+def test_failed_download_keeps_target(endpoint, tmp_path):
+    target = tmp_path / "target.bin"
+    target.write_bytes(b"old")
+
+    async def run():
+        async with make_client() as client:
+            async def get_object(**kwargs):
+                return {"Body": _BrokenBody()}
+
+            client.s3_client.get_object = get_object
+            with pytest.raises(ConnectionError):
+                await client.download_file(bucket, "k", str(target))
+
+    asyncio.run(run())
+    assert target.read_bytes() == b"old"
+    assert os.listdir(tmp_path) == ["target.bin"]
+
+
+def test_async_tos_client_requires_open(endpoint):
+    with pytest.raises(RuntimeError):
+        asyncio.run(make_client().get_object(bucket, "k"))
@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+
+from volcengine_ml_platform.io import tos_concurrency
+from volcengine_ml_platform.io.tos_concurrency import AdaptiveConcurrency
+from volcengine_ml_platform.io.tos_concurrency import is_throttle_error
+
+
+def slow_down():
+    return ClientError(
+        {"Error": {"Code": "SlowDown"}, "ResponseMetadata": {"HTTPStatusCode": 503}},
+        "GetObject",
+    )
+
+
+def test_is_throttle_error():
+    assert is_throttle_error(slow_down())
+    assert not is_throttle_error(ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject"))
+    assert not is_throttle_error(ValueError())
+
+
+def test_invalid_limits():
+    with pytest.raises(ValueError):
+        AdaptiveConcurrency(initial=4, min_limit=8, max_limit=16)
+
+
+def test_additive_increase_and_multiplicative_decrease():
+    concurrency = AdaptiveConcurrency(initial=4, max_limit=64, interval=0.01)
+
+    def work(duration):
+        concurrency.acquire()
+        time.sleep(duration)
+        concurrency.release(1000)
+
+    # throughput grows with the number of parallel workers
+    deadline = time.monotonic() + 0.5
+    while time.monotonic() < deadline:
+        threads = [threading.Thread(target=work, args=(0.005,)) for _ in range(concurrency.limit)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    grown = concurrency.limit
+    assert grown > 4
+    assert concurrency.stats()["throughput"] > 0
+
+    concurrency.acquire()
+    concurrency.release(error=slow_down())
+    assert concurrency.limit == grown // 2
+    # only one decrease per window
+    concurrency.acquire()
+    concurrency.release(error=slow_down())
+    assert concurrency.limit == grown // 2
+    assert concurrency.stats()["throttled"] == 2
+
+
+def test_acquire_blocks_at_limit():
+    concurrency = AdaptiveConcurrency.fixed(2)
+    assert concurrency.try_acquire()
+    assert concurrency.try_acquire()
+    assert not concurrency.try_acquire()
+    concurrency.cancel()
+    assert concurrency.try_acquire()
+    assert concurrency.stats()["in_flight"] == 2
+
+
+def test_report_retry_with_fake_clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(tos_concurrency.time, "monotonic", lambda: now[0])
+    concurrency = AdaptiveConcurrency(initial=16, max_limit=16, interval=1.0)
+
+    # nothing is bound to this thread yet
+    tos_concurrency.report_retry(slow_down())
+    assert concurrency.stats()["throttled"] == 0
+
+    concurrency.acquire()
+    with tos_concurrency.bind(concurrency):
+        tos_concurrency.report_retry(ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject"))
+        tos_concurrency.report_retry(slow_down())
+        assert concurrency.limit == 8
+        # one decrease per interval
+        now[0] += 0.5
+        tos_concurrency.report_retry(slow_down())
+        assert concurrency.limit == 8
+        now[0] += 1.0
+        tos_concurrency.report_retry(slow_down())
+        assert concurrency.limit == 4
+    tos_concurrency.report_retry(slow_down())
+    # retried errors keep the slot, the request itself succeeds
+    assert concurrency.in_flight == 1
+    concurrency.release(10)
+    stats = concurrency.stats()
+    assert stats["throttled"] == 3
+    assert stats["completed"] == 1
+    assert stats["in_flight"] == 0
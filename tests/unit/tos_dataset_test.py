@@ -0,0 +1,164 @@
+import io
+import json
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from tests.unit.conftest import bucket
+from tests.unit.conftest import make_credentials
+
+pytest.importorskip("torch")
+
+from volcengine_ml_platform.io import tos  # noqa: E402
+from volcengine_ml_platform.io import tos_decode  # noqa: E402
+from volcengine_ml_platform.io.tos_decode import ImageDecoder  # noqa: E402
+from volcengine_ml_platform.io.tos_dataset import IterableTOSDataset  # noqa: E402
+from volcengine_ml_platform.io.tos_dataset import TorchTOSDataset  # noqa: E402
+from volcengine_ml_platform.io.tos_manifest import ManifestStore  # noqa: E402
+
+
+def make_dataset(tos_cli, count, **kwargs):
+    manifest_info = {"buckets": [], "keys": [], "annotations": []}
+    for i in range(count):
+        buf = io.BytesIO()
+        Image.new("RGB", (8, 6), (i, 0, 0)).save(buf, format="PNG")
+        tos_cli.put_object(bucket, f"images/{i}.png", buf.getvalue())
+        manifest_info["buckets"].append(bucket)
+        manifest_info["keys"].append(f"images/{i}.png")
+        manifest_info["annotations"].append({"Result": [{"Data": [{"Label": str(i)}]}]})
+    return TorchTOSDataset(
+        manifest_info,
+        client_factory=lambda: tos.TOSClient(credentials=make_credentials()),
+        **kwargs,
+    )
+
+
+@pytest.mark.parametrize("prefetch", [0, 4])
+def test_getitems(tos_cli, prefetch):
+    dataset = make_dataset(tos_cli, 10, prefetch=prefetch)
+    indices = [7, 2, 9, 0, 5, 1]
+    samples = dataset.__getitems__(indices)
+    assert [label for _, label in samples] == indices
+    assert [image.getpixel((0, 0))[0] for image, _ in samples] == indices
+    assert [label for _, label in dataset[indices]] == indices
+    assert dataset[3][1] == 3
+
+
+def test_batch_decode_and_labels(tos_cli):
+    dataset = make_dataset(tos_cli, 8, prefetch=4, decode=ImageDecoder(output="numpy"))
+    assert dataset.labels.tolist() == list(range(8))
+    samples = dataset.__getitems__([6, 1, 4])
+    assert [label for _, label in samples] == [6, 1, 4]
+    assert [int(image[0, 0, 0]) for image, _ in samples] == [6, 1, 4]
+    assert dataset.__getitems__([]) == []
+
+    unlabeled = TorchTOSDataset(
+        {"buckets": dataset.buckets, "keys": dataset.keys, "annotations": [{}] * 8},
+        target_transform=len,
+        client_factory=dataset.client_factory,
+    )
+    assert unlabeled.labels is None and unlabeled[2][1] == 0
+
+
+def test_decode_without_copy(tos_cli, monkeypatch):
+    views, buffers = [], []
+    get_object_view = tos.TOSClient.get_object_view
+    as_buffer = tos_decode._as_buffer
+
+    def recording_view(self, *args, **kwargs):
+        views.append(get_object_view(self, *args, **kwargs))
+        return views[-1]
+
+    def recording_buffer(raw):
+        buffers.append(as_buffer(raw))
+        return buffers[-1]
+
+    monkeypatch.setattr(tos.TOSClient, "get_object_view", recording_view)
+    monkeypatch.setattr(tos_decode, "_as_buffer", recording_buffer)
+    dataset = make_dataset(tos_cli, 4, prefetch=2, decode=ImageDecoder(output="numpy"))
+    samples = dataset.__getitems__([3, 0]) + [dataset[2]]
+    assert [int(image[0, 0, 0]) for image, _ in samples] == [3, 0, 2]
+    # fetches and decodes both run in thread pools, so match buffers to views regardless of order
+    assert len(views) == len(buffers) == 3
+    assert all(isinstance(buffer, memoryview) for buffer in buffers)
+    arrays = [np.frombuffer(view.getbuffer(), np.uint8) for view in views]
+    for buffer in buffers:
+        assert sum(np.shares_memory(np.frombuffer(buffer, np.uint8), array) for array in arrays) == 1
+
+
+def test_plain_decode_gets_bytes(tos_cli):
+    received = []
+
+    def decode(data):
+        received.append(type(data))
+        return Image.open(io.BytesIO(data)).convert("RGB")
+
+    dataset = make_dataset(tos_cli, 3, prefetch=2, decode=decode)
+    samples = dataset.__getitems__([2, 0]) + [dataset[1]]
+    assert [image.getpixel((0, 0))[0] for image, _ in samples] == [2, 0, 1]
+    assert received == [bytes] * 3
+
+
+def test_manifest_store(tos_cli):
+    source = make_dataset(tos_cli, 6)
+    store = ManifestStore.from_manifest_info(
+        {k: getattr(source, k) for k in ("buckets", "keys", "annotations")},
+    )
+    dataset = TorchTOSDataset(store, prefetch=3, client_factory=source.client_factory)
+    assert len(dataset) == 6
+    samples = dataset.__getitems__([5, 0, 3])
+    assert [label for _, label in samples] == [5, 0, 3]
+    assert [image.getpixel((0, 0))[0] for image, _ in samples] == [5, 0, 3]
+
+    raw = TorchTOSDataset(store, target_transform=lambda a: a["Result"][0]["Data"][0]["Label"],
+                          client_factory=source.client_factory)
+    assert raw[4][1] == "4"
+
+    iterable = IterableTOSDataset(store, rank=1, world_size=2, client_factory=source.client_factory)
+    assert len(iterable) == 3
+    assert [label for _, label in iterable] == [1, 3, 5]
+
+
+def test_state_drops_client(tos_cli):
+    dataset = make_dataset(tos_cli, 1)
+    dataset[0]
+    assert hasattr(dataset, "tos_client")
+    state = dataset.__getstate__()
+    assert "tos_client" not in state and state["_pid"] is None
+
+
+def test_iterable_dataset_split_and_shuffle(tos_cli, tmp_path):
+    count = 23
+    labels = list(range(count))
+    manifest_info = make_dataset(tos_cli, count).__dict__
+    manifest_info = {k: manifest_info[k] for k in ("buckets", "keys", "annotations")}
+    manifest_path = str(tmp_path / "train.manifest")
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        for key, annotation in zip(manifest_info["keys"], manifest_info["annotations"]):
+            f.write(json.dumps({"Data": {"ImageURL": f"tos://{bucket}/{key}"}, "Annotation": annotation}) + "\n")
+
+    def factory():
+        return tos.TOSClient(credentials=make_credentials())
+
+    for source in ({"manifest_info": manifest_info}, {"manifest": manifest_path}):
+        parts = []
+        for rank in range(3):
+            dataset = IterableTOSDataset(
+                **source, rank=rank, world_size=3, read_ahead=4, client_factory=factory,
+            )
+            parts.append([label for _, label in dataset])
+        assert parts[1] == labels[1::3]
+        assert sorted(sum(parts, [])) == labels
+
+    def epoch_order(epoch):
+        dataset = IterableTOSDataset(
+            manifest_info, shuffle_buffer=8, seed=7, rank=0, world_size=1, client_factory=factory,
+        )
+        dataset.set_epoch(epoch)
+        return [label for _, label in dataset]
+
+    first = epoch_order(0)
+    assert sorted(first) == labels and first != labels
+    assert epoch_order(0) == first
+    assert epoch_order(1) != first
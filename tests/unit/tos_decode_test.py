@@ -0,0 +1,49 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from volcengine_ml_platform.io.tos_decode import ImageDecoder
+from volcengine_ml_platform.io.tos_transfer import MemoryViewReader
+
+
+def encode(size, color=(10, 20, 30), format="JPEG"):
+    buf = io.BytesIO()
+    Image.new("RGB", size, color).save(buf, format=format)
+    return buf.getvalue()
+
+
+def test_decode_formats():
+    decoder = ImageDecoder(backend="pil")
+    for raw in (encode((40, 30)), encode((40, 30), format="PNG")):
+        image = decoder(raw)
+        assert image.mode == "RGB" and image.size == (40, 30)
+    # views returned by get_object_view are decoded without a copy
+    assert decoder(MemoryViewReader(encode((40, 30), format="PNG"))).size == (40, 30)
+
+
+def test_draft_and_resize():
+    raw = encode((400, 300))
+    image = ImageDecoder(size=(64, 64), backend="pil")(raw)
+    # scaled by 1/4, the smallest 1/2^n that keeps both sides >= 64
+    assert image.size == (100, 75)
+
+    array = ImageDecoder(size=(32, 48), resize=True, output="numpy")(raw)
+    assert array.shape == (32, 48, 3) and array.dtype == np.uint8
+
+    gray = ImageDecoder(mode="L", output="numpy", backend="pil")(raw)
+    assert gray.shape == (300, 400)
+
+
+def test_decode_batch_keeps_order():
+    raws = [encode((16, 16), (i * 10, 0, 0), format="PNG") for i in range(12)]
+    images = ImageDecoder(output="numpy").decode_batch(raws)
+    assert [int(image[0, 0, 0]) for image in images] == [i * 10 for i in range(12)]
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        ImageDecoder(backend="opencv")
+    with pytest.raises(ValueError):
+        ImageDecoder(resize=True)
@@ -0,0 +1,52 @@
+import io
+import json
+import pickle
+
+import numpy as np
+
+from volcengine_ml_platform.io.tos_manifest import ManifestStore
+from volcengine_ml_platform.io.tos_manifest import NO_LABEL
+
+
+def make_annotation(label):
+    return {"Result": [{"Data": [{"Label": str(label)}]}], "备注": "标注"}
+
+
+def test_from_manifest_file(tmp_path):
+    manifest_path = str(tmp_path / "train.manifest")
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        for i in range(6):
+            annotation = make_annotation(i) if i != 4 else {"Result": []}
+            line = {"Data": {"ImageURL": f"tos://bucket-{i % 2}/images/图片-{i}.jpg"}, "Annotation": annotation}
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+    store = ManifestStore.from_manifest_file(manifest_path)
+    assert len(store) == 6
+    assert store.buckets == ["bucket-0", "bucket-1"]
+    assert store.bucket_ids.tolist() == [0, 1, 0, 1, 0, 1]
+    assert store.location(3) == ("bucket-1", "images/图片-3.jpg", None, None)
+    assert store.labels.tolist() == [0, 1, 2, 3, NO_LABEL, 5]
+    assert store.annotation(5) == make_annotation(5)
+
+    buf = io.BytesIO()
+    store.save(buf)
+    buf.seek(0)
+    loaded = ManifestStore.load(buf)
+    assert loaded.key(2) == store.key(2)
+    assert np.array_equal(loaded.labels, store.labels)
+    assert loaded.ranges is None
+    assert pickle.loads(pickle.dumps(store)).annotation(0) == make_annotation(0)
+
+
+def test_from_manifest_info():
+    manifest_info = {
+        "buckets": ["b", "b", "c"],
+        "keys": ["shard-0.tar", "shard-0.tar", "shard-1.tar"],
+        "annotations": [make_annotation(i) for i in range(3)],
+        "ranges": [(512, 1023), (1536, 1600), (512, 700)],
+    }
+    store = ManifestStore.from_manifest_info(manifest_info, label_fn=None)
+    assert store.labels is None
+    assert store.buckets == ["b", "c"]
+    assert store.location(1) == ("b", "shard-0.tar", 1536, 1600)
+    assert store.location(2) == ("c", "shard-1.tar", 512, 700)
@@ -0,0 +1,56 @@
+import pytest
+
+from volcengine_ml_platform.io import tos_metrics
+
+
+def test_in_memory_sink():
+    sink = tos_metrics.InMemorySink(buckets=(0.1, 1.0))
+    sink.counter("c", 2, {"op": "a"})
+    sink.counter("c", 3, {"op": "b"})
+    sink.gauge("g", 7, {})
+    for v in (0.05, 0.5, 5.0):
+        sink.histogram("h", v, {"op": "a"})
+
+    assert sink.value("c", op="a") == 2
+    assert sink.value("c") == 5
+    assert sink.value("g") == 7
+    stats = sink.histogram_stats("h", op="a")
+    assert stats["count"] == 3
+    assert stats["sum"] == pytest.approx(5.55)
+    assert stats["buckets"] == {0.1: 1, 1.0: 2, float("inf"): 3}
+
+
+def test_prometheus_render(tmp_path):
+    sink = tos_metrics.PrometheusSink(buckets=(0.1,))
+    sink.counter(tos_metrics.BYTES, 10, {"direction": "read"})
+    sink.histogram(tos_metrics.TTFB, 0.05, {"operation": "GetObject"})
+    text = sink.render()
+    assert "# TYPE tos_bytes_total counter" in text
+    assert 'tos_bytes_total{direction="read"} 10' in text
+    assert 'tos_request_ttfb_seconds_bucket{operation="GetObject",le="0.1"} 1' in text
+    assert 'tos_request_ttfb_seconds_bucket{operation="GetObject",le="+Inf"} 1' in text
+    assert 'tos_request_ttfb_seconds_count{operation="GetObject"} 1' in text
+
+    path = str(tmp_path / "tos.prom")
+    sink.write(path)
+    with open(path, encoding="utf-8") as f:
+        assert f.read() == text
+
+
+def test_open_telemetry_sink():
+    sdk_metrics = pytest.importorskip("opentelemetry.sdk.metrics")
+    export = pytest.importorskip("opentelemetry.sdk.metrics.export")
+    reader = export.InMemoryMetricReader()
+    provider = sdk_metrics.MeterProvider(metric_readers=[reader])
+    sink = tos_metrics.OpenTelemetrySink(provider.get_meter("test"))
+    sink.counter(tos_metrics.REQUESTS, 1, {"operation": "GetObject", "status": "200"})
+    sink.histogram(tos_metrics.DURATION, 0.2, {"operation": "GetObject"})
+    sink.gauge(tos_metrics.IN_FLIGHT, 3, {})
+
+    names = {
+        metric.name
+        for resource in reader.get_metrics_data().resource_metrics
+        for scope in resource.scope_metrics
+        for metric in scope.metrics
+    }
+    assert {tos_metrics.REQUESTS, tos_metrics.DURATION, tos_metrics.IN_FLIGHT} <= names
@@ -0,0 +1,856 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import pytest
+from botocore.awsrequest import AWSResponse
+from botocore.exceptions import ClientError
+from botocore.exceptions import ConnectionClosedError
+
+from tests.unit.conftest import bucket
+from tests.unit.conftest import make_credentials
+from volcengine_ml_platform.io import tos
+from volcengine_ml_platform.io import tos_compression
+from volcengine_ml_platform.io import tos_concurrency
+from volcengine_ml_platform.io import tos_metrics
+from volcengine_ml_platform.io import tos_shards
+from volcengine_ml_platform.io import tos_throttle
+from volcengine_ml_platform.io import tos_transfer
+from volcengine_ml_platform.util import retry
+
+
+def make_payload(size):
+    return bytes(i % 251 for i in range(size))
+
+
+def test_download_file_ranged(tos_cli, tmp_path):
+    payload = make_payload(1024 * 1024 + 7)
+    tos_cli.put_object(bucket, "ckpt/model.bin", payload)
+
+    target = str(tmp_path / "model.bin")
+    path = tos_cli.download_file(
+        bucket, "ckpt/model.bin", target_file_path=target,
+        chunk_size=64 * 1024, max_concurrence=8,
+    )
+    assert path == target
+    with open(target, "rb") as f:
+        assert hashlib.md5(f.read()).digest() == hashlib.md5(payload).digest()
+    assert not os.path.exists(target + tos_transfer.PART_FILE_SUFFIX)
+    assert not os.path.exists(target + tos_transfer.STATE_FILE_SUFFIX)
+
+
+def test_download_file_ranged_empty_object(tos_cli, tmp_path):
+    tos_cli.put_object(bucket, "empty", b"")
+    target = str(tmp_path / "empty")
+    tos_cli.download_file_ranged(bucket, "empty", target, chunk_size=1024)
+    assert os.path.getsize(target) == 0
+
+
+def test_download_file_ranged_resume(tos_cli, tmp_path, monkeypatch):
+    chunk_size = 1024
+    payload = make_payload(chunk_size * 10)
+    tos_cli.put_object(bucket, "resume.bin", payload)
+    etag = tos_cli.s3_client.head_object(Bucket=bucket, Key="resume.bin")["ETag"]
+
+    # simulate a crashed attempt: chunk 0..4 landed, chunk 5.. did not
+    target = str(tmp_path / "resume.bin")
+    with open(target + tos_transfer.PART_FILE_SUFFIX, "wb") as f:
+        f.write(payload[: chunk_size * 5])
+        f.write(b"\0" * chunk_size * 5)
+    with open(target + tos_transfer.STATE_FILE_SUFFIX, "w", encoding="utf-8") as f:
+        json.dump({
+            "etag": etag,
+            "size": len(payload),
+            "chunk_size": chunk_size,
+            "done": list(range(5)),
+        }, f)
+
+    fetched = []
+    origin = tos_transfer.RangedDownloader._fetch_chunk
+
+    def record(self, fd, lock, bucket, key, etag, size, idx):
+        fetched.append(idx)
+        return origin(self, fd, lock, bucket, key, etag, size, idx)
+
+    monkeypatch.setattr(tos_transfer.RangedDownloader, "_fetch_chunk", record)
+    tos_cli.download_file_ranged(bucket, "resume.bin", target, chunk_size=chunk_size)
+
+    assert sorted(fetched) == list(range(5, 10))
+    with open(target, "rb") as f:
+        assert f.read() == payload
+
+
+class _RangeRewriter:
+    """delegates to a real s3 client but reports another object size in ContentRange"""
+
+    def __init__(self, s3_client):
+        self._s3_client = s3_client
+
+    def __getattr__(self, name):
+        return getattr(self._s3_client, name)
+
+    def get_object(self, **kwargs):
+        response = self._s3_client.get_object(**kwargs)
+        span = response["ContentRange"].split(" ")[-1].partition("/")[0]
+        response["ContentRange"] = f"bytes {span}/1"
+        return response
+
+
+def test_download_file_ranged_verifies(tos_cli, tmp_path, monkeypatch):
+    chunk_size = 1024
+    tos_cli.put_object(bucket, "verify.bin", make_payload(chunk_size * 4))
+    target = str(tmp_path / "verify.bin")
+
+    downloader = tos_transfer.RangedDownloader(_RangeRewriter(tos_cli.s3_client), chunk_size=chunk_size)
+    with pytest.raises(IOError, match="content range"):
+        downloader.download(bucket, "verify.bin", target)
+
+    # the object is replaced after the first chunk, the IfMatch of the next one fails
+    origin = tos_transfer.RangedDownloader._fetch_chunk
+    fetched = []
+
+    def replace_after_first(self, fd, lock, bucket_name, key, etag, size, idx):
+        n = origin(self, fd, lock, bucket_name, key, etag, size, idx)
+        fetched.append(idx)
+        if len(fetched) == 1:
+            tos_cli.put_object(bucket, key, make_payload(chunk_size * 4)[::-1])
+        return n
+
+    monkeypatch.setattr(tos_transfer.RangedDownloader, "_fetch_chunk", replace_after_first)
+    with pytest.raises(ClientError, match="PreconditionFailed"):
+        tos_cli.download_file_ranged(bucket, "verify.bin", target, chunk_size=chunk_size, max_concurrence=1)
+    assert not os.path.exists(target)
+    # the resumable download keeps its progress
+    assert os.path.exists(target + tos_transfer.STATE_FILE_SUFFIX)
+
+
+def test_download_dir(tos_cli, tmp_path):
+    keys = [f"models/m1/variables/shard-{i:05d}" for i in range(25)]
+    keys += ["models/m1/saved_model.pb", "models/m1/assets/", "models/m2/other"]
+    for k in keys:
+        tos_cli.put_object(bucket, k, k.encode())
+
+    tos_cli.download_dir(bucket, "models/m1/", "models/m1/", str(tmp_path), parallelism=4, queue_size=2)
+
+    assert sorted(os.listdir(tmp_path / "variables")) == sorted(os.path.basename(k) for k in keys[:25])
+    assert (tmp_path / "saved_model.pb").read_bytes() == b"models/m1/saved_model.pb"
+    assert (tmp_path / "assets").is_dir()
+    assert not (tmp_path / "other").exists()
+
+
+def test_download_rejects_unsafe_keys(tos_cli, tmp_path):
+    target = tmp_path / "target"
+    assert tos.key_local_path(str(target), "a/../b") == str(target / "b")
+    assert tos.key_local_path(str(target), ".", allow_root=True) == str(target)
+    for key in ["../escape", "a/../../escape", "/etc/escape", "a/.."]:
+        with pytest.raises(ValueError, match="outside"):
+            tos.key_local_path(str(target), key)
+
+    tos_cli.put_object(bucket, "models/../../escape", b"x")
+    with pytest.raises(ValueError, match="outside"):
+        tos_cli.download_file(bucket, "models/../../escape", target_dir_path=str(target))
+    results = list(tos_cli.iter_download_files(["models/../../escape"], bucket=bucket, target_dir_path=str(target)))
+    assert isinstance(results[0].error, ValueError)
+    with pytest.raises(ValueError, match="outside"):
+        tos_cli.download_dir(bucket, "models/", "models/", str(target))
+    assert not (tmp_path / "escape").exists()
+
+
+def test_upload_dir(tos_cli, tmp_path):
+    local_dir = tmp_path / "saved_model"
+    (local_dir / "variables").mkdir(parents=True)
+    for i in range(20):
+        (local_dir / "variables" / f"shard-{i}").write_bytes(make_payload(100 + i))
+    large = make_payload(6 * 1024 * 1024)
+    (local_dir / "saved_model.pb").write_bytes(large)
+
+    manifest = tos_cli.upload_dir(str(local_dir), bucket, "repo/", parallelism=4, part_size=5 * 1024 * 1024)
+
+    assert [item["Key"] for item in manifest] == sorted(
+        ["repo/saved_model.pb"] + [f"repo/variables/shard-{i}" for i in range(20)],
+    )
+    for item in manifest:
+        head = tos_cli.s3_client.head_object(Bucket=bucket, Key=item["Key"])
+        assert head["ETag"] == item["ETag"]
+        assert head["ContentLength"] == item["Size"]
+    # the large file went through multipart upload
+    assert manifest[0]["ETag"].endswith('-2"')
+    assert tos_cli.get_object(bucket, "repo/saved_model.pb").read() == large
+
+
+def test_upload_returns_tos_path(tos_cli, tmp_path):
+    local_dir = tmp_path / "model"
+    local_dir.mkdir()
+    (local_dir / "a.txt").write_bytes(b"a")
+    assert tos_cli.upload(str(local_dir), bucket, "p/") == f"tos://{bucket}/p/model/"
+    assert tos_cli.get_object(bucket, "p/model/a.txt").read() == b"a"
+
+
+def test_upload_file_low_level(tos_cli, tmp_path):
+    payload = make_payload(11 * 1024 * 1024 + 3)
+    file_path = tmp_path / "big.bin"
+    file_path.write_bytes(payload)
+
+    rsp = tos_cli.upload_file_low_level(
+        str(file_path), bucket, "big.bin",
+        part_size=tos_transfer.MIN_PART_SIZE, max_concurrence=3,
+        checkpoint_path=str(tmp_path / "ckpt.json"),
+    )
+    assert rsp["ETag"].endswith('-3"')
+    assert tos_cli.get_object(bucket, "big.bin").read() == payload
+    assert not (tmp_path / "ckpt.json").exists()
+
+
+def test_upload_file_low_level_resume_and_abort(tos_cli, tmp_path, monkeypatch):
+    payload = make_payload(16 * 1024 * 1024)
+    file_path = tmp_path / "big.bin"
+    file_path.write_bytes(payload)
+    checkpoint = tmp_path / "ckpt.json"
+
+    calls = []
+    origin = tos_cli.s3_client.upload_part
+
+    def flaky_upload_part(**kwargs):
+        calls.append(kwargs["PartNumber"])
+        if kwargs["PartNumber"] == 3:
+            raise IOError("connection reset")
+        return origin(**kwargs)
+
+    monkeypatch.setattr(tos_cli.s3_client, "upload_part", flaky_upload_part)
+    with pytest.raises(IOError):
+        tos_cli.upload_file_low_level(
+            str(file_path), bucket, "big.bin",
+            part_size=tos_transfer.MIN_PART_SIZE, max_concurrence=1,
+            checkpoint_path=str(checkpoint), abort_on_failure=False,
+        )
+    assert json.loads(checkpoint.read_text())["parts"].keys() == {"1", "2"}
+
+    calls.clear()
+
+    def record_upload_part(**kwargs):
+        calls.append(kwargs["PartNumber"])
+        return origin(**kwargs)
+
+    monkeypatch.setattr(tos_cli.s3_client, "upload_part", record_upload_part)
+    tos_cli.upload_file_low_level(
+        str(file_path), bucket, "big.bin",
+        part_size=tos_transfer.MIN_PART_SIZE, max_concurrence=1,
+        checkpoint_path=str(checkpoint),
+    )
+    assert sorted(calls) == [3, 4]
+    assert tos_cli.get_object(bucket, "big.bin").read() == payload
+
+    # a failed upload without resume is aborted on the server side
+    monkeypatch.setattr(tos_cli.s3_client, "upload_part", flaky_upload_part)
+    with pytest.raises(IOError):
+        tos_cli.upload_file_low_level(
+            str(file_path), bucket, "other.bin",
+            part_size=tos_transfer.MIN_PART_SIZE, max_concurrence=1,
+            checkpoint_path=str(checkpoint),
+        )
+    assert not checkpoint.exists()
+    assert not tos_cli.s3_client.list_multipart_uploads(Bucket=bucket).get("Uploads")
+
+
+def test_delete_objects(tos_cli, monkeypatch):
+    for i in range(2001):
+        tos_cli.put_object(bucket, f"scratch/{i:05d}", b"")
+    tos_cli.put_object(bucket, "keep/a", b"a")
+
+    requests = []
+    origin = tos_cli.s3_client.delete_objects
+
+    def record_delete_objects(**kwargs):
+        requests.append(len(kwargs["Delete"]["Objects"]))
+        return origin(**kwargs)
+
+    monkeypatch.setattr(tos_cli.s3_client, "delete_objects", record_delete_objects)
+    assert tos_cli.delete_objects(bucket, prefix="scratch/", dry_run=True) == 2001
+    assert requests == []
+    assert tos_cli.delete_objects(bucket, prefix="scratch/", parallelism=2) == 2001
+    assert sorted(requests) == [1, 1000, 1000]
+    assert tos_cli.delete_objects(bucket, prefix="scratch/", dry_run=True) == 0
+
+    tos_cli.clear_bucket_objects(bucket)
+    assert "Contents" not in tos_cli.list_objects(bucket, max_keys=10)
+
+
+def test_iter_objects(tos_cli):
+    keys = [f"data/{d}/{i}" for d in ("a", "b", "c") for i in range(5)] + ["data/top"]
+    for k in keys:
+        tos_cli.put_object(bucket, k, b"xx")
+
+    records = list(tos_cli.iter_objects(bucket, prefix="data/", page_size=4))
+    assert [r.key for r in records] == sorted(keys)
+    assert all(r.size == 2 and not r.is_prefix for r in records)
+
+    grouped = list(tos_cli.iter_objects(bucket, prefix="data/", delimiter="/", page_size=2))
+    assert [(r.key, r.is_prefix) for r in grouped] == [
+        ("data/a/", True), ("data/b/", True), ("data/c/", True), ("data/top", False),
+    ]
+
+    fanned = list(tos_cli.iter_objects(bucket, prefix="data/", page_size=2, fan_out=3))
+    assert sorted(r.key for r in fanned) == sorted(keys)
+
+    # abandoning the iterator early must not hang
+    it = tos_cli.iter_objects(bucket, prefix="data/", page_size=1, fan_out=2)
+    assert next(it).key == "data/top"
+    next(it)
+    it.close()
+
+
+def test_client_cache(tos_cli, monkeypatch):
+    other = tos.TOSClient(credentials=make_credentials())
+    assert other.s3_client is tos_cli.s3_client
+    assert tos.TOSClient(credentials=make_credentials("ak2")).s3_client is not tos_cli.s3_client
+    assert tos.TOSClient(credentials=make_credentials(), max_pool_connections=4).s3_client is not tos_cli.s3_client
+
+    # a forked child must not reuse the parent's connection pool
+    monkeypatch.setattr(tos, "_client_cache_pid", -1)
+    assert tos.TOSClient(credentials=make_credentials()).s3_client is not tos_cli.s3_client
+
+
+def test_iter_download_files(tos_cli, tmp_path):
+    for i in range(20):
+        tos_cli.put_object(bucket, f"imgs/{i}.jpg", str(i).encode())
+
+    def keys():
+        for i in range(21):
+            yield f"imgs/{i}.jpg"  # imgs/20.jpg does not exist
+
+    results = list(tos_cli.iter_download_files(
+        keys(), bucket=bucket, target_dir_path=str(tmp_path), parallelism=4,
+    ))
+    assert len(results) == 21
+    failed = [r for r in results if r.error is not None]
+    assert [r.source for r in failed] == ["imgs/20.jpg"]
+    for r in results:
+        if r.error is None:
+            with open(r.path, "rb") as f:
+                assert f.read() == r.source.split("/")[1].split(".")[0].encode()
+
+    urls = [f"tos://{bucket}/imgs/{i}.jpg" for i in range(5)]
+    targets = [str(tmp_path / "by_url" / f"{i}") for i in range(5)]
+    ordered = list(tos_cli.iter_download_files(zip(urls, targets), parallelism=2, ordered=True))
+    assert [r.path for r in ordered] == targets
+
+
+def test_overlapping_iterators_share_pool(tos_cli, tmp_path):
+    for i in range(12):
+        tos_cli.put_object(bucket, f"imgs/{i}.jpg", str(i).encode())
+    keys = [f"imgs/{i}.jpg" for i in range(12)]
+    small = tos_cli.iter_download_files(
+        keys, bucket=bucket, target_dir_path=str(tmp_path / "small"), parallelism=2, ordered=True,
+    )
+    results = [next(small)]
+    # wider iterators started meanwhile must not disturb the one already running
+    large = tos_cli.iter_download_files(
+        keys, bucket=bucket, target_dir_path=str(tmp_path / "large"), parallelism=128,
+    )
+    assert next(large).error is None
+    views = tos.map_ahead(lambda key: tos_cli.get_object_view(bucket, key).read(), keys, 300)
+    assert next(views) == b"0"
+    results.extend(small)
+    assert [r.source for r in results] == keys and all(r.error is None for r in results)
+    assert all(r.error is None for r in large)
+    assert list(views) == [str(i).encode() for i in range(1, 12)]
+
+
+def test_download_files(tos_cli, tmp_path):
+    keys = [f"imgs/{i}.jpg" for i in range(6)]
+    for k in keys:
+        tos_cli.put_object(bucket, k, k.encode())
+    paths = tos_cli.download_files(bucket=bucket, keys=keys, target_dir_path=str(tmp_path), parallelism=3)
+    assert paths == [os.path.join(str(tmp_path), k) for k in keys]
+
+    with pytest.raises(Exception):
+        tos_cli.download_files(bucket=bucket, keys=keys + ["missing"], target_dir_path=str(tmp_path))
+
+
+def test_object_cache_read_through(tos_cli, tmp_path, monkeypatch):
+    from volcengine_ml_platform.io import tos_cache
+
+    cache = tos_cache.ObjectCache(str(tmp_path / "cache"), max_size=1024 * 1024)
+    monkeypatch.setattr(tos_cli, "cache", cache)
+    tos_cli.put_object(bucket, "manifest", b"v1")
+
+    gets = []
+    origin = tos_cli.s3_client.get_object
+
+    def record_get_object(**kwargs):
+        gets.append(kwargs["Key"])
+        return origin(**kwargs)
+
+    monkeypatch.setattr(tos_cli.s3_client, "get_object", record_get_object)
+    for i in range(3):
+        path = tos_cli.download_file(bucket, "manifest", target_file_path=str(tmp_path / f"m{i}"))
+        assert open(path, "rb").read() == b"v1"
+    with tos_cli.get_object(bucket, "manifest") as body:
+        assert body.read() == b"v1"
+    assert gets == ["manifest"]
+
+    # a new object version is a new cache entry
+    tos_cli.put_object(bucket, "manifest", b"v2")
+    path = tos_cli.download_file(bucket, "manifest", target_file_path=str(tmp_path / "m3"))
+    assert open(path, "rb").read() == b"v2"
+    assert gets == ["manifest", "manifest"]
+
+
+def test_object_cache_lru_eviction(tmp_path):
+    from volcengine_ml_platform.io import tos_cache
+
+    cache = tos_cache.ObjectCache(str(tmp_path), max_size=3000)
+
+    def filler(size):
+        def fill(tmp_path):
+            with open(tmp_path, "wb") as f:
+                f.write(b"x" * size)
+        return fill
+
+    for i in range(3):
+        cache.open("b", f"k{i}", "e", filler(1000)).close()
+        os.utime(cache.entry_path("b", f"k{i}", "e"), (i, i))
+    # touch k0 so that k1 becomes the least recently used entry
+    cache.open("b", "k0", "e", filler(1000)).close()
+    cache.open("b", "k3", "e", filler(1000)).close()
+
+    assert cache.size() <= 3000 * tos_cache.LOW_WATERMARK
+    assert os.path.exists(cache.entry_path("b", "k0", "e"))
+    assert not os.path.exists(cache.entry_path("b", "k1", "e"))
+    assert os.path.exists(cache.entry_path("b", "k3", "e"))
+
+
+def test_object_cache_concurrent_fill_counted_once(tmp_path):
+    from volcengine_ml_platform.io import tos_cache
+
+    cache = tos_cache.ObjectCache(str(tmp_path), max_size=2500)
+
+    def fill(tmp):
+        with open(tmp, "wb") as f:
+            f.write(b"x" * 1000)
+
+    cache.open("b", "k0", "e", fill).close()
+
+    def racing_fill(tmp):
+        # another process fills the same entry while this one is downloading
+        path = cache.entry_path("b", "k1", "e")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"y" * 1000)
+        with open(tmp, "wb") as f:
+            f.write(b"z" * 1000)
+
+    with cache.open("b", "k1", "e", racing_fill) as f:
+        assert f.read() == b"y" * 1000
+    # counting k1 twice would have gone over max_size and evicted k0
+    assert os.path.exists(cache.entry_path("b", "k0", "e"))
+    assert os.listdir(os.path.join(str(tmp_path), "tmp")) == []
+
+
+def test_object_cache_get_object_with_etag_skips_head(tos_cli, tmp_path, monkeypatch):
+    from volcengine_ml_platform.io import tos_cache
+
+    monkeypatch.setattr(tos_cli, "cache", tos_cache.ObjectCache(str(tmp_path)))
+    tos_cli.put_object(bucket, "manifest", b"v1")
+    etag = tos_cli.s3_client.head_object(Bucket=bucket, Key="manifest")["ETag"]
+
+    heads = []
+    origin = tos_cli.s3_client.head_object
+
+    def record_head_object(**kwargs):
+        heads.append(kwargs["Key"])
+        return origin(**kwargs)
+
+    monkeypatch.setattr(tos_cli.s3_client, "head_object", record_head_object)
+    with tos_cli.get_object(bucket, "manifest") as body:
+        assert body.read() == b"v1"
+    assert heads == ["manifest"]
+    with tos_cli.get_object(bucket, "manifest", etag=etag) as body:
+        assert body.read() == b"v1"
+    assert heads == ["manifest"]
+
+
+def test_sync(tos_cli, tmp_path, monkeypatch):
+    from volcengine_ml_platform.util import cache_dir
+
+    monkeypatch.setattr(cache_dir, "HOME_DIR", str(tmp_path / "home"))
+    local_dir = tmp_path / "model"
+    (local_dir / "variables").mkdir(parents=True)
+    for i in range(10):
+        (local_dir / "variables" / f"shard-{i}").write_bytes(make_payload(1000 + i))
+    (local_dir / "saved_model.pb").write_bytes(make_payload(6 * 1024 * 1024))
+    url = f"tos://{bucket}/sync/model"
+
+    result = tos_cli.sync(str(local_dir), url, part_size=5 * 1024 * 1024)
+    assert len(result["transferred"]) == 11
+
+    # the multipart ETag of saved_model.pb must be recognised as unchanged
+    (local_dir / "variables" / "shard-3").write_bytes(b"changed")
+    (local_dir / "variables" / "shard-9").unlink()
+    result = tos_cli.sync(str(local_dir), url, delete=True, part_size=5 * 1024 * 1024)
+    assert result == {"transferred": ["variables/shard-3"], "deleted": ["variables/shard-9"], "unchanged": 9}
+    assert tos_cli.get_object(bucket, "sync/model/variables/shard-3").read() == b"changed"
+
+    download_dir = tmp_path / "download"
+    result = tos_cli.sync(str(download_dir), url, direction="download")
+    assert len(result["transferred"]) == 10
+    (download_dir / "stale").write_bytes(b"x")
+    (download_dir / "variables" / "shard-0").write_bytes(b"local edit")
+    result = tos_cli.sync(str(download_dir), url, direction="download", delete=True)
+    assert result == {"transferred": ["variables/shard-0"], "deleted": ["stale"], "unchanged": 9}
+    assert (download_dir / "variables" / "shard-0").read_bytes() == make_payload(1000)
+
+
+def test_read_into(tos_cli, tmp_path, monkeypatch):
+    import numpy as np
+    from volcengine_ml_platform.io import tos_cache
+
+    payload = make_payload(4096)
+    tos_cli.put_object(bucket, "sample", payload)
+
+    buffer = np.zeros(8192, dtype=np.uint8)
+    assert tos_cli.read_into(bucket, "sample", buffer, offset=100) == 4096
+    assert buffer[100:4196].tobytes() == payload
+    assert tos_cli.read_into(bucket, "sample", buffer, start=10, end=19) == 10
+    assert buffer[:10].tobytes() == payload[10:20]
+    with pytest.raises(ValueError):
+        tos_cli.read_into(bucket, "sample", bytearray(100))
+
+    reader = tos_cli.get_object_view(bucket, "sample", start=4000)
+    assert reader.getbuffer().tobytes() == payload[4000:]
+    assert reader.read(10) == payload[4000:4010]
+
+    monkeypatch.setattr(tos_cli, "cache", tos_cache.ObjectCache(str(tmp_path)))
+    view = memoryview(bytearray(16))
+    assert tos_cli.read_into(bucket, "sample", view, start=4090) == 6
+    assert view[:6].tobytes() == payload[4090:]
+    assert tos_cli.get_object_view(bucket, "sample").getbuffer().tobytes() == payload
+
+
+def test_throttle(tos_cli, tmp_path):
+    payload = make_payload(300 * 1000)
+    tos_cli.put_object(bucket, "throttled", payload)
+
+    throttle = tos_throttle.TransferThrottle(read_bytes_per_second=100 * 1000)
+    cli = tos.TOSClient(credentials=make_credentials(), throttle=throttle)
+    assert cli.s3_client is not tos_cli.s3_client
+
+    start = time.monotonic()
+    target = str(tmp_path / "throttled")
+    cli.download_file(bucket, "throttled", target_file_path=target)
+    # 100KB burst, the remaining 200KB at 100KB/s
+    assert time.monotonic() - start >= 1.5
+    with open(target, "rb") as f:
+        assert f.read() == payload
+
+    # the global throttle applies to clients created without one
+    tos_throttle.set_default_throttle(tos_throttle.TransferThrottle(requests_per_second=5))
+    try:
+        start = time.monotonic()
+        for _ in range(10):
+            tos_cli.s3_client.head_object(Bucket=bucket, Key="throttled")
+        assert time.monotonic() - start >= 0.9
+    finally:
+        tos_throttle.set_default_throttle(None)
+
+
+class _RawBody:
+    def __init__(self, body):
+        self._body = body
+
+    def stream(self, **kwargs):
+        yield self._body
+
+
+def test_adaptive_concurrency_backs_off(tos_cli, tmp_path):
+    # the first GETs are answered with 503 SlowDown and retried inside botocore,
+    # so every download succeeds and only report_retry tells the controller
+    tos_cli.put_object(bucket, "slow", b"data")
+    policy = retry.RetryPolicy(max_attempts=5, base_delay=0.001)
+    cli = tos.TOSClient(credentials=make_credentials(), retry_policy=policy)
+    lock = threading.Lock()
+    slow_downs = []
+
+    def slow_down(request, **kwargs):
+        with lock:
+            if len(slow_downs) >= 3:
+                return None
+            slow_downs.append(request.url)
+        body = b"<Error><Code>SlowDown</Code><Message>Please reduce your request rate.</Message></Error>"
+        return AWSResponse(request.url, 503, {}, _RawBody(body))
+
+    cli.s3_client.meta.events.register("before-send.s3.GetObject", slow_down)
+    # a long interval: no increase and a single decrease during the test
+    concurrency = tos_concurrency.AdaptiveConcurrency(initial=16, max_limit=16, interval=3600)
+    items = (("slow", str(tmp_path / f"slow{i}")) for i in range(50))
+    results = list(cli.iter_download_files(items, bucket=bucket, concurrency=concurrency))
+    cli.s3_client.meta.events.unregister("before-send.s3.GetObject", slow_down)
+
+    assert len(results) == 50
+    assert all(result.error is None for result in results)
+    assert len(slow_downs) == 3
+    stats = concurrency.stats()
+    assert stats["throttled"] == 3
+    assert stats["in_flight"] == 0
+    assert stats["concurrency"] == 8
+
+
+def test_retry_policy_wraps_requests(tos_cli):
+    tos_cli.put_object(bucket, "flaky", b"data")
+    policy = retry.RetryPolicy(max_attempts=4, base_delay=0.001)
+    cli = tos.TOSClient(credentials=make_credentials(), retry_policy=policy)
+    failures = []
+
+    def drop_connection(request, **kwargs):
+        if len(failures) < 2:
+            failures.append(request.url)
+            raise ConnectionClosedError(endpoint_url=request.url)
+
+    cli.s3_client.meta.events.register("before-send.s3.HeadObject", drop_connection)
+    assert cli.s3_client.head_object(Bucket=bucket, Key="flaky")["ContentLength"] == 4
+    assert len(failures) == 2
+
+    # fatal errors are not retried
+    with pytest.raises(ClientError):
+        cli.s3_client.head_object(Bucket=bucket, Key="missing")
+
+
+def test_resumable_stream(tos_cli):
+    payload = make_payload(10000)
+    tos_cli.put_object(bucket, "resume", payload)
+    real_get_object = tos_cli.s3_client.get_object
+    requests = []
+
+    class BrokenBody:
+        def __init__(self, body, limit):
+            self.body = body
+            self.left = limit
+
+        def read(self, amt=None):
+            if self.left <= 0:
+                raise ConnectionClosedError(endpoint_url="http://tos")
+            data = self.body.read(min(amt or self.left, self.left))
+            self.left -= len(data)
+            return data
+
+        def close(self):
+            self.body.close()
+
+    class FlakyClient:
+        def get_object(self, **kwargs):
+            requests.append(kwargs)
+            rsp = real_get_object(**kwargs)
+            if len(requests) == 1:
+                rsp["Body"] = BrokenBody(rsp["Body"], 3000)
+            return rsp
+
+    policy = retry.RetryPolicy(base_delay=0.001)
+    stream = tos_transfer.ResumableStream(FlakyClient(), bucket, "resume", start=100, retry_policy=policy)
+    assert stream.length == 9900
+    assert stream.read() == payload[100:]
+    assert requests[1]["Range"] == "bytes=3100-9999"
+    assert requests[1]["IfMatch"] == stream.etag
+
+
+def test_transfer_metrics(tos_cli, tmp_path):
+    sink = tos_metrics.add_sink(tos_metrics.InMemorySink())
+    try:
+        payload = make_payload(5000)
+        tos_cli.put_object(bucket, "metrics", payload)
+        assert tos_cli.get_object(bucket, "metrics").read() == payload
+        tos_cli.download_file(bucket, "metrics", target_file_path=str(tmp_path / "metrics"))
+
+        failures = []
+
+        def drop_connection(request, **kwargs):
+            if not failures:
+                failures.append(1)
+                raise ConnectionClosedError(endpoint_url=request.url)
+
+        tos_cli.s3_client.meta.events.register("before-send.s3.HeadObject", drop_connection)
+        tos_cli.s3_client.head_object(Bucket=bucket, Key="metrics")
+        tos_cli.s3_client.meta.events.unregister("before-send.s3.HeadObject", drop_connection)
+    finally:
+        tos_metrics.remove_sink(sink)
+
+    assert sink.value(tos_metrics.BYTES, direction="write") == 5000
+    assert sink.value(tos_metrics.BYTES, direction="read") == 10000
+    assert sink.value(tos_metrics.REQUESTS, operation="PutObject", status="200") == 1
+    assert sink.value(tos_metrics.REQUESTS, operation="HeadObject", status="error") == 1
+    assert sink.value(tos_metrics.RETRIES, operation="HeadObject") == 1
+    assert sink.histogram_stats(tos_metrics.TTFB, operation="GetObject")["count"] >= 2
+    assert sink.histogram_stats(tos_metrics.DURATION, operation="GetObject")["count"] >= 2
+    assert sink.value(tos_metrics.IN_FLIGHT) == 0
+
+
+@pytest.mark.parametrize("codec", ["gzip", "zstd"])
+def test_compression(tos_cli, tmp_path, codec):
+    payload = b"volcengine ml platform " * 4000
+    tos_cli.put_object(bucket, "small", payload, compression=codec)
+    raw = tos_cli.s3_client.get_object(Bucket=bucket, Key="small")
+    assert raw["ContentLength"] < len(payload)
+    assert raw["Metadata"] == {"volc-compression": codec, "volc-uncompressed-size": str(len(payload))}
+    assert tos_cli.get_object(bucket, "small").read() == payload
+
+    src = tmp_path / "src.bin"
+    src.write_bytes(payload)
+    tos_cli.upload_file(str(src), bucket, key="large", part_size=5 * 1024 * 1024, compression=codec)
+    for chunk_size in (0, 1024):
+        target = tmp_path / f"large-{chunk_size}"
+        tos_cli.download_file(bucket, "large", target_file_path=str(target), chunk_size=chunk_size)
+        assert target.read_bytes() == payload
+
+    buffer = bytearray(100)
+    assert tos_cli.read_into(bucket, "large", buffer, start=1000, end=1099) == 100
+    assert bytes(buffer) == payload[1000:1100]
+    assert tos_cli.get_object_view(bucket, "large", start=len(payload) - 10).read() == payload[-10:]
+
+
+@pytest.mark.parametrize("codec", ["gzip", "zstd"])
+def test_stream_decompressor(codec):
+    payload = make_payload(100000)
+    # two members/frames, fed in chunks that do not line up with them
+    packed = tos_compression.compress_bytes(payload, codec) * 2
+    decompressor = tos_compression.StreamDecompressor(codec)
+    out = b"".join(decompressor.decompress(packed[i:i + 333]) for i in range(0, len(packed), 333))
+    decompressor.finish()
+    assert out == payload * 2
+
+    truncated = tos_compression.StreamDecompressor(codec)
+    truncated.decompress(packed[:100])
+    with pytest.raises(IOError, match="truncated"):
+        truncated.finish()
+
+
+def test_download_large_plain_object(tos_cli, tmp_path, monkeypatch):
+    # objects above the threshold are fetched in threshold-sized ranged GETs, the first one included
+    monkeypatch.setattr(tos, "SINGLE_GET_THRESHOLD", 1024)
+    payload = make_payload(5000)
+    tos_cli.put_object(bucket, "plain", payload)
+
+    gets = []
+    origin = tos_cli.s3_client.get_object
+
+    def record_get_object(**kwargs):
+        gets.append(kwargs["Range"])
+        return origin(**kwargs)
+
+    def no_head_object(**kwargs):
+        raise AssertionError("size and ETag come from the first GET")
+
+    def no_state(*args):
+        raise AssertionError("a one-shot download keeps no resume state")
+
+    monkeypatch.setattr(tos_cli.s3_client, "get_object", record_get_object)
+    monkeypatch.setattr(tos_cli.s3_client, "head_object", no_head_object)
+    monkeypatch.setattr(tos_transfer.RangedDownloader, "_save_state", no_state)
+    target = tmp_path / "plain"
+    tos_cli.download_file(bucket, "plain", target_file_path=str(target))
+    assert target.read_bytes() == payload
+    assert sorted(gets) == sorted(f"bytes={i}-{min(i + 1024, 5000) - 1}" for i in range(0, 5000, 1024))
+    assert os.listdir(tmp_path) == ["plain"]
+
+    # replaced after the first GET: the IfMatch of the other ranges fails and nothing is left behind
+    def replace_after_first(**kwargs):
+        rsp = record_get_object(**kwargs)
+        if len(gets) == 1:
+            tos_cli.put_object(bucket, "plain", payload[::-1])
+        return rsp
+
+    monkeypatch.setattr(tos_cli.s3_client, "get_object", replace_after_first)
+    gets.clear()
+    with pytest.raises(ClientError, match="PreconditionFailed"):
+        tos_cli.download_file(bucket, "plain", target_file_path=str(tmp_path / "changed"))
+    assert os.listdir(tmp_path) == ["plain"]
+    monkeypatch.setattr(tos_cli.s3_client, "get_object", record_get_object)
+
+    tos_cli.put_object(bucket, "small", payload[:100])
+    gets.clear()
+    tos_cli.download_file(bucket, "small", target_file_path=str(tmp_path / "small"))
+    assert (tmp_path / "small").read_bytes() == payload[:100]
+    assert gets == ["bytes=0-1023"]
+
+
+def test_download_large_compressed_object(tos_cli, tmp_path, monkeypatch):
+    monkeypatch.setattr(tos, "SINGLE_GET_THRESHOLD", 64)
+    payload = make_payload(20000)
+    tos_cli.put_object(bucket, "packed", payload, compression="gzip")
+    assert tos_cli.s3_client.head_object(Bucket=bucket, Key="packed")["ContentLength"] > 64
+
+    gets = []
+    origin = tos_cli.s3_client.get_object
+
+    def record_get_object(**kwargs):
+        gets.append(kwargs["Range"])
+        return origin(**kwargs)
+
+    monkeypatch.setattr(tos_cli.s3_client, "get_object", record_get_object)
+    target = tmp_path / "packed"
+    tos_cli.download_file(bucket, "packed", target_file_path=str(target))
+    assert target.read_bytes() == payload
+    # decoding continues after the first range instead of starting over
+    assert gets == ["bytes=0-63", "bytes=64-"]
+
+
+def test_cache_fill_of_large_object_is_ranged(tos_cli, tmp_path, monkeypatch):
+    from volcengine_ml_platform.io import tos_cache
+
+    monkeypatch.setattr(tos, "SINGLE_GET_THRESHOLD", 1024)
+    monkeypatch.setattr(tos_cli, "cache", tos_cache.ObjectCache(str(tmp_path / "cache")))
+    payload = make_payload(5000)
+    tos_cli.put_object(bucket, "plain", payload)
+    etag = tos_cli.s3_client.head_object(Bucket=bucket, Key="plain")["ETag"]
+
+    gets = []
+    origin = tos_cli.s3_client.get_object
+
+    def record_get_object(**kwargs):
+        gets.append(kwargs)
+        return origin(**kwargs)
+
+    monkeypatch.setattr(tos_cli.s3_client, "get_object", record_get_object)
+    target = tmp_path / "plain"
+    tos_cli.download_file(bucket, "plain", target_file_path=str(target))
+    assert target.read_bytes() == payload
+    ranged = [g for g in gets if "Range" in g and g["Range"] != "bytes=0-"]
+    assert len(ranged) == 5 and all(g["IfMatch"] == etag for g in gets)
+
+    with pytest.raises(ClientError):
+        tos_cli.download_file_ranged(bucket, "plain", str(tmp_path / "stale"), chunk_size=1024, etag='"stale"')
+
+
+def test_pack_shards(tos_cli, tmp_path):
+    payloads, lines = [], []
+    for i in range(7):
+        payload = make_payload(300 + i * 257)
+        tos_cli.put_object(bucket, f"images/{i}.jpg", payload)
+        payloads.append(payload)
+        lines.append({"Data": {"ImageURL": f"tos://{bucket}/images/{i}.jpg"}, "Annotation": {"Label": i}})
+
+    prefix = f"tos://{bucket}/packed"
+    index = tos_shards.pack_manifest(
+        iter(lines), "ImageURL", prefix, tos_client=tos_cli,
+        max_samples_per_shard=3, parallelism=4, work_dir=str(tmp_path),
+    )
+    assert len(index) == 7
+    assert len(index.shards) == 3
+    assert os.listdir(tmp_path) == []
+
+    loaded = tos_shards.ShardIndex.from_tos(tos_shards.index_url(prefix), tos_cli)
+    assert loaded.shards == index.shards
+    reader = tos_shards.ShardReader(loaded, tos_cli)
+    for i in (6, 0, 4):
+        assert reader.read(i).read() == payloads[i]
+        assert loaded.annotation(i) == {"Label": i}
+
+    streamed = list(reader)
+    assert [i for i, _, _ in streamed] == list(range(7))
+    assert [data for _, _, data in streamed] == payloads
+    assert [line for _, line, _ in streamed] == lines
+
+    info = loaded.manifest_info()
+    b, k, (start, end) = info["buckets"][5], info["keys"][5], info["ranges"][5]
+    assert k == "packed/shard-000001.tar"
+    assert tos_cli.get_object_view(b, k, start, end).read() == payloads[5]
@@ -25,6 +25,8 @@ PUBLIC_EXAMPLES_TOS_BUCKET = "ml-platform-public-examples-{}".format(
 
 DATASET_LOCAL_METADATA_FILENAME = "local_metadata.manifest"
 ENCRYPTED_KEY_ENV_NAME = "ENCRYPTED_KEY"
+TOS_CACHE_DIR_ENV_NAME = "VOLC_TOS_CACHE_DIR"
+TOS_CACHE_MAX_SIZE_ENV_NAME = "VOLC_TOS_CACHE_MAX_SIZE"
 
 INNER_API_SERVICE_HOST_ENV_NAME = "ML_PLATFORM_HOST"
 ACCOUNT_ID_ENV_NAME = "VOLC_ACCOUNT_ID"
@@ -6,18 +6,60 @@ import logging
 import math
 import os
 import shutil
+import threading
+from collections import deque
 from typing import List
 from typing import Optional
 from typing import Tuple
-from urllib.parse import urlparse
 
 import numpy as np
 
 from volcengine_ml_platform import constant
 from volcengine_ml_platform.io import tos
+from volcengine_ml_platform.io import tos_shards
 from volcengine_ml_platform.openapi import dataset_client
+from volcengine_ml_platform.util import dedup
 
 QUEUE_TIMEOUT_SECONDS = 4
+MANIFEST_INDEX_SUFFIX = ".idx.npy"
+# parsed manifest lines kept while waiting for a slow download
+DEFAULT_MAX_PENDING_LINES = 65536
+
+
+def manifest_line_offsets(manifest_path: str) -> np.ndarray:
+    """返回 manifest 文件每一行起始的字节偏移，最后一个元素为文件大小
+
+    结果缓存在 manifest 旁边的 ``.idx.npy`` 文件中，manifest 被改写后自动重建，之后跳到任意一行只需要一次 seek
+
+    Args:
+        manifest_path(str): manifest 文件路径
+
+    Returns:
+        长度为行数加一的 uint64 数组
+    """
+    index_path = manifest_path + MANIFEST_INDEX_SUFFIX
+    stat = os.stat(manifest_path)
+    try:
+        if os.stat(index_path).st_mtime_ns >= stat.st_mtime_ns:
+            offsets = np.load(index_path, allow_pickle=False)
+            if len(offsets) and offsets[-1] == stat.st_size:
+                return offsets
+    except (OSError, ValueError):
+        pass
+
+    offsets = [0]
+    with open(manifest_path, "rb") as f:
+        for line in f:
+            offsets.append(offsets[-1] + len(line))
+    offsets = np.array(offsets, dtype=np.uint64)
+    try:
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, offsets)
+        os.replace(tmp_path, index_path)
+    except OSError:
+        logging.warning("Cannot write manifest index: %s", index_path)
+    return offsets
 
 
 def dataset_copy_file(metadata, source_dir, destination_dir):
@@ -119,6 +161,23 @@ class _Dataset:
             constant.DATASET_LOCAL_METADATA_FILENAME,
         )
 
+    def _iter_manifest(self, offset=0, limit=-1):
+        """依次返回本地 manifest 中从第 ``offset`` 行开始的至多 ``limit`` 行，通过行索引直接跳到 ``offset``"""
+        manifest_path = self._manifest_path()
+        offsets = manifest_line_offsets(manifest_path)
+        line_count = len(offsets) - 1
+        if offset >= line_count:
+            return
+        end = line_count if limit == -1 else min(line_count, offset + limit)
+        with open(manifest_path, "rb") as f:
+            f.seek(int(offsets[offset]))
+            for _ in range(offset, end):
+                yield json.loads(f.readline())
+
+    def _local_file_path(self, tos_url: str) -> str:
+        """文件下载到本地后的路径，与 ``download_file(target_dir_path=self.local_path)`` 一致"""
+        return tos.key_local_path(self.local_path, tos.split_tos_url(tos_url)[1])
+
     def _download_file(self, tos_url: str, file_path: str):
         return self.tos_client.download_file(
             tos_url=tos_url, target_file_path=file_path
@@ -145,46 +204,169 @@ class _Dataset:
         self,
         manifest_keyword: str,
         limit=-1,
+        parallelism: int = 10,
+        dedup_capacity: int = dedup.DEFAULT_CAPACITY,
+        max_pending_lines: int = DEFAULT_MAX_PENDING_LINES,
     ):
+        """流式下载 manifest 中的文件并生成本地 manifest
+
+        manifest 逐行解析，解析出的 url 立即提交下载，本地 manifest 按原来的行序在下载完成后逐行写入。
+        重复的 url 只下载一次：去重只记住最近 ``dedup_capacity`` 个不同 url 的摘要，两次出现之间隔了更多
+        不同 url 时会重新下载到同一路径。等待写入的行超过 ``max_pending_lines`` 时暂停解析，直到最早的
+        下载完成，因此内存占用与数据集大小无关，即使某个下载很慢而其后的行大量重复。
+
+        Args:
+            manifest_keyword(str): 文件 tos url 在 ``Data`` 中的字段名
+            limit(int): 最多处理的行数，为 -1 时不限制
+            parallelism(int): 同时进行的下载数量
+            dedup_capacity(int): 去重时记住的不同 url 数量
+            max_pending_lines(int): 等待下载完成后写入的行数上限
+        """
 
         print("Downloading the mainfest file ...")
-        self._get_detail()
+        manifest_file_path = self._download_source_manifest()
+
+        # url -> sequence number of the download that fetches it; never forgets a url still downloading
+        seen = dedup.RecentKeys(max(dedup_capacity, parallelism + 1))
+        # parsed lines waiting for their file, in manifest order
+        pending: deque = deque()
+        max_pending = max(max_pending_lines, parallelism + 1)
+        submitted = 0
+        count = 0
+        # downloads finish out of order in the pool: all below `done_below` are finished
+        finished = set()
+        done_below = 0
+        done = threading.Condition()
+
+        def fetch(item):
+            nonlocal done_below
+            seq, url = item
+            try:
+                self.tos_client.download_file(tos_url=url, target_dir_path=self.local_path)
+            finally:
+                # a failure also counts, it is raised when its result is taken
+                with done:
+                    finished.add(seq)
+                    while done_below in finished:
+                        finished.remove(done_below)
+                        done_below += 1
+                    done.notify_all()
+
+        def flush(new_manifest_file):
+            # write the leading lines whose files are all downloaded
+            nonlocal count
+            while pending and pending[0][1] < done_below:
+                manifest_line, _ = pending.popleft()
+                manifest_line["Data"]["FilePath"] = self._local_file_path(manifest_line["Data"][manifest_keyword])
+                new_manifest_file.write(json.dumps(manifest_line) + "\n")
+                count += 1
+
+        def urls(new_manifest_file):
+            nonlocal submitted
+            with open(manifest_file_path, encoding="utf-8") as f:
+                for seqNum, line in enumerate(f):
+                    if limit != -1 and seqNum >= limit:
+                        break
+                    manifest_line = json.loads(line)
+                    url = manifest_line["Data"][manifest_keyword]
+                    seq = seen.setdefault(url, submitted)
+                    pending.append((manifest_line, seq))
+                    if seq == submitted:
+                        submitted += 1
+                        yield seq, url
+                    if len(pending) >= max_pending:
+                        # every download yielded so far is already submitted, wait for the oldest one
+                        with done:
+                            done.wait_for(lambda: pending[0][1] < done_below)
+                    # a repeated url that is already downloaded is written right away
+                    flush(new_manifest_file)
 
-        manifest_file_path = self.tos_client.download_file(
-            tos_url=self._get_storage_path(),
+        print("Downloading datasets ...")
+        with open(
+            self._manifest_path(),
+            "w",
+            encoding="utf-8",
+        ) as new_manifest_file:
+            # results are taken in submission order, so that failures are raised
+            for _ in tos.map_ahead(fetch, urls(new_manifest_file), parallelism):
+                flush(new_manifest_file)
+            # repeated urls read after the last download completed
+            flush(new_manifest_file)
+        self.data_count = count
+        print("Update the local mainfest file successful")
+        self.created = True
+
+    def _download_source_manifest(self) -> str:
+        """下载数据集的 manifest 文件，优先使用 ``tos_source``"""
+        if not self.tos_source:
+            self._get_detail()
+        return self.tos_client.download_file(
+            tos_url=self.tos_source or self._get_storage_path(),
             target_dir_path=self.local_path,
         )
-        manifest_line = []
-        urls = []
-        with open(manifest_file_path, encoding="utf-8") as f:
-            for seqNum, line in enumerate(f.readlines()):
-                manifest_line.append(json.loads(line))
-                urls.append(manifest_line[seqNum]["Data"][manifest_keyword])
-                if limit != -1 and seqNum + 1 >= limit:
-                    break
 
-        print("Downloading datasets ...")
-        _ = self.tos_client.download_files(
-            # url 去重
-            tos_urls=list(set(urls)),
-            target_dir_path=self.local_path,
-            parallelism=10,
+    def _pack_manifest_dataset(
+        self,
+        manifest_keyword: str,
+        tos_prefix: str,
+        shard_size: int = tos_shards.DEFAULT_SHARD_SIZE,
+        limit=-1,
+        parallelism: int = 32,
+    ) -> str:
+        manifest_file_path = self._download_source_manifest()
+
+        def manifest_lines():
+            with open(manifest_file_path, encoding="utf-8") as f:
+                for seqNum, line in enumerate(f):
+                    if limit != -1 and seqNum >= limit:
+                        break
+                    yield json.loads(line)
+
+        print("Packing datasets ...")
+        index = tos_shards.pack_manifest(
+            manifest_lines(),
+            manifest_keyword,
+            tos_prefix,
+            tos_client=self.tos_client,
+            shard_size=shard_size,
+            parallelism=parallelism,
         )
+        print(f"Packed {len(index)} samples into {len(index.shards)} shards")
+        return tos_shards.index_url(tos_prefix)
 
-        # create a new thread to consume new local maifest file
-        print("Generating the local mainfest file...")
-        manifest_str = ""
-        for idx, url in enumerate(urls):
-            manifest_line[idx]["Data"]["FilePath"] = os.path.join(
-                self.local_path, urlparse(url).path[1:]
-            )
-            manifest_str += json.dumps(manifest_line[idx]) + "\n"
+    def _create_shard_dataset(
+        self,
+        shard_index: str,
+        manifest_keyword: str,
+        limit=-1,
+    ):
+        print("Downloading the shard index ...")
+        index = tos_shards.ShardIndex.from_tos(shard_index, self.tos_client)
+        reader = tos_shards.ShardReader(index, self.tos_client)
+
+        count = len(index) if limit == -1 else min(limit, len(index))
+        # shards are streamed sequentially; samples whose url repeats an earlier one have no data of their own
+        print("Downloading datasets ...")
+        os.makedirs(self.local_path, exist_ok=True)
+        for i, manifest_line, data in reader:
+            if i >= count:
+                break
+            file_path = self._local_file_path(manifest_line["Data"][manifest_keyword])
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, "wb") as f:
+                f.write(data)
+
+        # written in sample order from the index, repeated urls share the file of their first occurrence
         with open(
             self._manifest_path(),
             "w",
             encoding="utf-8",
         ) as new_manifest_file:
-            new_manifest_file.write(manifest_str)
+            for i in range(count):
+                manifest_line = index.manifest_line(i)
+                manifest_line["Data"]["FilePath"] = self._local_file_path(manifest_line["Data"][manifest_keyword])
+                new_manifest_file.write(json.dumps(manifest_line) + "\n")
+        self.data_count = count
         print("Update the local mainfest file successful")
         self.created = True
 
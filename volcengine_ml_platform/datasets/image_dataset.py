@@ -1,12 +1,23 @@
+import itertools
 import json
+import os
 from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+from typing import List
 from typing import Optional
+from typing import Tuple
 
 import numpy as np
 from PIL import Image
 
 from volcengine_ml_platform.datasets.dataset import _Dataset
+from volcengine_ml_platform.datasets.sample_store import SampleStore
+from volcengine_ml_platform.datasets.sample_store import SampleStoreWriter
+from volcengine_ml_platform.io import tos_shards
+from volcengine_ml_platform.io.tos_dataset import IterableTOSDataset
 from volcengine_ml_platform.io.tos_dataset import TorchTOSDataset
+from volcengine_ml_platform.io.tos_manifest import ManifestStore
 
 
 class ImageDataset(_Dataset):
@@ -21,12 +32,14 @@ class ImageDataset(_Dataset):
 
     """
 
-    def download(self, local_path: str = "ImageDataset", limit=-1):
+    def download(self, local_path: str = "ImageDataset", limit=-1, shard_index: Optional[str] = None):
         """把数据集从 TOS 下载到本地
 
         Args:
             local_path(str): 设置下载目录
             limit (int, optional): 设置最大下载数据条目
+            shard_index(str, optional): ``pack`` 返回的索引地址，指定时顺序流式读取打包好的 shard，
+                代替逐个下载小文件
         """
 
         """download datasets from source
@@ -37,8 +50,41 @@ class ImageDataset(_Dataset):
 
         if local_path:
             self.local_path = local_path
+        if shard_index:
+            self._create_shard_dataset(shard_index, manifest_keyword="ImageURL", limit=limit)
+            return
         self._create_manifest_dataset(
             manifest_keyword="ImageURL",
+            limit=limit,
+        )
+
+    def pack(
+        self,
+        tos_prefix: str,
+        shard_size: int = tos_shards.DEFAULT_SHARD_SIZE,
+        limit=-1,
+        parallelism: int = 32,
+    ) -> str:
+        """把数据集中的图片连同标注打包成大的 shard 上传到 TOS，减少逐个请求小文件的开销
+
+        打包后可以通过 ``download(shard_index=...)`` 顺序下载，或通过 ``init_torch_dataset(shard_index=...)``
+        按偏移用 Range GET 随机读取，详见 ``tos_shards``
+
+        Args:
+            tos_prefix(str): shard 及索引的上传位置，比如 ``tos://bucket/packed/``
+            shard_size(int): 单个 shard 的目标大小，默认 256MiB
+            limit (int, optional): 设置最大打包数据条目
+            parallelism(int): 读取图片的并发数
+
+        Returns:
+            返回索引文件的 tos url
+        """
+        return self._pack_manifest_dataset(
+            "ImageURL",
+            tos_prefix,
+            shard_size=shard_size,
+            limit=limit,
+            parallelism=parallelism,
         )
 
     def split(self, training_dir: str, testing_dir: str, ratio=0.8, random_state=0):
@@ -60,20 +106,142 @@ class ImageDataset(_Dataset):
         images = []
         annotations = []
 
-        with open(self._manifest_path(), encoding="utf-8") as f:
-            for i, line in enumerate(f):
-                manifest_line = json.loads(line)
-                if i < offset:
-                    continue
-                if limit != -1 and i >= offset + limit:
-                    break
-                file_path = manifest_line["Data"]["FilePath"]
-                image = Image.open(file_path)
-                images.append(np.asarray(image))
-                annotations.append(manifest_line["Annotation"])
+        for manifest_line in self._iter_manifest(offset, limit):
+            file_path = manifest_line["Data"]["FilePath"]
+            image = Image.open(file_path)
+            images.append(np.asarray(image))
+            annotations.append(manifest_line["Annotation"])
 
         return np.array(images), annotations
 
+    @staticmethod
+    def _load_image(file_path, size=None, mode=None) -> np.ndarray:
+        with Image.open(file_path) as image:
+            if size is not None:
+                # lets JPEG decode at a reduced scale close to the target size
+                image.draft(mode or image.mode, (size[1], size[0]))
+            if mode is not None and image.mode != mode:
+                image = image.convert(mode)
+            if size is not None and image.size != (size[1], size[0]):
+                image = image.resize((size[1], size[0]), Image.BILINEAR)
+            return np.asarray(image)
+
+    def _decode_into(self, buffer, index, file_path, size, mode):
+        array = self._load_image(file_path, size, mode)
+        if array.shape != buffer.shape[1:]:
+            raise ValueError(
+                f"image {file_path} has shape {array.shape}, expect {buffer.shape[1:]}, "
+                "set size and mode to load images of different shapes",
+            )
+        buffer[index] = array
+
+    def iter_np_batches(
+        self,
+        batch_size: int = 32,
+        offset=0,
+        limit=-1,
+        size: Optional[Tuple[int, int]] = None,
+        mode: Optional[str] = None,
+        num_workers: int = 8,
+        reuse_buffer: bool = True,
+    ) -> Iterator[Tuple[np.ndarray, List]]:
+        """按批流式加载图片，每批写入预先分配的 ``(batch, H, W, C)`` 数组，内存占用与数据集大小无关
+
+        图片在线程池中并行解码（PIL 解码时释放 GIL），直接写入输出数组，不产生中间列表；下一批在调用方处理
+        当前批时就开始解码。``offset`` 通过 manifest 的行索引直接定位，不需要从头扫描。
+
+        Args:
+            batch_size(int): 每批的图片数量，最后一批可能不足
+            offset (int, optional): num of images to skip. Defaults to 0.
+            limit (int, optional): num of images to load. Defaults to -1.
+            size(tuple, optional): ``(H, W)`` ，指定时把图片缩放到该大小，否则要求所有图片大小一致
+            mode(str, optional): PIL 的图片模式，比如 ``RGB`` ，指定时统一转换为该模式
+            num_workers(int): 解码线程数
+            reuse_buffer(bool): 为 True 时交替复用两个输出数组，返回的数组在请求下一批时会被覆盖，
+                需要保留数据时复制或设为 False
+
+        Returns:
+            返回 (图片数组, 标注列表) 的迭代器
+
+        Raises:
+            ValueError: 图片大小不一致且没有指定 ``size``
+        """
+        if batch_size <= 0:
+            raise ValueError("batch_size must be positive")
+        lines = self._iter_manifest(offset, limit)
+        first = next(lines, None)
+        if first is None:
+            return
+        sample = self._load_image(first["Data"]["FilePath"], size, mode)
+        shape, dtype = (batch_size,) + sample.shape, sample.dtype
+        buffers = [np.empty(shape, dtype=dtype) for _ in range(2 if reuse_buffer else 0)]
+
+        executor = ThreadPoolExecutor(max_workers=num_workers)
+
+        def submit(batch_index):
+            # the first image is already decoded, it was needed for the shape
+            head = [first] if batch_index == 0 else []
+            batch = head + list(itertools.islice(lines, batch_size - len(head)))
+            if not batch:
+                return None
+            buffer = buffers[batch_index % 2] if reuse_buffer else np.empty(shape, dtype=dtype)
+            if head:
+                buffer[0] = sample
+            futures = [
+                executor.submit(self._decode_into, buffer, i, line["Data"]["FilePath"], size, mode)
+                for i, line in enumerate(batch[len(head):], len(head))
+            ]
+            return buffer[:len(batch)], [line["Annotation"] for line in batch], futures
+
+        pending = None
+        try:
+            pending = submit(0)
+            batch_index = 0
+            while pending is not None:
+                images, annotations, futures = pending
+                for future in futures:
+                    future.result()
+                batch_index += 1
+                pending = submit(batch_index)
+                yield images, annotations
+        finally:
+            if pending is not None:
+                for future in pending[2]:
+                    future.cancel()
+            executor.shutdown(wait=True)
+
+    def build_sample_store(
+        self,
+        path: Optional[str] = None,
+        decode: bool = True,
+        offset=0,
+        limit=-1,
+    ) -> SampleStore:
+        """把已下载的图片写入内存映射的本地样本存储，代替 ``load_as_np`` 一次性读入内存
+
+        Args:
+            path(str, optional): 存储目录，默认为下载目录下的 ``samples``
+            decode(bool, optional): 为 True 时保存解码后的像素数组，否则保存原始的图片文件内容
+            offset (int, optional): num of images to skip. Defaults to 0.
+            limit (int, optional): num of images to store. Defaults to -1.
+
+        Returns:
+            返回 ``SampleStore`` ，样本及标注的顺序与 manifest 一致
+        """
+        if path is None:
+            path = os.path.join(self.local_path, "samples")
+        with SampleStoreWriter(path) as writer:
+            for manifest_line in self._iter_manifest(offset, limit):
+                file_path = manifest_line["Data"]["FilePath"]
+                if decode:
+                    with Image.open(file_path) as image:
+                        sample = np.asarray(image)
+                else:
+                    with open(file_path, "rb") as image_file:
+                        sample = image_file.read()
+                writer.add(sample, manifest_line["Annotation"])
+        return SampleStore(path)
+
     def parse_image_manifest(self, manifest_file_path):
         # parse manifest
         manifest_info = {"buckets": [], "keys": [], "annotations": []}
@@ -94,12 +262,63 @@ class ImageDataset(_Dataset):
         self,
         transform: Optional[Callable] = None,
         target_transform: Optional[Callable] = None,
+        shard_index: Optional[str] = None,
+        prefetch: int = 0,
+        compact: bool = False,
+        decode: Optional[Callable] = None,
     ):
-        manifest_info = self.get_manifest_info(self.parse_image_manifest)
+        if shard_index:
+            # samples are read from the packed shards with ranged GETs
+            manifest_info = tos_shards.ShardIndex.from_tos(shard_index, self.tos_client).manifest_info()
+            if compact:
+                manifest_info = ManifestStore.from_manifest_info(manifest_info)
+        elif compact:
+            # columnar arrays instead of per-sample Python objects, see tos_manifest
+            manifest_info = self.get_manifest_info(
+                lambda path: ManifestStore.from_manifest_file(path, url_keyword="ImageURL"),
+            )
+        else:
+            manifest_info = self.get_manifest_info(self.parse_image_manifest)
         torch_dataset = TorchTOSDataset(
             manifest_info=manifest_info,
+            decode=decode,
             transform=transform,
             target_transform=target_transform,
+            prefetch=prefetch,
         )
 
         return torch_dataset
+
+    def init_torch_iterable_dataset(
+        self,
+        transform: Optional[Callable] = None,
+        target_transform: Optional[Callable] = None,
+        read_ahead: int = 16,
+        shuffle_buffer: int = 0,
+        seed: int = 0,
+        decode: Optional[Callable] = None,
+    ):
+        """创建流式读取 ``tos_source`` 的 ``IterableTOSDataset`` ，样本自动分给各个 rank 和 DataLoader worker
+
+        Args:
+            transform(callable): 作用于解码后的图片
+            target_transform(callable): 作用于标注
+            read_ahead(int): 每个 worker 同时进行的 GET 数量
+            shuffle_buffer(int): 打乱顺序的缓冲区大小，为 0 时按 manifest 的顺序读取
+            seed(int): 打乱顺序的随机种子，配合 ``set_epoch`` 使每个 epoch 的顺序可复现
+            decode(callable): 把图片内容解码为样本，例如 ``tos_decode.ImageDecoder`` ，默认用 PIL 解码为 RGB 图片
+
+        Returns:
+            返回 ``IterableTOSDataset``
+        """
+        assert self.tos_source is not None
+        return IterableTOSDataset(
+            manifest=self.tos_source,
+            url_keyword="ImageURL",
+            decode=decode,
+            transform=transform,
+            target_transform=target_transform,
+            read_ahead=read_ahead,
+            shuffle_buffer=shuffle_buffer,
+            seed=seed,
+        )
@@ -0,0 +1,249 @@
+"""基于内存映射的本地样本存储
+
+把样本（解码后的 NumPy 数组或原始字节）依次写入若干个数据文件，并用偏移索引记录每个样本的位置、dtype 和
+shape。读取时数据文件通过 ``mmap`` 只读映射，``SampleStore.view`` / ``SampleStore.array`` 返回的是映射内存上
+的 ``memoryview`` / NumPy 视图，不复制数据，也不需要把整个数据集读入内存。同一台机器上的多个 DataLoader
+worker 映射的是同一批文件，共享操作系统的 page cache。::
+
+    with SampleStoreWriter("/data/store") as writer:
+        for image, annotation in samples:
+            writer.add(np.asarray(image), annotation)
+
+    store = SampleStore("/data/store")
+    image = store[0]  # 只读的 NumPy 视图
+
+存储目录中 ``data-{序号:05d}.bin`` 为数据文件，``index.npz`` 为索引。
+"""
+import json
+import mmap
+import os
+from typing import List
+from typing import Optional
+
+import numpy as np
+
+DEFAULT_SHARD_SIZE = 1073741824  # 1GiB
+INDEX_FILENAME = "index.npz"
+DATA_NAME_FORMAT = "data-{:05d}.bin"
+# sample offsets are aligned so that array views of any dtype are aligned as well
+ALIGNMENT = 64
+# dtype id of samples stored as raw bytes
+RAW = -1
+
+
+class SampleStoreWriter:
+    """把样本写入本地样本存储，``close`` 时写入索引；作为 context manager 使用时出错会调用 ``abort``
+
+    Args:
+        path(str): 存储目录，不存在时创建
+        shard_size(int): 单个数据文件的目标大小，超过后开始写下一个文件
+    """
+
+    def __init__(self, path: str, shard_size: int = DEFAULT_SHARD_SIZE):
+        self.path = path
+        self.shard_size = shard_size
+        os.makedirs(path, exist_ok=True)
+        self._shard_ids: List[int] = []
+        self._offsets: List[int] = []
+        self._sizes: List[int] = []
+        self._dtype_ids: List[int] = []
+        self._shapes: List[tuple] = []
+        self._dtypes: List[str] = []
+        self._annotations = bytearray()
+        self._annotation_offsets = [0]
+        self._shard = -1
+        self._file = None
+        self._pos = 0
+        self._closed = False
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def _next_shard(self):
+        if self._file is not None:
+            self._file.close()
+        self._shard += 1
+        self._file = open(os.path.join(self.path, DATA_NAME_FORMAT.format(self._shard)), "wb")
+        self._pos = 0
+
+    def add(self, sample, annotation=None) -> int:
+        """追加一个样本
+
+        Args:
+            sample: NumPy 数组，或 ``bytes`` 等支持 buffer 协议的原始数据
+            annotation: 可以 JSON 序列化的标注，为 None 时不记录
+
+        Returns:
+            返回样本的序号
+        """
+        if self._file is None or self._pos >= self.shard_size:
+            self._next_shard()
+        if isinstance(sample, np.ndarray):
+            sample = np.ascontiguousarray(sample)
+            dtype = sample.dtype.str
+            if dtype not in self._dtypes:
+                self._dtypes.append(dtype)
+            self._dtype_ids.append(self._dtypes.index(dtype))
+            self._shapes.append(sample.shape)
+            data = memoryview(sample).cast("B") if sample.size else b""
+        else:
+            self._dtype_ids.append(RAW)
+            self._shapes.append(())
+            data = memoryview(sample).cast("B")
+
+        padding = -self._pos % ALIGNMENT
+        if padding:
+            self._file.write(b"\0" * padding)
+            self._pos += padding
+        self._shard_ids.append(self._shard)
+        self._offsets.append(self._pos)
+        self._sizes.append(len(data))
+        self._file.write(data)
+        self._pos += len(data)
+
+        if annotation is not None:
+            self._annotations += json.dumps(annotation, ensure_ascii=False).encode("utf-8")
+        self._annotation_offsets.append(len(self._annotations))
+        return len(self._offsets) - 1
+
+    def close(self):
+        """关闭数据文件并写入索引，索引写入前存储不可读"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        max_ndim = max((len(s) for s in self._shapes), default=0)
+        shapes = np.zeros((len(self._shapes), max_ndim), dtype=np.int64)
+        for i, shape in enumerate(self._shapes):
+            shapes[i, :len(shape)] = shape
+        tmp_path = os.path.join(self.path, INDEX_FILENAME + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                shard_ids=np.array(self._shard_ids, dtype=np.uint32),
+                offsets=np.array(self._offsets, dtype=np.uint64),
+                sizes=np.array(self._sizes, dtype=np.uint64),
+                dtypes=np.array(self._dtypes, dtype=str),
+                dtype_ids=np.array(self._dtype_ids, dtype=np.int16),
+                ndims=np.array([len(s) for s in self._shapes], dtype=np.uint8),
+                shapes=shapes,
+                annotations=np.frombuffer(self._annotations, dtype=np.uint8),
+                annotation_offsets=np.array(self._annotation_offsets, dtype=np.uint64),
+            )
+        os.replace(tmp_path, os.path.join(self.path, INDEX_FILENAME))
+
+    def abort(self):
+        """放弃写入：关闭并删除已写入的数据文件，不写索引"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        # an index left by an earlier store would now describe overwritten data files
+        names = [DATA_NAME_FORMAT.format(shard) for shard in range(self._shard + 1)] + [INDEX_FILENAME]
+        for name in names:
+            try:
+                os.remove(os.path.join(self.path, name))
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # a failed write must not leave a store that looks complete
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+class SampleStore:
+    """只读地打开 ``SampleStoreWriter`` 写入的样本存储
+
+    数据文件在第一次访问时才映射，实例可以被 pickle 传给 DataLoader 的 worker 进程，各进程分别映射同一批
+    文件，共享 page cache。可以直接作为 map-style dataset 使用，``store[i]`` 等价于 ``store.array(i)`` 。
+
+    Args:
+        path(str): 存储目录
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with np.load(os.path.join(path, INDEX_FILENAME), allow_pickle=False) as index:
+            self.shard_ids = index["shard_ids"]
+            self.offsets = index["offsets"]
+            self.sizes = index["sizes"]
+            self.dtypes = [np.dtype(d) for d in index["dtypes"].tolist()]
+            self.dtype_ids = index["dtype_ids"]
+            self.ndims = index["ndims"]
+            self.shapes = index["shapes"]
+            self.annotations = index["annotations"]
+            self.annotation_offsets = index["annotation_offsets"]
+        self._maps: dict = {}
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # mappings are recreated lazily in the receiving process
+        state["_maps"] = {}
+        return state
+
+    def _map(self, shard: int):
+        buffer = self._maps.get(shard)
+        if buffer is None:
+            with open(os.path.join(self.path, DATA_NAME_FORMAT.format(shard)), "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    # an empty file cannot be mapped
+                    buffer = b""
+                else:
+                    buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[shard] = buffer
+        return buffer
+
+    def view(self, index: int) -> memoryview:
+        """返回第 ``index`` 个样本原始字节的只读 memoryview，不复制数据"""
+        start = int(self.offsets[index])
+        return memoryview(self._map(int(self.shard_ids[index])))[start:start + int(self.sizes[index])]
+
+    def shape(self, index: int) -> Optional[tuple]:
+        """返回样本的 shape，原始字节样本返回 None"""
+        if self.dtype_ids[index] == RAW:
+            return None
+        return tuple(int(d) for d in self.shapes[index, :self.ndims[index]])
+
+    def array(self, index: int) -> np.ndarray:
+        """返回第 ``index`` 个样本的只读 NumPy 视图，原始字节样本为一维 uint8 数组"""
+        dtype_id = self.dtype_ids[index]
+        if dtype_id == RAW:
+            return np.frombuffer(self.view(index), dtype=np.uint8)
+        return np.frombuffer(self.view(index), dtype=self.dtypes[dtype_id]).reshape(self.shape(index))
+
+    def annotation(self, index: int):
+        """返回样本的标注，写入时未提供则返回 None"""
+        start, end = self.annotation_offsets[index], self.annotation_offsets[index + 1]
+        if start == end:
+            return None
+        return json.loads(self.annotations[start:end].tobytes())
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"sample index {index} out of range")
+        return self.array(index)
+
+    def close(self):
+        """解除映射；仍有视图引用映射内存时由垃圾回收负责释放"""
+        for buffer in self._maps.values():
+            if isinstance(buffer, mmap.mmap):
+                try:
+                    buffer.close()
+                except BufferError:
+                    pass
+        self._maps = {}
@@ -25,6 +25,7 @@ class TextDataset(_Dataset):
 
         self._create_manifest_dataset(
             manifest_keyword="TextURL",
+            limit=limit,
         )
 
     def split(self, training_dir: str, testing_dir: str, ratio=0.8, random_state=0):
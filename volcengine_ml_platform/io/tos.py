@@ -1,11 +1,21 @@
 """提供对 TOS 储存的上传、下载、删除、查询功能"""
-import math
 import os
+import queue
+import threading
+from collections import deque
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
 from logging import debug
 from logging import error
 from logging import warning
-from multiprocessing.dummy import Pool
+from typing import Callable
+from typing import Iterable
+from typing import Iterator
 from typing import List
+from typing import Optional
+from typing import Tuple
 from urllib.parse import urlparse
 
 import boto3
@@ -16,32 +26,327 @@ from botocore.exceptions import ClientError
 from tqdm import tqdm
 
 import volcengine_ml_platform
+from volcengine_ml_platform.io import tos_cache
+from volcengine_ml_platform.io import tos_compression
+from volcengine_ml_platform.io import tos_concurrency
+from volcengine_ml_platform.io import tos_metrics
+from volcengine_ml_platform.io import tos_throttle
+from volcengine_ml_platform.io.tos_cache import ObjectCache
+from volcengine_ml_platform.io.tos_concurrency import AdaptiveConcurrency
+from volcengine_ml_platform.io.tos_throttle import TransferThrottle
+from volcengine_ml_platform.io.tos_sync import LocalHashCache
+from volcengine_ml_platform.io.tos_transfer import ChainedStream
+from volcengine_ml_platform.io.tos_transfer import DEFAULT_CHUNK_SIZE
+from volcengine_ml_platform.io.tos_transfer import DEFAULT_PART_SIZE
+from volcengine_ml_platform.io.tos_transfer import MemoryViewReader
+from volcengine_ml_platform.io.tos_transfer import MultipartUploader
+from volcengine_ml_platform.io.tos_transfer import readinto_full
+from volcengine_ml_platform.io.tos_transfer import RangedDownloader
+from volcengine_ml_platform.io.tos_transfer import ResumableStream
+from volcengine_ml_platform.io.tos_transfer import save_stream
+from volcengine_ml_platform.util import retry
+from volcengine_ml_platform.util.retry import RetryPolicy
+
+
+DEFAULT_MAX_POOL_CONNECTIONS = 50
+
+_client_cache: dict = {}
+_client_cache_lock = threading.Lock()
+_client_cache_pid = os.getpid()
+
+
+def clear_client_cache():
+    """清空进程内缓存的 boto3 s3 client，之后新建的 ``TOSClient`` 会重新创建 client"""
+    global _client_cache_lock, _client_cache_pid
+    _client_cache.clear()
+    _client_cache_lock = threading.Lock()
+    _client_cache_pid = os.getpid()
+
+
+if hasattr(os, "register_at_fork"):
+    # the connection pool must not be shared with the parent after fork (e.g. DataLoader workers)
+    os.register_at_fork(after_in_child=clear_client_cache)
+
+
+def client_config(credentials=None, session_token=None) -> dict:
+    """根据认证信息生成创建 boto3 s3 client 所需的 region、endpoint 和认证参数"""
+    # ref: https://boto3.amazonaws.com/v1/documentation/api/latest/guide/configuration.html
+    if credentials is None:
+        credentials = volcengine_ml_platform.get_credentials()
+    config = {
+        "region_name": credentials.region,
+        "aws_access_key_id": credentials.ak,
+        "aws_secret_access_key": credentials.sk,
+        "endpoint_url": volcengine_ml_platform.get_tos_endpoint_url(),
+    }
+    if session_token is None:
+        session_token = volcengine_ml_platform.get_session_token()
+    if session_token is not None and len(session_token.strip()) > 0:
+        config["aws_session_token"] = session_token
+    return config
+
+
+def _install_retry_policy(client, policy: Optional[RetryPolicy] = None):
+    """用 ``RetryPolicy`` 代替 botocore 自带的重试逻辑，client 的每个请求都按该策略重试
+
+    Args:
+        client: boto3 s3 client
+        policy(RetryPolicy): 为 None 时每次请求都使用当时的全局重试策略
+    """
+
+    def needs_retry(response=None, caught_exception=None, attempts=1, operation=None, **kwargs):
+        p = policy if policy is not None else retry.get_default_retry_policy()
+        if p is None:
+            return None
+        if caught_exception is not None:
+            e = caught_exception
+        elif response is not None:
+            http_response, parsed = response
+            if http_response.status_code < 300 and "Error" not in parsed:
+                p.on_success()
+                return None
+            e = ClientError(parsed, operation.name)
+        else:
+            return None
+        delay = p.next_delay(e, attempts)
+        if delay is not None:
+            debug("retry %s in %.2fs (attempt %d): %s", operation.name, delay, attempts, e)
+            tos_metrics.record_retry(operation.name)
+            # an error that is retried never reaches AdaptiveConcurrency.release
+            tos_concurrency.report_retry(e)
+        return delay
+
+    client.meta.events.unregister("needs-retry.s3", unique_id="retry-config-s3")
+    client.meta.events.register("needs-retry.s3", needs_retry, unique_id="retry-config-s3")
+
+
+def _new_s3_client(config, max_pool_connections, tcp_keepalive, throttle=None, retry_policy=None):
+    client_config = {
+        "s3": {"addressing_style": "virtual"},
+        "max_pool_connections": max_pool_connections,
+    }
+    try:
+        botocore_config = Config(tcp_keepalive=tcp_keepalive, **client_config)
+    except TypeError:
+        # botocore < 1.27.84 has no tcp_keepalive option
+        botocore_config = Config(**client_config)
+    # boto3.client uses the default session, which is not thread-safe
+    client = boto3.session.Session().client("s3", config=botocore_config, **config)
+    tos_throttle.install(client, throttle)
+    tos_metrics.install(client)
+    _install_retry_policy(client, retry_policy)
+    return client
+
+
+def get_s3_client(
+    config: dict,
+    max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS,
+    tcp_keepalive: bool = True,
+    throttle: Optional[TransferThrottle] = None,
+    retry_policy: Optional[RetryPolicy] = None,
+):
+    """获取进程内共享的 boto3 s3 client
+
+    以认证信息、endpoint、region 以及连接池配置为 key 缓存 client，相同配置的 ``TOSClient`` 共用同一个
+    client 和连接池。fork 之后子进程会重新创建 client，不会与父进程共用连接。
+
+    Args:
+        config(dict): 传给 ``boto3.client`` 的认证、region 和 endpoint 参数
+        max_pool_connections(int): 连接池的最大连接数
+        tcp_keepalive(bool): 是否开启 TCP keep-alive
+        throttle(TransferThrottle): 只作用于该 client 的限速，为 None 时使用全局限速
+        retry_policy(RetryPolicy): 只作用于该 client 的重试策略，为 None 时使用全局重试策略
+
+    Returns:
+        返回 boto3 s3 client
+
+    """
+    cache_key = (tuple(sorted(config.items())), max_pool_connections, tcp_keepalive, throttle, retry_policy)
+    if _client_cache_pid != os.getpid():
+        clear_client_cache()
+    client = _client_cache.get(cache_key)
+    if client is not None:
+        return client
+    with _client_cache_lock:
+        client = _client_cache.get(cache_key)
+        if client is None:
+            client = _new_s3_client(config, max_pool_connections, tcp_keepalive, throttle, retry_policy)
+            _client_cache[cache_key] = client
+    return client
+
+
+# upper bound of the shared pool, threads are only started when tasks are waiting
+SHARED_WORKERS = 256
+# size of the first GET of a download, objects up to this size need no other request
+SINGLE_GET_THRESHOLD = DEFAULT_CHUNK_SIZE
+
+_shared_executor_instance: Optional[ThreadPoolExecutor] = None
+_shared_executor_lock = threading.Lock()
+
+
+def _shared_executor() -> ThreadPoolExecutor:
+    """进程内共享的下载线程池，避免每次批量下载都创建、销毁线程
+
+    线程池大小固定且不会被关闭，各调用方自己限制同时提交的任务数
+    """
+    global _shared_executor_instance
+    with _shared_executor_lock:
+        if _shared_executor_instance is None:
+            _shared_executor_instance = ThreadPoolExecutor(
+                max_workers=SHARED_WORKERS,
+                thread_name_prefix="tos-transfer",
+            )
+        return _shared_executor_instance
+
+
+def _reset_shared_executor():
+    global _shared_executor_instance, _shared_executor_lock
+    # threads of the parent's pool do not exist in a forked child
+    _shared_executor_instance = None
+    _shared_executor_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_shared_executor)
+
+
+def map_ahead(fn: Callable, items: Iterable, window: int) -> Iterator:
+    """在进程内共享的线程池中对 ``items`` 的每个元素调用 ``fn`` ，按 ``items`` 的顺序返回结果
+
+    同时最多有 ``window`` 个调用在进行，``items`` 可以是生成器，只会比已返回的结果多读取 ``window`` 个元素。
+    ``window`` 不大于 1 时在当前线程中逐个调用。共享线程池最多 ``SHARED_WORKERS`` 个线程，更大的
+    ``window`` 不会带来更多并发。
+
+    Args:
+        fn(callable): 作用于每个元素的函数
+        items(Iterable): 输入
+        window(int): 同时进行的调用数量
+
+    Returns:
+        返回结果的迭代器，``fn`` 抛出的异常在返回对应结果时抛出
+    """
+    if window <= 1:
+        for item in items:
+            yield fn(item)
+        return
+    executor = _shared_executor()
+    in_flight: deque = deque()
+    try:
+        for item in items:
+            if len(in_flight) >= window:
+                yield in_flight.popleft().result()
+            in_flight.append(executor.submit(fn, item))
+        while in_flight:
+            yield in_flight.popleft().result()
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+
+DownloadResult = namedtuple("DownloadResult", ["source", "path", "error"])
+
+
+def split_tos_url(url: str) -> Tuple[str, str]:
+    """把 ``tos://bucket/key`` 拆分为 (bucket, key)
+
+    Raises:
+        ValueError: url 不是 ``tos://`` 开头
+    """
+    parse_result = urlparse(url)
+    if parse_result.scheme != "tos":
+        raise ValueError("invalid scheme. url: " + url)
+    return parse_result.netloc.split(".")[0], parse_result.path[1:]
+
+
+def key_local_path(target_dir_path: str, key: str, allow_root: bool = False) -> str:
+    """返回对象 key 在 ``target_dir_path`` 下对应的本地路径
+
+    Args:
+        target_dir_path(str): 本地目标目录
+        key(str): 对象的 key 或其相对路径
+        allow_root(bool): 为 True 时允许 key 解析为 ``target_dir_path`` 本身，例如目录占位对象
+
+    Returns:
+        返回规范化后的本地路径
+
+    Raises:
+        ValueError: key 为绝对路径，或含有 ``..`` 使路径落在 ``target_dir_path`` 之外
+    """
+    path = os.path.normpath(os.path.join(target_dir_path, key))
+    root = os.path.abspath(target_dir_path)
+    resolved = os.path.abspath(path)
+    # absolute keys replace target_dir_path in os.path.join, ".." segments climb out of it
+    if (
+        os.path.isabs(key)
+        or (resolved == root and not allow_root)
+        or os.path.commonpath([root, resolved]) != root
+    ):
+        raise ValueError(f"key {key!r} resolves outside of {target_dir_path!r}")
+    return path
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class TOSObject(namedtuple("TOSObject", ["bucket", "key", "size", "etag", "last_modified"])):
+    """``iter_objects`` 返回的对象记录，``is_prefix`` 为 True 时表示按 delimiter 分组得到的公共前缀"""
+
+    __slots__ = ()
+
+    @property
+    def is_prefix(self):
+        return self.etag is None
 
 
 class TOSClient:
-    """自动配置环境变量中的用户信息，与TOS 进行交互"""
+    """自动配置环境变量中的用户信息，与TOS 进行交互
+
+    相同认证信息和 endpoint 的 ``TOSClient`` 共享同一个 boto3 client 及连接池，创建开销很小。
+    """
 
-    def __init__(self, credentials=None, session_token=None):
-        """设置认证信息，初始化类变量"""
+    def __init__(
+        self,
+        credentials=None,
+        session_token=None,
+        max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS,
+        tcp_keepalive: bool = True,
+        cache: Optional[ObjectCache] = None,
+        throttle: Optional[TransferThrottle] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+    ):
+        """设置认证信息，初始化类变量
+
+        Args:
+            credentials: 认证信息，默认使用 ``volcengine_ml_platform.get_credentials()``
+            session_token(str): STS 临时凭证的 session token
+            max_pool_connections(int): 连接池的最大连接数，应不小于并发传输的线程数
+            tcp_keepalive(bool): 是否开启 TCP keep-alive
+            cache(ObjectCache): 本地对象缓存，默认使用 ``tos_cache.enable()`` 开启的全局缓存
+            throttle(TransferThrottle): 读写带宽及请求速率限制，默认使用 ``tos_throttle.set_default_throttle()``
+                设置的全局限速
+            retry_policy(RetryPolicy): 所有请求的重试策略（指数退避、full jitter、可重试错误分类及重试预算），
+                默认使用 ``retry.set_default_retry_policy()`` 设置的全局策略；读取对象中途断开时从已收到的
+                最后一个字节续传
+        """
 
-        # ref: https://boto3.amazonaws.com/v1/documentation/api/latest/guide/configuration.html
         if credentials is None:
             credentials = volcengine_ml_platform.get_credentials()
         self.region_name = credentials.region
-        config = {
-            "region_name": credentials.region,
-            "aws_access_key_id": credentials.ak,
-            "aws_secret_access_key": credentials.sk,
-            "endpoint_url": volcengine_ml_platform.get_tos_endpoint_url(),
-        }
-        if session_token is None:
-            session_token = volcengine_ml_platform.get_session_token()
-        if session_token is not None and len(session_token.strip()) > 0:
-            config["aws_session_token"] = session_token
-        self.s3_client = boto3.client("s3", config=Config(
-            s3={'addressing_style': 'virtual'}), **config)
+        config = client_config(credentials, session_token)
+        self.s3_client = get_s3_client(config, max_pool_connections, tcp_keepalive, throttle, retry_policy)
+        self.retry_policy = retry_policy
+        self.cache = cache
         self.dir_record = set()
 
+    def _object_cache(self) -> Optional[ObjectCache]:
+        if self.cache is not None:
+            return self.cache
+        return tos_cache.get_default_cache()
+
     def bucket_exists(self, bucket_name):
         """查询用户的 bucket 是否存在
 
@@ -148,24 +453,90 @@ class TOSClient:
 
         """
         """Delete all of object in the bucket"""
-        while True:
-            object_info = self.list_objects(
-                bucket=bucket,
-                encoding_type="url",
-                delimiter=",",
-                marker="",
-                max_keys=1000,
-                prefix="",
-            )
+        self.delete_objects(bucket)
 
-            if (object_info is None or "Contents" not in object_info or len(object_info["Contents"],) == 0):
-                break
-            for item in object_info["Contents"]:
-                key = item["Key"]
-                self.s3_client.delete_object(
-                    Bucket=bucket,
-                    Key=key,
-                )
+    def delete_objects(
+        self,
+        bucket: str,
+        prefix: str = "",
+        dry_run: bool = False,
+        parallelism: int = 4,
+        concurrency: Optional[AdaptiveConcurrency] = None,
+    ) -> int:
+        """批量删除桶中以 ``prefix`` 开头的所有对象
+
+        每遍历出 1000 个 key 就作为一个 ``DeleteObjects`` 请求提交给线程池，
+        最多同时进行 ``parallelism`` 个删除请求，列举与删除同时进行。
+
+        Args:
+            bucket(str): 桶名
+            prefix(str): 要删除对象的 key 前缀，为空时删除桶中所有对象
+            dry_run(bool): 为 True 时只统计会被删除的对象数量，不做删除
+            parallelism(int): 同时进行的批量删除请求数量
+            concurrency(AdaptiveConcurrency): 自适应并发控制器，指定时代替固定的 ``parallelism``
+
+        Returns:
+            返回删除（dry_run 时为将要删除）的对象数量
+
+        Raises:
+            IOError: 有对象删除失败
+            ClientError: 列举或删除时发生错误
+
+        """
+        if concurrency is None:
+            if parallelism <= 0:
+                raise ValueError("parallelism must be positive")
+            concurrency = AdaptiveConcurrency.fixed(parallelism)
+
+        keys = (record.key for record in self.iter_objects(bucket, prefix=prefix))
+        if dry_run:
+            count = sum(1 for _ in keys)
+            debug("found %d objects under tos://%s/%s", count, bucket, prefix)
+            return count
+        count, failed = self._delete_keys(bucket, keys, concurrency)
+        debug("deleted %d objects under tos://%s/%s", count, bucket, prefix)
+        if failed:
+            raise IOError(f"failed to delete {failed} objects under tos://{bucket}/{prefix}")
+        return count
+
+    def _delete_keys(self, bucket, keys: Iterable[str], concurrency: AdaptiveConcurrency):
+        """以 1000 个 key 为一批并发 DeleteObjects，返回 (删除成功数, 删除失败数)"""
+
+        def delete_batch(batch):
+            try:
+                with tos_concurrency.bind(concurrency):
+                    rsp = self.s3_client.delete_objects(
+                        Bucket=bucket,
+                        Delete={"Objects": [{"Key": k} for k in batch], "Quiet": True},
+                    )
+            except Exception as e:
+                concurrency.release(error=e)
+                raise
+            concurrency.release(len(batch))
+            failed = rsp.get("Errors", [])
+            for e in failed:
+                error("delete object %s failed: %s %s", e.get("Key"), e.get("Code"), e.get("Message"))
+            return len(batch) - len(failed), len(failed)
+
+        count, failed = 0, 0
+        with ThreadPoolExecutor(max_workers=concurrency.max_limit) as pool:
+            futures = []
+            batch = []
+            for key in keys:
+                batch.append(key)
+                if len(batch) == 1000:
+                    # wait for a free slot, so that listing never runs too far ahead
+                    concurrency.acquire()
+                    futures.append(pool.submit(delete_batch, batch))
+                    batch = []
+            if batch:
+                concurrency.acquire()
+                futures.append(pool.submit(delete_batch, batch))
+            for future in futures:
+                deleted, batch_failed = future.result()
+                count += deleted
+                failed += batch_failed
+        return count, failed
 
     def delete_object(self, bucket, key):
         """删除桶的对象，或者说文件
@@ -247,7 +618,128 @@ class TOSClient:
             Prefix=prefix,
         )
 
-    def put_object(self, bucket, key, body):
+    def iter_objects(
+        self,
+        bucket: str,
+        prefix: str = "",
+        delimiter: Optional[str] = None,
+        page_size: int = 1000,
+        fan_out: int = 0,
+    ) -> Iterator[TOSObject]:
+        """惰性遍历桶里以 ``prefix`` 开头的所有对象
+
+        自动处理分页，在调用方消费当前页时后台线程已经在拉取下一页。
+
+        Args:
+            bucket(str): 桶名
+            prefix(str): 限制返回对象的 key 前缀
+            delimiter(str): 分组 key 的字符，设置后同一分组只返回一个 ``is_prefix`` 为 True 的记录
+            page_size(int): 每次列举请求返回的 key 数量上限，最大 1000
+            fan_out(int): 大于 0 且未设置 delimiter 时，先按 "/" 列出 ``prefix`` 下的一级子目录，
+                再用 ``fan_out`` 个线程并发遍历各个子目录，适用于非常宽的桶；此时返回顺序不再按 key 排序
+
+        Returns:
+            返回 ``TOSObject`` 的迭代器
+
+        Raises:
+            ClientError: 列举时发生错误
+
+        """
+        if fan_out > 0 and not delimiter:
+            return self._iter_objects_fan_out(bucket, prefix, page_size, fan_out)
+        return self._iter_pages(bucket, prefix, delimiter, page_size)
+
+    def _iter_pages(self, bucket, prefix, delimiter, page_size):
+        kwargs = {"Bucket": bucket, "Prefix": prefix, "MaxKeys": page_size}
+        if delimiter:
+            kwargs["Delimiter"] = delimiter
+
+        def fetch(marker):
+            return self.s3_client.list_objects(Marker=marker, **kwargs)
+
+        prefetcher = ThreadPoolExecutor(max_workers=1)
+        try:
+            future = prefetcher.submit(fetch, "")
+            while future is not None:
+                res = future.result()
+                contents = res.get("Contents", list())
+                prefixes = res.get("CommonPrefixes", list())
+                future = None
+                if res.get("IsTruncated") and (contents or prefixes):
+                    last = max(
+                        contents[-1]["Key"] if contents else "",
+                        prefixes[-1]["Prefix"] if prefixes else "",
+                    )
+                    future = prefetcher.submit(fetch, res.get("NextMarker") or last)
+
+                records = [
+                    TOSObject(bucket, c["Key"], c["Size"], c["ETag"], c["LastModified"])
+                    for c in contents
+                ]
+                if prefixes:
+                    records.extend(
+                        TOSObject(bucket, p["Prefix"], 0, None, None) for p in prefixes
+                    )
+                    records.sort(key=lambda record: record.key)
+                yield from records
+        finally:
+            prefetcher.shutdown(wait=False)
+
+    def _iter_objects_fan_out(self, bucket, prefix, page_size, fan_out):
+        top_level = []
+        for record in self._iter_pages(bucket, prefix, "/", page_size):
+            if record.is_prefix:
+                top_level.append(record.key)
+            else:
+                yield record
+        if not top_level:
+            return
+
+        results: queue.Queue = queue.Queue(maxsize=page_size * fan_out)
+        stopped = threading.Event()
+        finished = object()
+
+        def walk(sub_prefix):
+            try:
+                if stopped.is_set():
+                    return
+                for record in self._iter_pages(bucket, sub_prefix, None, page_size):
+                    if stopped.is_set():
+                        return
+                    results.put(record)
+            except Exception as e:
+                results.put(e)
+            finally:
+                results.put(finished)
+
+        with ThreadPoolExecutor(max_workers=fan_out) as pool:
+            for sub_prefix in top_level:
+                pool.submit(walk, sub_prefix)
+            remaining = len(top_level)
+            try:
+                while remaining:
+                    item = results.get()
+                    if item is finished:
+                        remaining -= 1
+                    elif isinstance(item, Exception):
+                        raise item
+                    else:
+                        yield item
+            finally:
+                stopped.set()
+                # unblock producers waiting on a full queue
+                while remaining:
+                    if results.get() is finished:
+                        remaining -= 1
+
+    def put_object(
+        self,
+        bucket,
+        key,
+        body,
+        compression: Optional[str] = None,
+        compression_level: Optional[int] = None,
+    ):
         """上传对象到 bucket
 
         大小不应该超过 5MB；更推荐用 ``upload_file``
@@ -256,103 +748,241 @@ class TOSClient:
             bucket(str): 上传 bucket 的名
             key(str): 上传 object 的 key，比如 key=``put/you/path/xxxx/yyy``
             body(str): file-like object, 比如 ``with open(flie, "rb") as f``
+            compression(str): ``gzip`` 或 ``zstd`` ，压缩后上传，读取时自动解压，详见 ``tos_compression``
+            compression_level(int): 压缩级别，默认使用各编码的默认级别
 
         Returns:
             返回一个上传结果的 dict
 
         """
         """Upload single object, object size should not exceed 5MB"""
-        return self.s3_client.put_object(Bucket=bucket, Key=key, Body=body)
+        if compression is None:
+            return self.s3_client.put_object(Bucket=bucket, Key=key, Body=body)
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        elif not isinstance(body, (bytes, bytearray, memoryview)):
+            body = body.read()
+        return self.s3_client.put_object(
+            Bucket=bucket,
+            Key=key,
+            Body=tos_compression.compress_bytes(body, compression, compression_level),
+            Metadata=tos_compression.metadata(compression, len(body)),
+        )
 
-    def get_object(self, bucket, key):
+    def get_object(self, bucket, key, etag: Optional[str] = None):
         """获取 bucket 一个对象
 
+        开启对象缓存时，缓存以对象的 ETag 区分版本，每次读取都会先发一次 HEAD 请求获取最新的 ETag，
+        命中缓存也不例外；已经知道 ETag（比如来自 ``list_objects`` 的结果）时传入 ``etag`` 可以省掉这次请求。
+
         Args:
             bucket(str):  bucket 名
             key(str):  对应 object 的 key
+            etag(str): 对象的 ETag，仅在开启对象缓存时使用，默认通过 HEAD 请求获取
 
         Returns:
-            返回一个下载结果的 dict
+            返回一个可 ``read()`` 、 ``close()`` 的 file-like 对象；开启对象缓存时为缓存文件的文件对象
 
         """
         """Download single object"""
-        return self.s3_client.get_object(Bucket=bucket, Key=key)["Body"]
+        cache = self._object_cache()
+        if cache is not None:
+            if etag is None:
+                etag = self.s3_client.head_object(Bucket=bucket, Key=key)["ETag"]
+            return cache.open(
+                bucket,
+                key,
+                etag,
+                lambda tmp_path: self._download_object_direct(bucket, key, tmp_path, etag=etag),
+            )
+        stream, _ = self._open_object(bucket, key)
+        return stream
+
+    def read_into(
+        self,
+        bucket: str,
+        key: str,
+        buffer,
+        offset: int = 0,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+    ) -> int:
+        """把对象内容直接读入调用方提供的缓冲区，不产生中间的 ``bytes`` 对象
+
+        Args:
+            bucket(str): bucket 名
+            key(str): object 的 key
+            buffer: 可写的缓冲区，比如 ``bytearray`` 、 ``memoryview`` 或 C 连续的 NumPy 数组
+            offset(int): 写入缓冲区的起始字节位置
+            start(int): Range 读取的起始字节（包含），为 None 时从头读取
+            end(int): Range 读取的结束字节（包含），为 None 时读到结尾
+
+        Returns:
+            返回写入的字节数
+
+        Raises:
+            ValueError: 缓冲区剩余空间不足以容纳对象内容
+
+        """
+        view = memoryview(buffer).cast("B")[offset:]
+        stream, length = self._open_range(bucket, key, start, end)
+        try:
+            if length is None:
+                # compressed object without a recorded size
+                n = readinto_full(stream, view)
+                if n == len(view) and stream.read(1):
+                    raise ValueError(f"buffer too small for {bucket}/{key}: {len(view)} bytes available")
+                return n
+            if length > len(view):
+                raise ValueError(
+                    f"buffer too small for {bucket}/{key}: need {length} bytes, {len(view)} available",
+                )
+            n = readinto_full(stream, view[:length])
+        finally:
+            stream.close()
+        if n != length:
+            raise IOError(f"short read on {bucket}/{key}: expected {length} bytes, got {n}")
+        return n
+
+    def get_object_view(
+        self,
+        bucket: str,
+        key: str,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+    ) -> MemoryViewReader:
+        """读取对象到一块新分配的缓冲区，返回基于它的只读 file-like 对象
+
+        返回值可以直接传给 ``PIL.Image.open`` 等接受文件对象的解码函数；``getbuffer()`` 返回底层的
+        memoryview，可以用 ``np.frombuffer`` 零拷贝地转换为 NumPy 数组。
+
+        Args:
+            bucket(str): bucket 名
+            key(str): object 的 key
+            start(int): Range 读取的起始字节（包含）
+            end(int): Range 读取的结束字节（包含）
+
+        Returns:
+            返回 ``MemoryViewReader``
+
+        """
+        stream, length = self._open_range(bucket, key, start, end)
+        if length is None:
+            # compressed object without a recorded size
+            with stream:
+                return MemoryViewReader(bytearray(stream.read()))
+        buffer = bytearray(length)
+        try:
+            n = readinto_full(stream, memoryview(buffer))
+        finally:
+            stream.close()
+        if n != length:
+            raise IOError(f"short read on {bucket}/{key}: expected {length} bytes, got {n}")
+        return MemoryViewReader(buffer)
+
+    def _open_range(self, bucket, key, start=None, end=None):
+        """打开对象（或其中一段）用于流式读取，返回 (stream, 字节数)"""
+        cache = self._object_cache()
+        if cache is not None:
+            f = self.get_object(bucket, key)
+            size = os.fstat(f.fileno()).st_size
+            first = start or 0
+            last = size - 1 if end is None else min(end, size - 1)
+            f.seek(first)
+            return f, max(0, last - first + 1)
+        return self._open_object(bucket, key, start, end)
+
+    def _open_object(self, bucket, key, start=None, end=None, etag=None):
+        """直接从 TOS 打开对象（或其中一段），压缩过的对象自动解压，返回 (stream, 字节数)
+
+        压缩对象的字节数取自元数据，没有记录时为 None
+        """
+        ranged = start is not None or end is not None
+        try:
+            stream = ResumableStream(
+                self.s3_client, bucket, key, start or 0, end, etag=etag, retry_policy=self.retry_policy,
+            )
+            response = stream.response
+        except ClientError as e:
+            # the range may lie beyond the compressed size of a compressed object
+            if not ranged or e.response.get("Error", {}).get("Code") != "InvalidRange":
+                raise
+            response = self.s3_client.head_object(Bucket=bucket, Key=key)
+            if not tos_compression.codec_of(response):
+                raise
+            stream = None
+            etag = etag or response["ETag"]
+        codec = tos_compression.codec_of(response)
+        if not codec:
+            return stream, stream.length
+        size = tos_compression.uncompressed_size(response)
+        if ranged:
+            # the range applies to the uncompressed content, decode from the beginning
+            if stream is not None:
+                etag = stream.etag
+                stream.close()
+            stream = ResumableStream(self.s3_client, bucket, key, etag=etag, retry_policy=self.retry_policy)
+        if size is not None:
+            end = size - 1 if end is None else min(end, size - 1)
+        reader = tos_compression.DecompressingReader(stream, codec, size, start or 0, end)
+        return reader, reader.length
 
     def upload_file_low_level(
         self,
         file_path,
         bucket,
         key=None,
-        part_size=20971520,
+        part_size=DEFAULT_PART_SIZE,
+        max_concurrence: int = 10,
+        checkpoint_path: Optional[str] = None,
+        abort_on_failure: bool = True,
     ):
         """相比 upload_file，更精细化的上传文件方式
 
+        大于 ``part_size`` 的文件使用分片上传：分片被读入可复用的缓冲区后并发上传，内存占用不超过
+        ``max_concurrence * part_size`` 。已完成的分片记录在 checkpoint 文件中，中断后再次调用会通过
+        ``list_parts`` 跳过服务端已有的分片。
+
         Args:
             file_path(str): 上传文件的路径
             bucket(str): 上传 bucket 名
             key(str): 上传 object 的 key
-            part_size(str): 切片上传的 size
+            part_size(str): 切片上传的 size，不能小于 5MiB
+            max_concurrence(int): 同时上传的分片数量
+            checkpoint_path(str): 断点续传的 checkpoint 文件路径，默认保存在
+                ``~/.volcengine_ml_platform/upload_checkpoints/`` 下
+            abort_on_failure(bool): 上传失败时是否终止分片上传；设为 False 时保留已上传分片，以便之后续传
+
+        Returns:
+            返回上传结果的 dict，包含 ``ETag``
+
+        Raises:
+            ClientError: 上传时发生错误
 
         """
-        """Implemented with low level S3 API, edit for desired info"""
-        file_size = os.path.getsize(file_path)
-        threshold = 5242880
         # if the key is not set, use file_path instead
         if key is None:
             key = file_path
-        # if file size <= 25MB, upload single file
-        if file_size <= part_size + threshold:
-            with open(file_path, mode="rb", encoding="utf-8") as file:
-                self.s3_client.upload_fileobj(file, bucket, key)
-        # otherwise
-        else:
-            # if the last part is smaller than 5MB
-            # combine it with previous part
-            part_number = 0
-            if file_size % part_size <= threshold:
-                part_number = math.floor(float(file_size) % float(part_size))
-            else:
-                part_number = math.ceil(float(file_size) % float(part_size))
-
-            # start multipart upload
-            rsp = self.s3_client.create_multipart_upload(
-                Bucket=bucket,
-                Key=key,
-            )
-            debug("Multipart upload initiated: %s", rsp)
-
-            upload_id = rsp["UploadId"]
-            uploaded_parts = {"Parts": []}
-            with open(file_path, mode="rb", encoding="utf-8") as file:
-                # upload parts
-                for i in range(1, part_number + 1):
-                    read_size = min(part_size, file_size - (i - 1) * part_size)
-                    read_size = max(-1, read_size)
-                    body = file.read(read_size)  # 20MiB
-                    if body == b"":
-                        break
-                    rsp = self.s3_client.upload_part(
-                        Bucket=bucket,
-                        Key=key,
-                        PartNumber=i,
-                        UploadId=upload_id,
-                        Body=body,
-                    )
-
-                    uploaded_parts["Parts"].append({
-                        "PartNumber": i,
-                        "ETag": rsp["ETag"],
-                    },)
-            # upload complete
-            rsp = self.s3_client.complete_multipart_upload(
-                Bucket=bucket,
-                Key=key,
-                UploadId=upload_id,
-                MultipartUpload=uploaded_parts,
-            )
-            debug("Multipart upload completed: %s", rsp)
+        uploader = MultipartUploader(
+            self.s3_client,
+            part_size=part_size,
+            max_concurrence=max_concurrence,
+            checkpoint_path=checkpoint_path,
+            abort_on_failure=abort_on_failure,
+        )
+        return uploader.upload(file_path, bucket, key)
 
-    def upload_file(self, file_path, bucket, key=None, part_size=20971520):
+    def upload_file(
+        self,
+        file_path,
+        bucket,
+        key=None,
+        part_size=20971520,
+        max_concurrence: int = 10,
+        callback: Optional[Callable[[int], None]] = None,
+        compression: Optional[str] = None,
+        compression_level: Optional[int] = None,
+    ):
         """上传文件到 bucket
 
         Args:
@@ -360,21 +990,45 @@ class TOSClient:
             bucket(str): 上传 bucket 名
             key(str): 上传 object 的 key，比如 key="put/you/path/xxxx/yyy"
             part_size(str): 切片上传的 size
+            max_concurrence(int): 切片上传时同时上传的分片数量
+            callback(callable): 上传进度回调，参数为本次新上传的字节数，压缩时为压缩后的字节数
+            compression(str): ``gzip`` 或 ``zstd`` ，先流式压缩到临时文件再上传，读取时自动解压
+            compression_level(int): 压缩级别，默认使用各编码的默认级别
 
         """
         if key is None:
             key = file_path
         # Set the desired multipart threshold value (20MB)
-        transfer_config = TransferConfig(multipart_threshold=part_size)
-
-        # Perform the transfer
-        self.s3_client.upload_file(
-            file_path,
-            bucket,
-            key,
-            Config=transfer_config,
+        transfer_config = TransferConfig(
+            multipart_threshold=part_size,
+            multipart_chunksize=part_size,
+            max_concurrency=max_concurrence,
         )
 
+        if compression is None:
+            # Perform the transfer
+            self.s3_client.upload_file(
+                file_path,
+                bucket,
+                key,
+                Config=transfer_config,
+                Callback=callback,
+            )
+            return
+
+        tmp_path = tos_compression.compress_to_tempfile(file_path, compression, compression_level)
+        try:
+            self.s3_client.upload_file(
+                tmp_path,
+                bucket,
+                key,
+                Config=transfer_config,
+                Callback=callback,
+                ExtraArgs={"Metadata": tos_compression.metadata(compression, os.path.getsize(file_path))},
+            )
+        finally:
+            os.remove(tmp_path)
+
     def download_file(
         self,
         bucket: str = "",
@@ -383,6 +1037,7 @@ class TOSClient:
         target_file_path: str = "",
         target_dir_path: str = "",
         max_concurrence: int = 10,
+        chunk_size: int = 0,
     ) -> str:
         """下载TOS对象到本地
 
@@ -409,17 +1064,16 @@ class TOSClient:
             file_path(str): 本地保存的目标文件路径
             dir_path(str): 本地保存的目标目录路径
             max_concurrence(int): 最大并发数量，控制下载速度
+            chunk_size(int): 大于 0 时使用内置的分片并发下载引擎，按该大小切分 Range GET，
+                支持断点续传，详见 ``download_file_ranged``
         Returns:
             返回下载文件路径
 
         Raises:
-            ValueError: 参数填写错误
+            ValueError: 参数填写错误，或 key 使 ``target_dir_path`` 下的目标路径落在该目录之外
 
         """
 
-        # To consume less downstream bandwidth, decrease the maximum concurrency
-        transfer_config = TransferConfig(max_concurrency=max_concurrence)
-
         if (not bucket or not key) and not tos_url:
             raise ValueError("Please assign a set of value as non-None")
 
@@ -427,26 +1081,151 @@ class TOSClient:
             raise ValueError("Please set a correct dir_path or file_path")
 
         if tos_url:
-            parse_result = urlparse(tos_url)
-            if parse_result.scheme != "tos":
-                raise ValueError("invalid scheme. url: " + tos_url)
-            bucket = parse_result.netloc.split(".")[0]
-            key = parse_result.path[1:]
+            bucket, key = split_tos_url(tos_url)
 
         if not target_file_path:
-            target_file_path = os.path.join(target_dir_path, key)
+            target_file_path = key_local_path(target_dir_path, key)
         else:
             target_dir_path = os.path.dirname(target_file_path)
         self._create_dir(os.path.dirname(target_file_path))
 
         debug("download file: bucket %s, key %s", bucket, key)
-        self.s3_client.download_file(
+        return self._download_object(
             bucket,
             key,
             target_file_path,
-            Config=transfer_config,
+            chunk_size=chunk_size,
+            max_concurrence=max_concurrence,
+        )
+
+    def _download_object(
+        self,
+        bucket,
+        key,
+        target_file_path,
+        chunk_size=0,
+        max_concurrence=10,
+        etag=None,
+    ):
+        """下载单个对象，开启对象缓存时从缓存读取"""
+        cache = self._object_cache()
+        if cache is None:
+            return self._download_object_direct(bucket, key, target_file_path, chunk_size, max_concurrence)
+        if etag is None:
+            etag = self.s3_client.head_object(Bucket=bucket, Key=key)["ETag"]
+        return cache.copy_to(
+            bucket,
+            key,
+            etag,
+            lambda tmp_path: self._download_object_direct(
+                bucket, key, tmp_path, chunk_size, max_concurrence, etag,
+            ),
+            target_file_path,
+        )
+
+    def _download_object_direct(
+        self,
+        bucket,
+        key,
+        target_file_path,
+        chunk_size=0,
+        max_concurrence=10,
+        etag=None,
+    ):
+        if chunk_size > 0:
+            return self.download_file_ranged(
+                bucket,
+                key,
+                target_file_path,
+                chunk_size=chunk_size,
+                max_concurrence=max_concurrence,
+                etag=etag,
+            )
+        # the first GET only covers the first chunk: it is the whole of a small object, and tells the size
+        # and the compression of a large one, whose remaining chunks are then fetched without a wasted GET
+        # with an ETag the content is pinned to the version it is cached under
+        try:
+            first = ResumableStream(
+                self.s3_client, bucket, key, 0, SINGLE_GET_THRESHOLD - 1, etag=etag, retry_policy=self.retry_policy,
+            )
+        except ClientError as e:
+            # an empty object has no first byte
+            if e.response.get("Error", {}).get("Code") != "InvalidRange":
+                raise
+            stream, _ = self._open_object(bucket, key, etag=etag)
+            with stream:
+                save_stream(stream, target_file_path)
+            return target_file_path
+
+        with first:
+            codec = tos_compression.codec_of(first.response)
+            if codec:
+                # compressed content is decoded sequentially, continue after the bytes already requested
+                def parts():
+                    yield first
+                    if first.size > first.length:
+                        yield ResumableStream(
+                            self.s3_client, bucket, key, first.length, etag=first.etag, retry_policy=self.retry_policy,
+                        )
+
+                stream = tos_compression.DecompressingReader(
+                    ChainedStream(parts()), codec, tos_compression.uncompressed_size(first.response),
+                )
+                with stream:
+                    save_stream(stream, target_file_path)
+                return target_file_path
+            if first.size <= first.length:
+                save_stream(first, target_file_path)
+                return target_file_path
+            # large plain object: the remaining chunks are fetched with concurrent ranged GETs
+            downloader = RangedDownloader(
+                self.s3_client,
+                chunk_size=SINGLE_GET_THRESHOLD,
+                max_concurrence=max_concurrence,
+                retry_policy=self.retry_policy,
+            )
+            # a one-shot download: no resume state, size and ETag come from the first response
+            return downloader.download(bucket, key, target_file_path, first_chunk=first, resume=False)
+
+    def download_file_ranged(
+        self,
+        bucket: str,
+        key: str,
+        target_file_path: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_concurrence: int = 10,
+        etag: Optional[str] = None,
+    ) -> str:
+        """分片并发下载TOS对象到本地，适用于 GB 级别的大文件
+
+        对象被切分为 ``chunk_size`` 大小的分片，并发发起 Range GET 直接写入预分配的本地文件。
+        下载过程中的数据保存在 ``target_file_path + ".part"`` ，完成的分片记录在
+        ``target_file_path + ".part.json"`` ，进程崩溃后重新调用会跳过已完成的分片。
+
+        Args:
+            bucket(str): bucket 名
+            key(str): object 的 key
+            target_file_path(str): 本地保存的目标文件路径
+            chunk_size(int): 分片大小，默认 8MiB
+            max_concurrence(int): 同时进行的 Range GET 数量
+            etag(str): 指定时只下载该版本的对象
+
+        Returns:
+            返回下载文件路径
+
+        Raises:
+            IOError: 下载后的文件大小与对象大小不一致
+            ClientError: 对象的 ETag 与 ``etag`` 不一致，或下载过程中对象发生了变化（``PreconditionFailed``）等服务端错误
+
+        """
+        self._create_dir(os.path.dirname(target_file_path))
+        downloader = RangedDownloader(
+            self.s3_client,
+            chunk_size=chunk_size,
+            max_concurrence=max_concurrence,
+            retry_policy=self.retry_policy,
         )
-        return target_file_path
+        return downloader.download(bucket, key, target_file_path, etag=etag)
 
     def _create_dir(self, dir_path):
         """创建路径缓冲
@@ -456,11 +1235,13 @@ class TOSClient:
             dir_path(str): 下载路径
         """
         if dir_path not in self.dir_record:
-            self.dir_record.add(dir_path)
             try:
                 os.makedirs(dir_path, exist_ok=True)
             except OSError:
                 warning("Cannot create download directory: %s", dir_path)
+            else:
+                # record only once it exists, other threads skip makedirs based on it
+                self.dir_record.add(dir_path)
         return dir_path
 
     def download_files(
@@ -471,6 +1252,7 @@ class TOSClient:
         target_file_paths: list = [],
         target_dir_path: str = "",
         parallelism=1,
+        concurrency: Optional[AdaptiveConcurrency] = None,
     ) -> List[str]:
         """下载多个TOS对象到本地
 
@@ -498,6 +1280,7 @@ class TOSClient:
             target_file_paths(list): 本地保存的目标路径的列表，与 keys 或者 tos_urls 一一对应
             target_dir_path(str): 本地保存的目标目录
             parallelism(int): 并发数量，控制下载速度
+            concurrency(AdaptiveConcurrency): 自适应并发控制器，指定时代替固定的 ``parallelism``
 
         Returns:
             返回下载文件集路径的 list
@@ -513,83 +1296,220 @@ class TOSClient:
         if not target_file_paths and not target_dir_path:
             raise ValueError("Please set a correct dir_path or file_path")
 
-        self.dir_record = set()
-        async_res = []
+        sources = tos_urls if tos_urls else keys
+        if target_file_paths:
+            items = zip(sources, target_file_paths)
+        else:
+            items = iter(sources)
+
+        ret: List[str] = [""] * len(sources)
+        for idx, result in enumerate(tqdm(
+            self.iter_download_files(
+                items,
+                bucket=bucket,
+                target_dir_path=target_dir_path,
+                parallelism=parallelism,
+                ordered=True,
+                concurrency=concurrency,
+            ),
+            total=len(sources),
+        )):
+            if result.error is not None:
+                raise result.error
+            ret[idx] = result.path
+        return ret
 
-        pool = Pool(processes=parallelism)
+    def iter_download_files(
+        self,
+        items: Iterable,
+        bucket: str = "",
+        target_dir_path: str = "",
+        parallelism: int = 10,
+        ordered: bool = False,
+        concurrency: Optional[AdaptiveConcurrency] = None,
+    ) -> Iterator[DownloadResult]:
+        """流式下载任意多个 TOS 对象，每下载完一个就返回一个结果
 
-        data_count = len(keys) if keys else len(tos_urls)
-        download_dicts: list = [{} for _ in range(data_count)]
+        ``items`` 可以是任意可迭代对象（包括生成器），每个元素为以下形式之一：
 
-        if tos_urls:
-            for idx, url in enumerate(tos_urls):
-                download_dicts[idx]["tos_url"] = url
-        else:
-            for idx, key in enumerate(keys):
-                download_dicts[idx]["bucket"] = bucket
-                download_dicts[idx]["key"] = key
+        - ``key`` ，需同时指定 ``bucket``
+        - ``tos_url`` ，比如 ``tos://bucket/key``
+        - ``(key 或 tos_url, target_file_path)`` 元组
 
-        if target_dir_path:
-            for dict in download_dicts:
-                dict["target_dir_path"] = target_dir_path
-        else:
-            for idx, target_file_path in enumerate(target_file_paths):
-                download_dicts[idx]["target_file_path"] = target_file_path
-
-        for idx in range(data_count):
-            async_res.append(pool.apply_async(
-                self.download_file,
-                kwds=download_dicts[idx],
-            ),)
-
-        pool.close()
-        ret = [res.get() for res in tqdm(async_res)]
-        pool.join()
-        return ret
+        任务提交到进程内共享的长期线程池，同时最多有 ``parallelism`` 个下载在进行，内存占用与 ``items``
+        的总数无关。单个对象下载失败不会中断整批下载，错误记录在对应结果的 ``error`` 中。
 
-    def download_dir(self, bucket, key, prefix, local_dir):
-        marker = ""
-        while True:
-            res = self.s3_client.list_objects(
-                Bucket=bucket,
-                Delimiter="/",
-                EncodingType="",
-                Marker=marker,
-                MaxKeys=1000,
-                Prefix=key,
-            )
-            keys = [content["Key"] for content in res.get("Contents", list())]
-            dirs = [content["Prefix"]
-                    for content in res.get("CommonPrefixes", list())]
-
-            for d in dirs:
-                debug(f"processing dir: {d}")
-                dest_pathname = os.path.join(
-                    local_dir, os.path.relpath(d, prefix) + "/")
-                debug(f"dest_pathname: {dest_pathname}")
-                if not os.path.exists(os.path.dirname(dest_pathname)):
-                    os.makedirs(os.path.dirname(dest_pathname))
-                    debug(f"make dir: {dest_pathname}")
-                self.download_dir(bucket, d, prefix, local_dir)
-
-            for k in keys:
-                debug(f"processing file: {k}")
-                dest_pathname = os.path.join(
-                    local_dir, os.path.relpath(k, prefix))
-                debug(f"dest_pathname: {dest_pathname}")
-                if not os.path.exists(os.path.dirname(dest_pathname)):
-                    os.makedirs(os.path.dirname(dest_pathname))
-                    debug(f"make dir: {dest_pathname}")
-
-                if not os.path.isdir(dest_pathname):
-                    self.s3_client.download_file(bucket, k, dest_pathname)
-
-            if res["IsTruncated"]:
-                marker = res["Contents"][-1]["Key"]
-                continue
-            break
-
-    def upload(self, local_path, bucket, prefix):
+        Args:
+            items(Iterable): 要下载的对象
+            bucket(str): ``items`` 为 key 时所在的 bucket
+            target_dir_path(str): 未指定 target_file_path 时保存的目标目录，文件名为对应的 key
+            parallelism(int): 同时进行的下载数量
+            ordered(bool): 为 True 时按 ``items`` 的顺序返回结果，否则按完成顺序返回
+            concurrency(AdaptiveConcurrency): 自适应并发控制器，指定时代替固定的 ``parallelism``
+
+        Returns:
+            返回 ``DownloadResult(source, path, error)`` 的迭代器
+
+        """
+        if concurrency is None:
+            if parallelism <= 0:
+                raise ValueError("parallelism must be positive")
+            concurrency = AdaptiveConcurrency.fixed(parallelism)
+        executor = _shared_executor()
+
+        def download(item):
+            target_file_path = ""
+            if isinstance(item, tuple):
+                item, target_file_path = item
+            kwargs = {"target_file_path": target_file_path, "target_dir_path": target_dir_path}
+            if item.startswith("tos://"):
+                kwargs["tos_url"] = item
+            else:
+                kwargs["bucket"] = bucket
+                kwargs["key"] = item
+            try:
+                with tos_concurrency.bind(concurrency):
+                    path = self.download_file(**kwargs)
+            except Exception as e:
+                debug("download %s failed: %s", item, e)
+                concurrency.release(error=e)
+                return DownloadResult(item, "", e)
+            concurrency.release(_file_size(path))
+            return DownloadResult(item, path, None)
+
+        def reserve():
+            # block only when nothing of ours is running, otherwise keep yielding results
+            if in_flight:
+                return concurrency.try_acquire()
+            concurrency.acquire()
+            return True
+
+        items = iter(items)
+        exhausted = False
+        in_flight: deque = deque()
+        try:
+            while True:
+                while not exhausted and reserve():
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        concurrency.cancel()
+                        break
+                    in_flight.append(executor.submit(download, item))
+                if not in_flight:
+                    return
+                if ordered:
+                    yield in_flight.popleft().result()
+                    continue
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    in_flight.remove(future)
+                    yield future.result()
+        finally:
+            for future in in_flight:
+                if future.cancel():
+                    concurrency.cancel()
+
+    def download_dir(
+        self,
+        bucket,
+        key,
+        prefix,
+        local_dir,
+        parallelism: int = 10,
+        queue_size: int = 1000,
+        concurrency: Optional[AdaptiveConcurrency] = None,
+    ):
+        """下载 TOS 上一个前缀（目录）下的所有对象到本地目录
+
+        列举和下载以流水线方式进行：不带 delimiter 平铺分页列举 ``key`` 前缀下的对象，
+        把 key 放入有界队列，由 ``parallelism`` 个线程并发下载，列举下一页的同时已经在下载上一页。
+
+        Args:
+            bucket(str): bucket 名
+            key(str): 要下载的对象前缀
+            prefix(str): 计算本地相对路径时去掉的前缀，本地路径为 ``local_dir/relpath(object_key, prefix)``
+            local_dir(str): 本地保存的目标目录
+            parallelism(int): 并发下载的线程数量
+            queue_size(int): 列举与下载之间的队列长度上限，控制内存占用
+            concurrency(AdaptiveConcurrency): 自适应并发控制器，指定时代替固定的 ``parallelism`` ，
+                启动 ``concurrency.max_limit`` 个下载线程，同时下载的数量由控制器决定
+
+        Raises:
+            ClientError: 列举或下载对象时发生错误
+
+        """
+        if concurrency is None:
+            if parallelism <= 0:
+                raise ValueError("parallelism must be positive")
+            concurrency = AdaptiveConcurrency.fixed(parallelism)
+        tasks: queue.Queue = queue.Queue(maxsize=queue_size)
+        errors = []
+
+        def consume():
+            while True:
+                record = tasks.get()
+                if record is None:
+                    return
+                if errors:
+                    # drain the queue so that the producer never blocks
+                    continue
+                concurrency.acquire()
+                try:
+                    with tos_concurrency.bind(concurrency):
+                        self._download_dir_object(record, prefix, local_dir)
+                except Exception as e:
+                    concurrency.release(error=e)
+                    errors.append(e)
+                else:
+                    concurrency.release(record.size)
+
+        workers = [
+            threading.Thread(target=consume, daemon=True)
+            for _ in range(concurrency.max_limit)
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            for record in self.iter_objects(bucket, prefix=key):
+                if errors:
+                    break
+                tasks.put(record)
+        finally:
+            for _ in workers:
+                tasks.put(None)
+            for worker in workers:
+                worker.join()
+        if errors:
+            raise errors[0]
+
+    def _download_dir_object(self, record, prefix, local_dir):
+        debug("processing file: %s", record.key)
+        is_dir = record.key.endswith("/")
+        dest_pathname = key_local_path(local_dir, os.path.relpath(record.key, prefix), allow_root=is_dir)
+        if is_dir:
+            # directory placeholder object
+            self._create_dir(dest_pathname)
+            return
+        self._create_dir(os.path.dirname(dest_pathname))
+        if not os.path.isdir(dest_pathname):
+            debug("dest_pathname: %s", dest_pathname)
+            self._download_object(record.bucket, record.key, dest_pathname, etag=record.etag)
+
+    def upload(self, local_path, bucket, prefix, parallelism: int = 10):
+        """上传本地文件或目录到 TOS
+
+        Args:
+            local_path(str): 本地文件或目录路径，目录会以其目录名作为一级前缀上传
+            bucket(str): 上传 bucket 名
+            prefix(str): 上传 object 的 key 前缀
+            parallelism(int): 上传目录时的并发数量，详见 ``upload_dir``
+
+        Returns:
+            返回上传后的 tos 路径，比如 ``tos://bucket/prefix/``
+
+        """
         if os.path.isfile(local_path):
             key = f"{prefix}{os.path.basename(local_path)}"
             self.upload_file(local_path, bucket, key=key)
@@ -598,14 +1518,245 @@ class TOSClient:
             self_prefix = os.path.basename(local_path.rstrip("/"))
             if self_prefix != ".":
                 prefix = f"{prefix}{self_prefix}/"
-
-            for root, _, files in os.walk(local_path):
-                for file in tqdm(files):
-                    file_path = os.path.join(root, file)
-                    rel_path = os.path.relpath(root, local_path)
-                    if rel_path == ".":
-                        key = f"{prefix}{file}"
-                    else:
-                        key = f"{prefix}{rel_path}/{file}"
-                    self.upload_file(file_path, bucket, key=key)
+            self.upload_dir(local_path, bucket, prefix, parallelism=parallelism)
         return f"tos://{bucket}/{prefix}"
+
+    def upload_dir(
+        self,
+        local_dir: str,
+        bucket: str,
+        prefix: str,
+        parallelism: int = 10,
+        part_size: int = 20971520,
+        concurrency: Optional[AdaptiveConcurrency] = None,
+        compression: Optional[str] = None,
+    ) -> List[dict]:
+        """并发上传本地目录下的所有文件到 ``prefix`` 下
+
+        小于 ``part_size`` 的文件通过线程池并发 ``put_object`` 上传；大文件逐个进行切片上传，
+        每个文件同时上传 ``parallelism`` 个分片，与小文件的上传同时进行。进度条按字节统计所有文件的总进度。
+
+        Args:
+            local_dir(str): 本地目录
+            bucket(str): 上传 bucket 名
+            prefix(str): 上传 object 的 key 前缀，文件的 key 为 ``prefix + 相对 local_dir 的路径``
+            parallelism(int): 小文件并发上传的线程数，以及大文件并发上传的分片数
+            part_size(int): 切片上传的阈值及分片大小
+            concurrency(AdaptiveConcurrency): 小文件上传的自适应并发控制器，指定时代替固定的 ``parallelism``
+            compression(str): ``gzip`` 或 ``zstd`` ，压缩后上传，清单中的 Size 为压缩前的大小
+
+        Returns:
+            返回上传清单 ``list[dict]`` ，按 key 排序，比如：::
+
+                [
+                    {
+                        'Key': 'prefix/saved_model.pb',
+                        'ETag': '"5d41402abc4b2a76b9719d911017c592"',
+                        'Size': 123,
+                        'LocalPath': 'model/saved_model.pb'
+                    },
+                ]
+
+        Raises:
+            ClientError: 上传时发生错误
+
+        """
+        if parallelism <= 0:
+            raise ValueError("parallelism must be positive")
+        files = []
+        for root, _, names in os.walk(local_dir):
+            rel_path = os.path.relpath(root, local_dir)
+            for file in names:
+                file_path = os.path.join(root, file)
+                if rel_path == ".":
+                    key = f"{prefix}{file}"
+                else:
+                    key = f"{prefix}{rel_path}/{file}"
+                files.append((file_path, key, os.path.getsize(file_path)))
+        manifest = self._upload_files(bucket, files, parallelism, part_size, concurrency, compression)
+        debug("uploaded %d files to tos://%s/%s", len(manifest), bucket, prefix)
+        return manifest
+
+    def _upload_files(
+        self,
+        bucket,
+        files,
+        parallelism,
+        part_size,
+        concurrency=None,
+        compression=None,
+    ) -> List[dict]:
+        """并发上传 ``(file_path, key, size)`` 列表，返回按 key 排序的上传清单"""
+        if concurrency is None:
+            concurrency = AdaptiveConcurrency.fixed(parallelism)
+        small_files, large_files = [], []
+        total_size = 0
+        for file_path, key, size in files:
+            total_size += size
+            if size < part_size:
+                small_files.append((file_path, key, size))
+            else:
+                large_files.append((file_path, key, size))
+
+        manifest = []
+        progress_lock = threading.Lock()
+        with tqdm(total=total_size, unit="B", unit_scale=True) as progress:
+
+            def on_progress(bytes_amount):
+                with progress_lock:
+                    progress.update(bytes_amount)
+
+            def put_small_file(file_path, key, size):
+                concurrency.acquire()
+                try:
+                    with open(file_path, "rb") as f, tos_concurrency.bind(concurrency):
+                        rsp = self.put_object(bucket, key, f, compression=compression)
+                except Exception as e:
+                    concurrency.release(error=e)
+                    raise
+                concurrency.release(size)
+                on_progress(size)
+                return {"Key": key, "ETag": rsp["ETag"], "Size": size, "LocalPath": file_path}
+
+            with ThreadPoolExecutor(max_workers=concurrency.max_limit) as pool:
+                futures = [pool.submit(put_small_file, *item) for item in small_files]
+                try:
+                    for file_path, key, size in large_files:
+                        self.upload_file(
+                            file_path,
+                            bucket,
+                            key=key,
+                            part_size=part_size,
+                            max_concurrence=parallelism,
+                            callback=None if compression else on_progress,
+                            compression=compression,
+                        )
+                        if compression:
+                            on_progress(size)
+                        etag = self.s3_client.head_object(Bucket=bucket, Key=key)["ETag"]
+                        manifest.append({"Key": key, "ETag": etag, "Size": size, "LocalPath": file_path})
+                    for future in futures:
+                        manifest.append(future.result())
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+
+        manifest.sort(key=lambda item: item["Key"])
+        return manifest
+
+    def sync(
+        self,
+        local_dir: str,
+        tos_prefix: str,
+        direction: str = "upload",
+        delete: bool = False,
+        checksum: bool = True,
+        parallelism: int = 10,
+        part_size: int = DEFAULT_PART_SIZE,
+    ) -> dict:
+        """增量同步本地目录与 TOS 前缀，只传输有差异的文件
+
+        先并发列举 TOS 前缀、遍历本地目录，再逐个比较两边同名文件：大小不同则需要传输；大小相同时，
+        ``checksum=True`` 比较本地文件的 MD5 与对象的 ETag（支持分片上传产生的 ``xxx-N`` 形式 ETag），
+        本地文件的哈希按 (大小, mtime) 缓存，未修改的文件不会被重复读取；``checksum=False`` 时只比较修改时间。
+
+        Args:
+            local_dir(str): 本地目录
+            tos_prefix(str): TOS 前缀，比如 ``tos://bucket/path/to/dir/``
+            direction(str): ``upload`` 把本地目录同步到 TOS，``download`` 把 TOS 同步到本地
+            delete(bool): 是否删除目标端多余的文件
+            checksum(bool): 大小相同时是否比较 ETag/MD5
+            parallelism(int): 列举、哈希和传输的并发数量
+            part_size(int): 上传时的分片大小，也会优先用于匹配分片上传的 ETag
+
+        Returns:
+            返回同步结果，比如：::
+
+                {
+                    'transferred': ['variables/variables.data-00000-of-00001'],
+                    'deleted': [],
+                    'unchanged': 499
+                }
+
+        Raises:
+            ValueError: 参数填写错误
+            ClientError: 列举或传输时发生错误
+
+        """
+        if direction not in ("upload", "download"):
+            raise ValueError("direction must be 'upload' or 'download'")
+        bucket, prefix = split_tos_url(tos_prefix)
+        if prefix and not prefix.endswith("/"):
+            prefix += "/"
+
+        remote = {
+            record.key[len(prefix):]: record
+            for record in self.iter_objects(bucket, prefix=prefix, fan_out=parallelism)
+            if not record.key.endswith("/")
+        }
+        local = {}
+        for root, _, files in os.walk(local_dir):
+            for file in files:
+                file_path = os.path.join(root, file)
+                rel_path = os.path.relpath(file_path, local_dir).replace(os.sep, "/")
+                local[rel_path] = (file_path, os.stat(file_path))
+
+        hash_cache = LocalHashCache(local_dir)
+
+        def unchanged(rel_path):
+            file_path, stat = local[rel_path]
+            record = remote[rel_path]
+            if stat.st_size != record.size:
+                return False
+            if checksum:
+                return hash_cache.matches(rel_path, file_path, stat, record.etag, (part_size,))
+            remote_mtime = record.last_modified.timestamp()
+            if direction == "upload":
+                return stat.st_mtime <= remote_mtime
+            return remote_mtime <= stat.st_mtime
+
+        common = sorted(local.keys() & remote.keys())
+        with ThreadPoolExecutor(max_workers=parallelism) as pool:
+            same = {rel for rel, ok in zip(common, pool.map(unchanged, common)) if ok}
+        hash_cache.retain(local.keys())
+        hash_cache.save()
+
+        if direction == "upload":
+            changed = sorted(rel for rel in local if rel not in same)
+            extra = sorted(rel for rel in remote if rel not in local)
+            self._upload_files(
+                bucket,
+                [(local[rel][0], prefix + rel, local[rel][1].st_size) for rel in changed],
+                parallelism,
+                part_size,
+            )
+            if delete and extra:
+                _, failed = self._delete_keys(
+                    bucket,
+                    (prefix + rel for rel in extra),
+                    AdaptiveConcurrency.fixed(parallelism),
+                )
+                if failed:
+                    raise IOError(f"failed to delete {failed} objects under {tos_prefix}")
+        else:
+            changed = sorted(rel for rel in remote if rel not in same)
+            extra = sorted(rel for rel in local if rel not in remote)
+            items = ((prefix + rel, os.path.join(local_dir, rel)) for rel in changed)
+            for result in self.iter_download_files(items, bucket=bucket, parallelism=parallelism):
+                if result.error is not None:
+                    raise result.error
+            if delete:
+                for rel in extra:
+                    os.remove(local[rel][0])
+
+        debug(
+            "sync %s %s %s: %d transferred, %d deleted, %d unchanged",
+            local_dir, "->" if direction == "upload" else "<-", tos_prefix,
+            len(changed), len(extra) if delete else 0, len(same),
+        )
+        return {
+            "transferred": changed,
+            "deleted": extra if delete else [],
+            "unchanged": len(same),
+        }
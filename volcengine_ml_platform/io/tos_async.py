@@ -0,0 +1,271 @@
+"""基于 asyncio 的 TOS 客户端，适用于大量小对象的高并发读取
+
+需要安装 ``aiobotocore`` ：``pip install volcengine_ml_platform[async]``
+"""
+import asyncio
+import functools
+import os
+from logging import debug
+from typing import AsyncIterator
+from typing import List
+from typing import Optional
+
+from aiobotocore.config import AioConfig
+from aiobotocore.session import get_session
+from botocore.exceptions import ClientError
+
+from volcengine_ml_platform.io import tos_compression
+from volcengine_ml_platform.io.tos import client_config
+from volcengine_ml_platform.io.tos import key_local_path
+from volcengine_ml_platform.io.tos import TOSObject
+from volcengine_ml_platform.io.tos_transfer import PART_FILE_SUFFIX
+from volcengine_ml_platform.io.tos_transfer import READ_BUFFER_SIZE
+
+
+def _write_chunk(f, chunk, decompressor=None):
+    if decompressor is not None:
+        chunk = decompressor.decompress(chunk)
+    f.write(chunk)
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class AsyncTOSClient:
+    """异步版本的 ``TOSClient`` ，所有请求都是协程，同时进行的请求数量由信号量限制
+
+    需要在 ``async with`` 中使用：::
+
+        async with AsyncTOSClient(max_concurrence=256) as client:
+            datas = await asyncio.gather(*[client.get_object(bucket, key) for key in keys])
+
+    Args:
+        credentials: 认证信息，默认使用 ``volcengine_ml_platform.get_credentials()``
+        session_token(str): STS 临时凭证的 session token
+        max_concurrence(int): 同时进行的请求数量上限
+        addressing_style(str): bucket 寻址方式，``virtual`` 或 ``path``
+
+    """
+
+    def __init__(
+        self,
+        credentials=None,
+        session_token=None,
+        max_concurrence: int = 64,
+        addressing_style: str = "virtual",
+    ):
+        if max_concurrence <= 0:
+            raise ValueError("max_concurrence must be positive")
+        self.max_concurrence = max_concurrence
+        self._config = client_config(credentials, session_token)
+        self._aio_config = AioConfig(
+            s3={"addressing_style": addressing_style},
+            max_pool_connections=max_concurrence,
+        )
+        self._client_context = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.s3_client = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        """创建底层的 aiobotocore client，``async with`` 会自动调用"""
+        if self.s3_client is not None:
+            return
+        # the semaphore must be created inside the running event loop
+        self._semaphore = asyncio.Semaphore(self.max_concurrence)
+        self._client_context = get_session().create_client(
+            "s3", config=self._aio_config, **self._config,
+        )
+        self.s3_client = await self._client_context.__aenter__()
+
+    async def close(self):
+        """关闭底层 client 及其连接池"""
+        if self._client_context is not None:
+            await self._client_context.__aexit__(None, None, None)
+        self._client_context = None
+        self.s3_client = None
+
+    def _check_open(self):
+        if self.s3_client is None:
+            raise RuntimeError("AsyncTOSClient is not opened, use `async with AsyncTOSClient() as client`")
+
+    async def get_object(
+        self,
+        bucket: str,
+        key: str,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+    ) -> bytes:
+        """读取对象内容，压缩上传的对象在线程池中解压后返回
+
+        Args:
+            bucket(str): bucket 名
+            key(str): object 的 key
+            start(int): Range 读取的起始字节（包含），为 None 时从头读取
+            end(int): Range 读取的结束字节（包含），为 None 时读到结尾
+
+        Returns:
+            返回对象（或指定范围）的内容
+
+        """
+        self._check_open()
+        async with self._semaphore:
+            rsp = await self._get_object_response(bucket, key, start, end)
+            async with rsp["Body"] as body:
+                data = await body.read()
+        codec = tos_compression.codec_of(rsp)
+        if not codec:
+            return data
+        size = tos_compression.uncompressed_size(rsp)
+        return await asyncio.get_event_loop().run_in_executor(
+            None, tos_compression.decompress_bytes, data, codec, size, start or 0, end,
+        )
+
+    async def _get_object_response(self, bucket, key, start=None, end=None) -> dict:
+        """GET 对象（或其中一段）；压缩过的对象总是返回完整对象的响应，区间在解压后截取"""
+        if start is None and end is None:
+            return await self.s3_client.get_object(Bucket=bucket, Key=key)
+        content_range = f"bytes={start or 0}-{'' if end is None else end}"
+        try:
+            rsp = await self.s3_client.get_object(Bucket=bucket, Key=key, Range=content_range)
+        except ClientError as e:
+            # the range may lie beyond the compressed size of a compressed object
+            if e.response.get("Error", {}).get("Code") != "InvalidRange":
+                raise
+            rsp = await self.s3_client.get_object(Bucket=bucket, Key=key)
+            if not tos_compression.codec_of(rsp):
+                rsp["Body"].close()
+                raise
+            return rsp
+        if not tos_compression.codec_of(rsp):
+            return rsp
+        # the range applies to the uncompressed content, decode from the beginning
+        rsp["Body"].close()
+        return await self.s3_client.get_object(Bucket=bucket, Key=key, IfMatch=rsp["ETag"])
+
+    async def put_object(self, bucket: str, key: str, body) -> dict:
+        """上传对象，返回上传结果的 dict"""
+        self._check_open()
+        async with self._semaphore:
+            return await self.s3_client.put_object(Bucket=bucket, Key=key, Body=body)
+
+    async def head_object(self, bucket: str, key: str) -> dict:
+        """查询对象的元信息"""
+        self._check_open()
+        async with self._semaphore:
+            return await self.s3_client.head_object(Bucket=bucket, Key=key)
+
+    async def download_file(self, bucket: str, key: str, target_file_path: str) -> str:
+        """流式下载对象到本地文件，返回文件路径
+
+        文件读写及解压在线程池中进行，不阻塞事件循环；先写 ``<target>.part`` ，下载完成后再 rename，
+        下载失败或被取消时不会留下不完整的目标文件。压缩上传的对象自动解压。
+        """
+        self._check_open()
+        loop = asyncio.get_event_loop()
+        dir_path = os.path.dirname(target_file_path)
+        if dir_path:
+            await loop.run_in_executor(None, functools.partial(os.makedirs, dir_path, exist_ok=True))
+        debug("async download file: bucket %s, key %s", bucket, key)
+        part_path = target_file_path + PART_FILE_SUFFIX
+        async with self._semaphore:
+            rsp = await self.s3_client.get_object(Bucket=bucket, Key=key)
+            codec = tos_compression.codec_of(rsp)
+            decompressor = tos_compression.StreamDecompressor(codec) if codec else None
+            async with rsp["Body"] as body:
+                # unbuffered: every write goes through the executor, close() has nothing to flush
+                f = await loop.run_in_executor(None, functools.partial(open, part_path, "wb", buffering=0))
+                try:
+                    with f:
+                        while True:
+                            chunk = await body.read(READ_BUFFER_SIZE)
+                            if not chunk:
+                                break
+                            await loop.run_in_executor(None, _write_chunk, f, chunk, decompressor)
+                    if decompressor is not None:
+                        decompressor.finish()
+                    await loop.run_in_executor(None, os.replace, part_path, target_file_path)
+                except BaseException:
+                    # also on cancellation, where awaiting the executor again is not reliable
+                    _remove_quietly(part_path)
+                    raise
+        return target_file_path
+
+    async def download_files(
+        self,
+        bucket: str,
+        keys: List[str],
+        target_dir_path: str,
+    ) -> List[str]:
+        """并发下载多个对象到 ``target_dir_path`` ，文件名为对应的 key，返回文件路径列表
+
+        Raises:
+            ValueError: 某个 key 为绝对路径或含有 ``..`` ，对应的文件不在 ``target_dir_path`` 下，此时不会下载任何对象
+
+        """
+        paths = [key_local_path(target_dir_path, key) for key in keys]
+        return await asyncio.gather(*[
+            self.download_file(bucket, key, path)
+            for key, path in zip(keys, paths)
+        ])
+
+    async def list_objects(
+        self,
+        bucket: str,
+        max_keys: int = 1000,
+        marker: str = "",
+        delimiter: str = "",
+        prefix: str = "",
+    ) -> dict:
+        """列出桶里的一页对象，返回值与 ``TOSClient.list_objects`` 相同"""
+        self._check_open()
+        async with self._semaphore:
+            return await self.s3_client.list_objects(
+                Bucket=bucket,
+                Delimiter=delimiter,
+                Marker=marker,
+                MaxKeys=max_keys,
+                Prefix=prefix,
+            )
+
+    async def iter_objects(
+        self,
+        bucket: str,
+        prefix: str = "",
+        delimiter: str = "",
+        page_size: int = 1000,
+    ) -> AsyncIterator[TOSObject]:
+        """异步遍历桶里以 ``prefix`` 开头的所有对象，自动处理分页，用法与 ``TOSClient.iter_objects`` 相同"""
+        marker = ""
+        while True:
+            res = await self.list_objects(
+                bucket,
+                max_keys=page_size,
+                marker=marker,
+                delimiter=delimiter,
+                prefix=prefix,
+            )
+            contents = res.get("Contents", list())
+            prefixes = res.get("CommonPrefixes", list())
+            records = [
+                TOSObject(bucket, c["Key"], c["Size"], c["ETag"], c["LastModified"])
+                for c in contents
+            ]
+            if prefixes:
+                records.extend(TOSObject(bucket, p["Prefix"], 0, None, None) for p in prefixes)
+                records.sort(key=lambda record: record.key)
+            for record in records:
+                yield record
+            if not res.get("IsTruncated") or not records:
+                break
+            marker = res.get("NextMarker") or records[-1].key
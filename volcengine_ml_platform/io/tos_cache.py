@@ -0,0 +1,234 @@
+"""TOS 对象的本地磁盘缓存
+
+以 ``bucket/key/ETag`` 为 key 缓存对象内容，超过容量上限时按最近使用时间淘汰。同一台机器上的多个进程
+通过锁文件共享同一个缓存目录。开启后 ``TOSClient`` 的 ``download_file``、``download_dir``、``get_object``
+（以及基于它们的 ``TorchTOSDataset``、数据集下载）会自动从缓存读取：::
+
+    from volcengine_ml_platform.io import tos_cache
+    tos_cache.enable(max_size=50 * 1024 ** 3)
+
+也可以通过环境变量 ``VOLC_TOS_CACHE_DIR``（以及可选的 ``VOLC_TOS_CACHE_MAX_SIZE`` ，单位字节）开启。
+"""
+import contextlib
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from logging import debug
+from logging import warning
+from typing import Callable
+from typing import Optional
+
+from volcengine_ml_platform import constant
+from volcengine_ml_platform.util import cache_dir
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+DEFAULT_CACHE_ROOT = ".volcengine_ml_platform/tos_cache/"
+DEFAULT_MAX_SIZE = 10 * 1024 ** 3  # 10GiB
+# evict down to this fraction of max_size, so that eviction does not run on every insert
+LOW_WATERMARK = 0.9
+
+
+class ObjectCache:
+    """以 ``bucket/key/ETag`` 为 key 的本地对象缓存
+
+    写入先落到临时文件再原子地放入缓存，读取方不会看到写了一半的文件，多个进程同时填充同一条目时只有先完成的生效；淘汰时持有锁文件的排他锁，
+    读取时持有共享锁，保证正在被打开的缓存文件不会被其他进程删除。
+
+    Args:
+        root(str): 缓存目录，默认 ``~/.volcengine_ml_platform/tos_cache/``
+        max_size(int): 缓存总大小上限，单位字节
+    """
+
+    def __init__(self, root: Optional[str] = None, max_size: int = DEFAULT_MAX_SIZE):
+        if max_size <= 0:
+            raise ValueError("max_size must be positive")
+        self.root = root or os.path.join(cache_dir.HOME_DIR, DEFAULT_CACHE_ROOT)
+        self.max_size = max_size
+        self._objects_dir = os.path.join(self.root, "objects")
+        self._tmp_dir = os.path.join(self.root, "tmp")
+        self._lock_path = os.path.join(self.root, ".lock")
+        os.makedirs(self._objects_dir, exist_ok=True)
+        os.makedirs(self._tmp_dir, exist_ok=True)
+        self._size_lock = threading.Lock()
+        self._size_estimate: Optional[int] = None
+
+    def entry_path(self, bucket: str, key: str, etag: str) -> str:
+        """返回对象在缓存中的路径（不保证存在）"""
+        digest = hashlib.sha256(f"{bucket}\n{key}\n{etag}".encode("utf-8")).hexdigest()
+        return os.path.join(self._objects_dir, digest[:2], digest)
+
+    def open(self, bucket: str, key: str, etag: str, fill: Callable[[str], None]):
+        """打开缓存中的对象，未命中时调用 ``fill(tmp_path)`` 把对象下载到临时文件后放入缓存
+
+        Returns:
+            返回以 ``rb`` 模式打开的文件对象
+
+        """
+        path = self.entry_path(bucket, key, etag)
+        with self._locked(exclusive=False):
+            f = self._open_entry(path)
+        if f is not None:
+            debug("tos cache hit: %s/%s", bucket, key)
+            return f
+
+        debug("tos cache miss: %s/%s", bucket, key)
+        fd, tmp_path = tempfile.mkstemp(dir=self._tmp_dir)
+        os.close(fd)
+        try:
+            fill(tmp_path)
+            size = os.path.getsize(tmp_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with self._locked(exclusive=False):
+                created = self._publish(tmp_path, path)
+                f = open(path, "rb")
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+            raise
+        if created:
+            self._account(size)
+        return f
+
+    def copy_to(self, bucket: str, key: str, etag: str, fill: Callable[[str], None], target_file_path: str) -> str:
+        """把缓存中的对象复制到 ``target_file_path`` ，未命中时先填充缓存，返回目标路径"""
+        with self.open(bucket, key, etag, fill) as src:
+            fd, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(target_file_path) or ".",
+                prefix=".tos-cache-",
+            )
+            try:
+                with os.fdopen(fd, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                os.replace(tmp_path, target_file_path)
+            except BaseException:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(tmp_path)
+                raise
+        return target_file_path
+
+    def size(self) -> int:
+        """扫描缓存目录，返回当前缓存的总大小"""
+        return sum(size for _, size, _ in self._scan())
+
+    def evict(self, target_size: Optional[int] = None) -> int:
+        """按最近使用时间淘汰缓存，直到总大小不超过 ``target_size`` ，返回淘汰的字节数"""
+        if target_size is None:
+            target_size = int(self.max_size * LOW_WATERMARK)
+        freed = 0
+        with self._locked(exclusive=True):
+            entries = sorted(self._scan(), key=lambda entry: entry[2])
+            total = sum(size for _, size, _ in entries)
+            for path, size, _ in entries:
+                if total <= target_size:
+                    break
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+                    total -= size
+                    freed += size
+        with self._size_lock:
+            self._size_estimate = total
+        debug("tos cache evicted %d bytes, %d bytes left", freed, total)
+        return freed
+
+    def clear(self):
+        """清空缓存"""
+        self.evict(target_size=0)
+
+    def _open_entry(self, path):
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        with contextlib.suppress(OSError):
+            # mtime is the LRU clock, atime is unreliable on noatime mounts
+            os.utime(path)
+        return f
+
+    @staticmethod
+    def _publish(tmp_path, path):
+        """把填充好的临时文件放到缓存路径，返回缓存条目是否由本次调用创建"""
+        try:
+            # unlike os.replace, os.link fails when another process has already filled the same entry
+            os.link(tmp_path, path)
+        except FileExistsError:
+            created = False
+        except OSError:
+            # no hard links on this file system
+            created = not os.path.exists(path)
+            os.replace(tmp_path, path)
+            return created
+        else:
+            created = True
+        os.remove(tmp_path)
+        return created
+
+    def _account(self, size):
+        with self._size_lock:
+            if self._size_estimate is None:
+                self._size_estimate = self.size()
+            else:
+                self._size_estimate += size
+            over = self._size_estimate > self.max_size
+        if over:
+            self.evict()
+
+    def _scan(self):
+        for shard in os.scandir(self._objects_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                with contextlib.suppress(FileNotFoundError):
+                    stat = entry.stat()
+                    yield entry.path, stat.st_size, stat.st_mtime
+
+    @contextlib.contextmanager
+    def _locked(self, exclusive):
+        if fcntl is None:
+            yield
+            return
+        with open(self._lock_path, "a+") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+_default_cache: Optional[ObjectCache] = None
+_default_cache_initialized = False
+
+
+def enable(root: Optional[str] = None, max_size: int = DEFAULT_MAX_SIZE) -> ObjectCache:
+    """为当前进程中所有未单独指定缓存的 ``TOSClient`` 开启对象缓存"""
+    global _default_cache, _default_cache_initialized
+    _default_cache = ObjectCache(root, max_size)
+    _default_cache_initialized = True
+    return _default_cache
+
+
+def disable():
+    """关闭全局对象缓存，已缓存的文件不会被删除"""
+    global _default_cache, _default_cache_initialized
+    _default_cache = None
+    _default_cache_initialized = True
+
+
+def get_default_cache() -> Optional[ObjectCache]:
+    """返回全局对象缓存，未开启时返回 None"""
+    global _default_cache, _default_cache_initialized
+    if not _default_cache_initialized:
+        _default_cache_initialized = True
+        root = os.getenv(constant.TOS_CACHE_DIR_ENV_NAME)
+        if root:
+            try:
+                max_size = int(os.getenv(constant.TOS_CACHE_MAX_SIZE_ENV_NAME) or DEFAULT_MAX_SIZE)
+                _default_cache = ObjectCache(root, max_size)
+            except (OSError, ValueError) as e:
+                warning("cannot enable tos cache at %s: %s", root, e)
+    return _default_cache
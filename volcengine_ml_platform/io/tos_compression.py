@@ -0,0 +1,215 @@
+"""上传时可选的透明压缩
+
+``TOSClient.put_object`` 、``upload_file`` 、``upload_dir`` 指定 ``compression="gzip"`` 或 ``"zstd"`` 时，
+内容压缩后再上传，使用的编码和原始大小记录在对象的元数据中。``get_object`` 、``download_file`` 等读取接口
+（包括 ``AsyncTOSClient`` ）根据元数据自动流式解压，调用方拿到的始终是原始内容。
+
+zstd 需要安装 ``zstandard`` ：``pip install volcengine_ml_platform[zstd]``
+"""
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import zlib
+from typing import Optional
+
+GZIP = "gzip"
+ZSTD = "zstd"
+CODECS = (GZIP, ZSTD)
+
+# stored as x-amz-meta-* headers, boto3 returns the keys lowercased
+METADATA_CODEC = "volc-compression"
+METADATA_SIZE = "volc-uncompressed-size"
+
+DEFAULT_LEVELS = {GZIP: 6, ZSTD: 3}
+READ_BUFFER_SIZE = 1048576  # 1MiB
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError(
+            "zstd compression requires zstandard, please `pip install volcengine_ml_platform[zstd]`",
+        ) from e
+    return zstandard
+
+
+def check_codec(codec: str):
+    """检查编码是否支持，不支持时抛出 ValueError"""
+    if codec not in CODECS:
+        raise ValueError(f"unsupported compression {codec!r}, expect one of {CODECS}")
+    if codec == ZSTD:
+        _zstandard()
+
+
+def metadata(codec: str, size: int) -> dict:
+    """返回上传压缩对象时需要带上的元数据"""
+    return {METADATA_CODEC: codec, METADATA_SIZE: str(size)}
+
+
+def codec_of(response: dict) -> Optional[str]:
+    """从 ``head_object`` / ``get_object`` 的响应中读取对象的压缩编码，未压缩时返回 None"""
+    return response.get("Metadata", {}).get(METADATA_CODEC)
+
+
+def uncompressed_size(response: dict) -> Optional[int]:
+    """从响应中读取压缩前的大小，未记录时返回 None"""
+    size = response.get("Metadata", {}).get(METADATA_SIZE)
+    return int(size) if size is not None else None
+
+
+def compress_stream(src, dst, codec: str, level: Optional[int] = None, size: int = -1):
+    """把 ``src`` 的内容流式压缩写入 ``dst``
+
+    Args:
+        src: 可 ``read`` 的 file-like 对象
+        dst: 可 ``write`` 的 file-like 对象，不会被关闭
+        codec(str): ``gzip`` 或 ``zstd``
+        level(int): 压缩级别，默认 gzip 为 6，zstd 为 3
+        size(int): 原始大小，已知时写入 zstd 帧头
+    """
+    check_codec(codec)
+    if level is None:
+        level = DEFAULT_LEVELS[codec]
+    if codec == GZIP:
+        # mtime=0 makes the output, and thus the ETag, deterministic
+        with gzip.GzipFile(fileobj=dst, mode="wb", compresslevel=level, mtime=0) as writer:
+            shutil.copyfileobj(src, writer, READ_BUFFER_SIZE)
+        return
+    cctx = _zstandard().ZstdCompressor(level=level)
+    cctx.copy_stream(src, dst, size=size, read_size=READ_BUFFER_SIZE, write_size=READ_BUFFER_SIZE)
+
+
+def compress_bytes(data, codec: str, level: Optional[int] = None) -> bytes:
+    """压缩一段内存中的数据"""
+    dst = io.BytesIO()
+    compress_stream(io.BytesIO(data), dst, codec, level, size=len(data))
+    return dst.getvalue()
+
+
+def decompress_bytes(data, codec: str, size: Optional[int] = None, start: int = 0, end: Optional[int] = None) -> bytes:
+    """解压一段内存中的数据，返回解压后内容的 ``[start, end]`` 区间，参数与 ``DecompressingReader`` 相同"""
+    with DecompressingReader(io.BytesIO(data), codec, size, start, end) as reader:
+        return reader.read()
+
+
+def compress_to_tempfile(file_path: str, codec: str, level: Optional[int] = None) -> str:
+    """把文件压缩到同目录下（不可写时使用系统临时目录）的临时文件，返回临时文件路径，由调用方删除"""
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path) or ".", prefix=".tos-compress-")
+    except OSError:
+        fd, tmp_path = tempfile.mkstemp(prefix=".tos-compress-")
+    try:
+        with open(file_path, "rb") as src, os.fdopen(fd, "wb") as dst:
+            compress_stream(src, dst, codec, level, size=os.fstat(src.fileno()).st_size)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path
+
+
+class DecompressingReader(io.RawIOBase):
+    """流式解压 TOS 对象，可以只读取解压后内容的 ``[start, end]`` 区间
+
+    压缩后的对象不能按原始偏移做 Range 请求，读取区间时会从头解压并丢弃 ``start`` 之前的内容。
+
+    Args:
+        raw: 压缩数据的 file-like 对象，关闭时一并关闭
+        codec(str): ``gzip`` 或 ``zstd``
+        size(int): 压缩前的大小，未知时为 None
+        start(int): 起始字节（包含）
+        end(int): 结束字节（包含），为 None 时读到结尾
+    """
+
+    def __init__(self, raw, codec: str, size: Optional[int] = None, start: int = 0, end: Optional[int] = None):
+        super().__init__()
+        check_codec(codec)
+        self._raw = raw
+        if codec == GZIP:
+            self._reader = gzip.GzipFile(fileobj=raw, mode="rb")
+        else:
+            self._reader = _zstandard().ZstdDecompressor().stream_reader(
+                raw, read_size=READ_BUFFER_SIZE, read_across_frames=True,
+            )
+        if end is None and size is not None:
+            end = size - 1
+        self._end = end
+        self._pos = 0
+        self.length = None if end is None else max(0, end + 1 - start)
+        self._skip(start)
+
+    def _skip(self, n):
+        if n <= 0:
+            return
+        buffer = memoryview(bytearray(min(n, READ_BUFFER_SIZE)))
+        while n > 0:
+            got = self._reader.readinto(buffer[:min(n, len(buffer))])
+            if not got:
+                break
+            n -= got
+            self._pos += got
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        view = memoryview(b).cast("B")
+        if self._end is not None:
+            view = view[:max(0, self._end + 1 - self._pos)]
+        if not len(view):
+            return 0
+        n = self._reader.readinto(view)
+        self._pos += n
+        return n
+
+    def read(self, size=-1):
+        if size is not None and size >= 0:
+            return super().read(size)
+        chunks = []
+        while True:
+            chunk = super().read(READ_BUFFER_SIZE)
+            if not chunk:
+                return b"".join(chunks)
+            chunks.append(chunk)
+
+    def close(self):
+        if not self.closed:
+            self._reader.close()
+            self._raw.close()
+        super().close()
+
+
+class StreamDecompressor:
+    """增量解压：依次把收到的压缩数据传给 ``decompress`` ，返回当前能解出的内容，用于不能阻塞读取的场景
+
+    Args:
+        codec(str): ``gzip`` 或 ``zstd``
+    """
+
+    def __init__(self, codec: str):
+        check_codec(codec)
+        self._codec = codec
+        self._new_decoder()
+
+    def _new_decoder(self):
+        if self._codec == GZIP:
+            self._decoder = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+        else:
+            self._decoder = _zstandard().ZstdDecompressor().decompressobj()
+
+    def decompress(self, data) -> bytes:
+        chunks = []
+        while data:
+            chunks.append(self._decoder.decompress(data))
+            data = getattr(self._decoder, "unused_data", b"")
+            if data:
+                # the next gzip member or zstd frame
+                self._new_decoder()
+        return b"".join(chunks)
+
+    def finish(self):
+        """所有数据传入后调用，压缩数据不完整时抛出 IOError"""
+        if not getattr(self._decoder, "eof", True):
+            raise IOError(f"truncated {self._codec} stream")
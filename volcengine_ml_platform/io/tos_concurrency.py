@@ -0,0 +1,226 @@
+"""批量传输的自适应并发控制
+
+``AdaptiveConcurrency`` 按 AIMD（加性增、乘性减）调整同时进行的请求数量：吞吐量还在提升时每个统计窗口
+并发数加一，遇到 TOS 限流（``SlowDown`` 、503、429）或超时时并发数按比例下降。把它传给 ``TOSClient`` 的
+``iter_download_files`` 、``download_files`` 、``download_dir`` 、``upload_dir`` 、``delete_objects`` ，
+即可代替固定的 ``parallelism`` ：::
+
+    concurrency = AdaptiveConcurrency(initial=16, max_limit=256)
+    client.download_dir(bucket, key, prefix, local_dir, concurrency=concurrency)
+    print(concurrency.stats())
+
+同一个控制器可以被多个批量操作共用，此时它限制的是这些操作合计的并发数。
+
+``RetryPolicy`` 在 botocore 内部重试 ``SlowDown`` 等错误，请求最终成功时控制器看不到这些错误；批量操作的
+工作线程用 ``bind`` 绑定控制器，``TOSClient`` 在每次重试前调用 ``report_retry`` 把限流信号报告给它。
+"""
+import threading
+import time
+from contextlib import contextmanager
+from logging import debug
+
+from botocore.exceptions import ClientError
+from botocore.exceptions import ConnectTimeoutError
+from botocore.exceptions import ReadTimeoutError
+
+from volcengine_ml_platform.io import tos_metrics
+from volcengine_ml_platform.util.retry import THROTTLE_ERROR_CODES
+from volcengine_ml_platform.util.retry import THROTTLE_STATUS_CODES
+
+
+def is_throttle_error(e: BaseException) -> bool:
+    """判断异常是否表示服务端限流或超时，这类错误说明并发过高"""
+    if isinstance(e, (ReadTimeoutError, ConnectTimeoutError)):
+        return True
+    if isinstance(e, ClientError):
+        code = e.response.get("Error", {}).get("Code")
+        status = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+        return code in THROTTLE_ERROR_CODES or status in THROTTLE_STATUS_CODES
+    return False
+
+
+_bound = threading.local()
+
+
+@contextmanager
+def bind(concurrency: "AdaptiveConcurrency"):
+    """在当前线程内把 ``concurrency`` 设为接收 ``report_retry`` 的控制器"""
+    previous = getattr(_bound, "concurrency", None)
+    _bound.concurrency = concurrency
+    try:
+        yield concurrency
+    finally:
+        _bound.concurrency = previous
+
+
+def report_retry(e: BaseException):
+    """请求将被重试前调用：当前线程绑定了控制器且 ``e`` 为限流错误时，通知控制器降低并发数"""
+    concurrency = getattr(_bound, "concurrency", None)
+    if concurrency is not None and is_throttle_error(e):
+        concurrency.throttled()
+
+
+class AdaptiveConcurrency:
+    """AIMD 并发控制器，同时也是一个上限可变的信号量
+
+    每个请求开始前 ``acquire`` ，结束后 ``release(amount, error)`` 报告传输量（字节数或对象数）及错误。
+    每 ``interval`` 秒统计一次吞吐量（没有传输量时按完成的请求数计算），并发数用满且吞吐量比上个窗口
+    提升超过 ``min_improvement`` 时并发数加一；出现限流错误时并发数乘以 ``decrease_factor`` ，
+    每个窗口最多下降一次。
+
+    Args:
+        initial(int): 初始并发数
+        min_limit(int): 并发数下限
+        max_limit(int): 并发数上限
+        interval(float): 吞吐量统计窗口，单位秒
+        decrease_factor(float): 限流时并发数的缩减比例
+        min_improvement(float): 增加并发数要求的最小吞吐量提升比例
+    """
+
+    def __init__(
+        self,
+        initial: int = 8,
+        min_limit: int = 1,
+        max_limit: int = 128,
+        interval: float = 1.0,
+        decrease_factor: float = 0.5,
+        min_improvement: float = 0.05,
+    ):
+        if not 0 < min_limit <= initial <= max_limit:
+            raise ValueError("require 0 < min_limit <= initial <= max_limit")
+        if not 0 < decrease_factor < 1:
+            raise ValueError("decrease_factor must be in (0, 1)")
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.interval = interval
+        self.decrease_factor = decrease_factor
+        self.min_improvement = min_improvement
+        self._limit = initial
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._throughput = 0.0
+        self._request_rate = 0.0
+        self._last_throughput = 0.0
+        self._throttled = 0
+        self._completed = 0
+        self._last_decrease = float("-inf")
+        self._reset_window(time.monotonic())
+
+    @classmethod
+    def fixed(cls, limit: int) -> "AdaptiveConcurrency":
+        """并发数固定为 ``limit`` 的控制器"""
+        return cls(initial=limit, min_limit=limit, max_limit=limit)
+
+    @property
+    def limit(self) -> int:
+        """当前允许的并发数"""
+        return self._limit
+
+    @property
+    def in_flight(self) -> int:
+        """正在进行的请求数"""
+        return self._in_flight
+
+    def acquire(self):
+        """等待直到正在进行的请求数小于当前并发数，占用一个名额"""
+        with self._cond:
+            while self._in_flight >= self._limit:
+                self._cond.wait()
+            self._occupy()
+
+    def try_acquire(self) -> bool:
+        """有空闲名额时占用并返回 True，否则立即返回 False"""
+        with self._cond:
+            if self._in_flight >= self._limit:
+                return False
+            self._occupy()
+            return True
+
+    def cancel(self):
+        """归还一个未实际使用的名额，不计入统计"""
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    def release(self, amount: int = 0, error: BaseException = None):
+        """请求结束后归还名额
+
+        Args:
+            amount(int): 请求的传输量，用于计算吞吐量
+            error(BaseException): 请求失败时的异常
+        """
+        with self._cond:
+            self._in_flight -= 1
+            self._on_complete(amount, error)
+            self._cond.notify_all()
+
+    def throttled(self):
+        """报告一次被重试掩盖的限流错误，不归还名额，与 ``release`` 收到限流错误时一样降低并发数"""
+        with self._cond:
+            self._on_throttle(time.monotonic())
+
+    def stats(self) -> dict:
+        """返回当前并发数、正在进行的请求数、最近一个窗口的吞吐量（每秒传输量）和请求速率、完成及被限流的请求数"""
+        with self._cond:
+            return {
+                "concurrency": self._limit,
+                "in_flight": self._in_flight,
+                "throughput": self._throughput,
+                "request_rate": self._request_rate,
+                "completed": self._completed,
+                "throttled": self._throttled,
+            }
+
+    def _occupy(self):
+        self._in_flight += 1
+        self._window_peak = max(self._window_peak, self._in_flight)
+
+    def _reset_window(self, now):
+        self._window_start = now
+        self._window_amount = 0
+        self._window_count = 0
+        self._window_peak = self._in_flight
+
+    def _on_throttle(self, now):
+        self._throttled += 1
+        if now - self._last_decrease < self.interval:
+            return
+        self._last_decrease = now
+        self._limit = max(self.min_limit, int(self._limit * self.decrease_factor))
+        # throughput measured at the old limit is not comparable any more
+        self._last_throughput = 0.0
+        self._reset_window(now)
+        debug("tos throttled, concurrency decreased to %d", self._limit)
+        if tos_metrics.enabled():
+            tos_metrics.gauge(tos_metrics.CONCURRENCY_LIMIT, self._limit)
+
+    def _on_complete(self, amount, error):
+        now = time.monotonic()
+        if error is not None and is_throttle_error(error):
+            self._on_throttle(now)
+            return
+
+        self._completed += 1
+        self._window_amount += amount
+        self._window_count += 1
+        elapsed = now - self._window_start
+        if elapsed < self.interval:
+            return
+        self._throughput = self._window_amount / elapsed
+        self._request_rate = self._window_count / elapsed
+        # requests without a size (deletes, empty objects) are measured by count
+        rate = self._throughput if self._window_amount else self._request_rate
+        saturated = self._window_peak >= self._limit
+        if (
+            saturated
+            and self._limit < self.max_limit
+            and now - self._last_decrease >= self.interval
+            and rate > self._last_throughput * (1 + self.min_improvement)
+        ):
+            self._limit += 1
+            debug("tos throughput %.0f/s, concurrency increased to %d", rate, self._limit)
+        self._last_throughput = rate
+        self._reset_window(now)
+        if tos_metrics.enabled():
+            tos_metrics.gauge(tos_metrics.CONCURRENCY_LIMIT, self._limit)
+            tos_metrics.gauge(tos_metrics.THROUGHPUT, rate)
@@ -1,68 +1,364 @@
 import io
+import json
+import os
 from collections.abc import Callable
 from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
 from typing import Optional
+from typing import Union
 
+import numpy as np
 import torch
 from PIL import Image
 
 from volcengine_ml_platform.io import tos
+from volcengine_ml_platform.io.tos import split_tos_url
+from volcengine_ml_platform.io.tos_manifest import default_label
+from volcengine_ml_platform.io.tos_manifest import ManifestStore
 
 
-class TorchTOSDataset:
+class _TOSSampleReader:
+    """读取、解码 TOS 样本的公共逻辑，``TOSClient`` 在每个进程中第一次读取时创建"""
+
     def __init__(
         self,
-        manifest_info: Dict,
         decode: Optional[Callable] = None,
         transform: Optional[Callable] = None,
         target_transform: Optional[Callable] = None,
+        client_factory: Optional[Callable] = None,
     ):
         self.decode = decode
         self.transform = transform
         self.target_transform = target_transform
+        self.client_factory = client_factory
+        self._pid = None
+
+    def _decode(self, raw_data):
+        # file-like objects (e.g. from get_object_view) are decoded in place
+        if isinstance(raw_data, (bytes, bytearray, memoryview)):
+            raw_data = io.BytesIO(raw_data)
+        return Image.open(raw_data).convert("RGB")
+
+    def _target_transform(self, target):
+        return default_label(target)
+
+    def _target(self, annotation):
+        if self.target_transform is not None:
+            return self.target_transform(annotation)
+        return self._target_transform(annotation)
+
+    def _store_record(self, store: ManifestStore, index):
+        bucket, key, start, end = store.location(index)
+        # the raw annotation is only parsed when a target_transform needs it
+        if self.target_transform is None and store.labels is not None:
+            return bucket, key, start, end, store.label(index)
+        return bucket, key, start, end, self._target(store.annotation(index))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # the client is recreated in each worker process
+        state.pop("tos_client", None)
+        state["_pid"] = None
+        return state
+
+    def _init_process(self):
+        if self._pid == os.getpid():
+            return
+        # once per process: DataLoader workers should not each spawn a full intra-op thread pool
+        torch.set_num_threads(1)
+        self.tos_client = (self.client_factory or tos.TOSClient)()
+        self._pid = os.getpid()
+
+    def _fetch(self, bucket, key, start=None, end=None):
+        """读取样本对应的对象内容（或其中一段）
+
+        默认解码及声明了 ``accepts_reader`` 的 ``decode`` （例如 ``ImageDecoder`` ）收到 ``MemoryViewReader`` ，
+        解码时不再复制；其余的 ``decode`` 收到 bytes
+        """
+        if self.decode is None or getattr(self.decode, "accepts_reader", False):
+            return self.tos_client.get_object_view(bucket=bucket, key=key, start=start, end=end)
+        if start is None:
+            rsp = self.tos_client.get_object(bucket=bucket, key=key)
+            data = rsp.read()
+            rsp.close()
+            return data
+        return self.tos_client.get_object_view(bucket=bucket, key=key, start=start, end=end).read()
+
+    def _apply_transform(self, data, target):
+        if self.transform is not None:
+            data = self.transform(data)
+        return data, target
+
+    def _to_sample(self, raw_data, target):
+        if self.decode is not None:
+            data = self.decode(raw_data)
+        else:
+            data = self._decode(raw_data)
+        return self._apply_transform(data, target)
+
+    def _fetch_ahead(self, records: Iterable[tuple], depth: int) -> Iterator[tuple]:
+        """按顺序读取 (bucket, key, start, end, target) 记录对应的对象内容，返回 (raw, target)，
+        同时至多有 ``depth`` 个 GET 在进行"""
+
+        def fetch(record):
+            bucket, key, start, end, target = record
+            return self._fetch(bucket, key, start, end), target
+
+        return tos.map_ahead(fetch, records, depth)
+
+    def _read_ahead(self, records: Iterable[tuple], depth: int) -> Iterator:
+        """与 ``_fetch_ahead`` 相同，在等待其余请求时依次解码已经返回的样本"""
+        for raw_data, target in self._fetch_ahead(records, depth):
+            yield self._to_sample(raw_data, target)
+
+
+class TorchTOSDataset(_TOSSampleReader):
+    """从 TOS 读取样本的 map-style dataset
+
+    设置 ``prefetch`` 后开启预取模式：DataLoader（torch>=2.0）按 batch 调用 ``__getitems__`` ，每个 worker
+    同时发起至多 ``prefetch`` 个 GET，在等待其余请求的同时解码已经返回的样本，网络 I/O 与解码互相重叠。
+    较早版本的 torch 可以把 ``BatchSampler`` 作为 ``sampler`` 并设置 ``batch_size=None`` ，此时 ``__getitem__``
+    收到的是一个 batch 的下标列表。
+
+    ``decode`` 提供 ``decode_batch`` 方法（例如 ``tos_decode.ImageDecoder`` ）时，``__getitems__`` 读取整个
+    batch 后一次性交给 ``decode_batch`` ，在线程池中并行解码。未设置 ``target_transform`` 时，所有样本的
+    标签在创建时预先解析为整数数组 ``labels`` ，读取样本时不再解析标注。
+
+    Args:
+        manifest_info(dict, ManifestStore): 包含 ``buckets`` 、``keys`` 、``annotations`` ，可选的 ``ranges`` 为
+            每个样本在对象中的 (start, end)；样本很多时建议传入内存占用小得多的 ``ManifestStore``
+        decode(callable): 把对象内容（bytes）解码为样本，默认用 PIL 解码为 RGB 图片；``accepts_reader`` 为 True
+            的 decode 收到 ``MemoryViewReader`` ，可以用 ``getbuffer()`` 不复制地读取对象内容
+        transform(callable): 作用于解码后的样本
+        target_transform(callable): 作用于标注，未设置时返回预先解析的标签
+        prefetch(int): 每个 worker 同时进行的 GET 数量，不大于 1 时逐个读取
+        client_factory(callable): 在每个进程中调用一次以创建 ``TOSClient`` ，默认为 ``tos.TOSClient``
+    """
+
+    def __init__(
+        self,
+        manifest_info: Union[Dict, ManifestStore],
+        decode: Optional[Callable] = None,
+        transform: Optional[Callable] = None,
+        target_transform: Optional[Callable] = None,
+        prefetch: int = 0,
+        client_factory: Optional[Callable] = None,
+    ):
+        super().__init__(decode, transform, target_transform, client_factory)
+        self.prefetch = prefetch
+        self.manifest_store = None
+        self.labels = None
+        if isinstance(manifest_info, ManifestStore):
+            self.manifest_store = manifest_info
+            return
         buckets = manifest_info["buckets"]
         keys = manifest_info["keys"]
         annotations = manifest_info["annotations"]
         assert buckets is not None and keys is not None and annotations is not None
         assert len(buckets) == len(keys) and len(buckets) == len(annotations)
-        self.set_dataset_indices(buckets, keys, annotations)
+        # optional (start, end) of each sample inside its object, e.g. for packed shards
+        ranges = manifest_info.get("ranges")
+        assert ranges is None or len(ranges) == len(buckets)
+        self.set_dataset_indices(buckets, keys, annotations, ranges)
 
-    def set_dataset_indices(self, buckets, keys, annotations):
+    def set_dataset_indices(self, buckets, keys, annotations, ranges=None):
         self.buckets = buckets
         self.keys = keys
         self.annotations = annotations
+        self.ranges = ranges
+        self.labels = self._parse_labels(annotations)
+
+    def _parse_labels(self, annotations) -> Optional[np.ndarray]:
+        """把所有标注的标签解析为整数数组；设置了 ``target_transform`` 或标注中没有整数标签时返回 None，
+        此时在读取样本时逐个转换"""
+        if self.target_transform is not None:
+            return None
+        try:
+            return np.fromiter(
+                (self._target_transform(annotation) for annotation in annotations),
+                dtype=np.int64,
+                count=len(annotations),
+            )
+        except (KeyError, IndexError, TypeError, ValueError):
+            return None
 
     def __len__(self):
+        if self.manifest_store is not None:
+            return len(self.manifest_store)
         return len(self.buckets)
 
-    def _decode(self, raw_data):
-        return Image.open(io.BytesIO(raw_data)).convert("RGB")
-
-    def _target_transform(self, target):
-        target = int(target["Result"][0]["Data"][0]["Label"])
-        return target
+    def _record(self, index):
+        if self.manifest_store is not None:
+            return self._store_record(self.manifest_store, index)
+        start, end = self.ranges[index] if self.ranges is not None else (None, None)
+        if self.labels is not None:
+            target = int(self.labels[index])
+        else:
+            target = self._target(self.annotations[index])
+        return self.buckets[index], self.keys[index], start, end, target
 
     def __getitem__(self, index):
-        torch.set_num_threads(1)
-        # get each process a TOS client
-        if not hasattr(self, "tos_client"):
-            self.tos_client = tos.TOSClient()
-        bucket, key, annotation = (
-            self.buckets[index],
-            self.keys[index],
-            self.annotations[index],
-        )
-        rsp = self.tos_client.get_object(bucket=bucket, key=key)
-        data = rsp.read()
-        rsp.close()
-        if self.decode is not None:
-            data = self.decode(data)
-        else:
-            data = self._decode(data)
-        if self.transform is not None:
-            data = self.transform(data)
-        if self.target_transform is not None:
-            annotation = self.target_transform(annotation)
-        else:
-            annotation = self._target_transform(annotation)
-        return data, annotation
+        if isinstance(index, (list, tuple)):
+            return self.__getitems__(index)
+        self._init_process()
+        bucket, key, start, end, target = self._record(index)
+        return self._to_sample(self._fetch(bucket, key, start, end), target)
+
+    def __getitems__(self, indices: List[int]) -> list:
+        """读取一个 batch 的样本，预取模式下同时发起至多 ``prefetch`` 个请求，按 ``indices`` 的顺序解码返回"""
+        self._init_process()
+        records = map(self._record, indices)
+        decode_batch = getattr(self.decode, "decode_batch", None)
+        if decode_batch is None:
+            return list(self._read_ahead(records, self.prefetch))
+        fetched = list(self._fetch_ahead(records, self.prefetch))
+        images = decode_batch([raw_data for raw_data, _ in fetched])
+        return [self._apply_transform(data, target) for data, (_, target) in zip(images, fetched)]
+
+
+class IterableTOSDataset(_TOSSampleReader, torch.utils.data.IterableDataset):
+    """``TorchTOSDataset`` 的流式版本，适合多机多卡训练
+
+    样本按顺序轮流分给各个 ``torch.distributed`` rank 以及每个 rank 的 DataLoader worker，全局第 i 个样本
+    由第 ``i % (world_size * num_workers)`` 个 worker 读取，各 worker 之间样本不重复，数量最多相差一个。
+    每个 worker 按顺序读取自己的样本，同时保持 ``read_ahead`` 个 GET 在进行。
+
+    manifest 可以是 ``TorchTOSDataset`` 使用的 ``manifest_info`` ，也可以是 manifest 文件（本地路径或 tos url）：
+    后者由每个 worker 流式读取并只解析属于自己的行，不需要在每个 rank 上持有完整的样本列表。
+
+    ``shuffle_buffer`` 大于 0 时在读取对象之前用一个该大小的缓冲区打乱样本顺序，缓冲区中只保存样本的位置，
+    不占用图片内存。随机种子由 ``seed`` 、``set_epoch`` 设置的 epoch 和 worker 序号共同决定，相同设置下
+    每个 epoch 的顺序可以复现，不同 epoch 的顺序不同。::
+
+        dataset = IterableTOSDataset(manifest="tos://bucket/train.manifest", shuffle_buffer=10000)
+        loader = DataLoader(dataset, batch_size=64, num_workers=8)
+        for epoch in range(epochs):
+            dataset.set_epoch(epoch)
+            for images, labels in loader:
+                ...
+
+    Args:
+        manifest_info(dict, ManifestStore): 与 ``TorchTOSDataset`` 相同，和 ``manifest`` 二选一
+        manifest(str): manifest 文件的本地路径或 tos url，每行一个 JSON
+        url_keyword(str): ``manifest`` 中样本 tos url 在 ``Data`` 中的字段名
+        decode(callable): 把对象内容（bytes）解码为样本，默认用 PIL 解码为 RGB 图片；``accepts_reader`` 为 True
+            的 decode 收到 ``MemoryViewReader`` ，可以用 ``getbuffer()`` 不复制地读取对象内容
+        transform(callable): 作用于解码后的样本
+        target_transform(callable): 作用于标注
+        read_ahead(int): 每个 worker 同时进行的 GET 数量
+        shuffle_buffer(int): 打乱顺序的缓冲区大小，为 0 时按 manifest 的顺序读取
+        seed(int): 打乱顺序的随机种子
+        rank(int): 当前 rank，默认从 ``torch.distributed`` 获取
+        world_size(int): rank 总数，默认从 ``torch.distributed`` 获取
+        client_factory(callable): 在每个进程中调用一次以创建 ``TOSClient`` ，默认为 ``tos.TOSClient``
+    """
+
+    def __init__(
+        self,
+        manifest_info: Union[Dict, ManifestStore, None] = None,
+        manifest: Optional[str] = None,
+        url_keyword: str = "ImageURL",
+        decode: Optional[Callable] = None,
+        transform: Optional[Callable] = None,
+        target_transform: Optional[Callable] = None,
+        read_ahead: int = 16,
+        shuffle_buffer: int = 0,
+        seed: int = 0,
+        rank: Optional[int] = None,
+        world_size: Optional[int] = None,
+        client_factory: Optional[Callable] = None,
+    ):
+        super().__init__(decode, transform, target_transform, client_factory)
+        if (manifest_info is None) == (manifest is None):
+            raise ValueError("Please set exactly one of manifest_info and manifest")
+        if isinstance(manifest_info, dict):
+            assert len(manifest_info["buckets"]) == len(manifest_info["keys"]) == len(manifest_info["annotations"])
+        self.manifest_info = manifest_info
+        self.manifest = manifest
+        self.url_keyword = url_keyword
+        self.read_ahead = read_ahead
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        self.epoch = 0
+        self.rank = rank
+        self.world_size = world_size
+
+    def set_epoch(self, epoch: int):
+        """设置当前 epoch，打乱顺序的随机种子随之变化；DataLoader 每个 epoch 把 dataset 复制到 worker，
+        需要在创建迭代器之前调用"""
+        self.epoch = epoch
+
+    def __len__(self):
+        """当前 rank 读取的样本数，只有通过 ``manifest_info`` 创建时可用"""
+        if self.manifest_info is None:
+            raise TypeError("length of a streamed manifest is unknown")
+        rank, world_size = self._rank_and_world_size()
+        if isinstance(self.manifest_info, ManifestStore):
+            return len(range(rank, len(self.manifest_info), world_size))
+        return len(range(rank, len(self.manifest_info["buckets"]), world_size))
+
+    def _rank_and_world_size(self):
+        # resolved lazily, the dataset may be created before init_process_group
+        if self.rank is not None and self.world_size is not None:
+            return self.rank, self.world_size
+        if torch.distributed.is_available() and torch.distributed.is_initialized():
+            return torch.distributed.get_rank(), torch.distributed.get_world_size()
+        return 0, 1
+
+    def _worker_split(self):
+        """返回 (当前 worker 的全局序号, worker 总数)"""
+        rank, world_size = self._rank_and_world_size()
+        worker_info = torch.utils.data.get_worker_info()
+        worker_id, num_workers = (worker_info.id, worker_info.num_workers) if worker_info else (0, 1)
+        return rank * num_workers + worker_id, world_size * num_workers
+
+    def _open_manifest(self):
+        if self.manifest.startswith("tos://"):
+            bucket, key = split_tos_url(self.manifest)
+            return io.BufferedReader(self.tos_client.get_object(bucket, key))
+        return open(self.manifest, "rb")
+
+    def _records(self, worker, num_workers) -> Iterator[tuple]:
+        if isinstance(self.manifest_info, ManifestStore):
+            for i in range(worker, len(self.manifest_info), num_workers):
+                yield self._store_record(self.manifest_info, i)
+            return
+        if self.manifest_info is not None:
+            info = self.manifest_info
+            ranges = info.get("ranges")
+            for i in range(worker, len(info["buckets"]), num_workers):
+                start, end = ranges[i] if ranges is not None else (None, None)
+                yield info["buckets"][i], info["keys"][i], start, end, self._target(info["annotations"][i])
+            return
+        with self._open_manifest() as f:
+            for i, line in enumerate(f):
+                # lines of other workers are skipped without parsing
+                if i % num_workers != worker:
+                    continue
+                manifest_line = json.loads(line)
+                bucket, key = split_tos_url(manifest_line["Data"][self.url_keyword])
+                yield bucket, key, None, None, self._target(manifest_line["Annotation"])
+
+    def _shuffle(self, records: Iterator[tuple], worker) -> Iterator[tuple]:
+        # RandomState rather than default_rng: setup.py still supports numpy>=1.14
+        rng = np.random.RandomState([self.seed, self.epoch, worker])
+        buffer = []
+        for record in records:
+            if len(buffer) < self.shuffle_buffer:
+                buffer.append(record)
+                continue
+            j = rng.randint(len(buffer))
+            yield buffer[j]
+            buffer[j] = record
+        rng.shuffle(buffer)
+        yield from buffer
+
+    def __iter__(self):
+        self._init_process()
+        worker, num_workers = self._worker_split()
+        records = self._records(worker, num_workers)
+        if self.shuffle_buffer > 0:
+            records = self._shuffle(records, worker)
+        return self._read_ahead(records, self.read_ahead)
@@ -0,0 +1,188 @@
+"""图片解码
+
+``ImageDecoder`` 把 TOS 读出的图片字节解码为 PIL 图片或 NumPy 数组，可以直接作为 ``TorchTOSDataset`` 的
+``decode`` 参数：
+
+- 安装了 ``PyTurboJPEG`` 及 libjpeg-turbo 时，JPEG 由 turbojpeg 解码：``pip install volcengine_ml_platform[turbojpeg]``
+- 其余格式及未安装 turbojpeg 时使用 PIL；安装 PIL-SIMD 代替 Pillow 后自动使用其加速实现
+- 已知目标大小 ``size`` 时，JPEG 直接按 1/2、1/4、1/8 等比例在 DCT 域缩小解码（PIL 的 ``Image.draft`` 或
+  turbojpeg 的 scaling factor），解码后的图片不小于 ``size``
+- ``decode_batch`` 在线程池中并行解码一批图片，PIL 和 turbojpeg 解码时都会释放 GIL
+
+::
+
+    decoder = ImageDecoder(size=(224, 224))
+    dataset = TorchTOSDataset(manifest_info, decode=decoder, prefetch=32)
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+from PIL import Image
+
+from volcengine_ml_platform.io.tos_transfer import MemoryViewReader
+
+AUTO = "auto"
+PIL_BACKEND = "pil"
+TURBOJPEG_BACKEND = "turbojpeg"
+BACKENDS = (AUTO, PIL_BACKEND, TURBOJPEG_BACKEND)
+
+_JPEG_MAGIC = b"\xff\xd8"
+
+_turbojpeg = None
+_turbojpeg_lock = threading.Lock()
+
+
+def _load_turbojpeg():
+    """返回共享的 ``TurboJPEG`` 实例，未安装或找不到 libjpeg-turbo 时返回 None"""
+    global _turbojpeg
+    if _turbojpeg is None:
+        with _turbojpeg_lock:
+            if _turbojpeg is None:
+                try:
+                    from turbojpeg import TurboJPEG
+
+                    _turbojpeg = TurboJPEG()
+                except (ImportError, OSError, RuntimeError):
+                    _turbojpeg = False
+    return _turbojpeg or None
+
+
+def turbojpeg_available() -> bool:
+    return _load_turbojpeg() is not None
+
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _decode_pool() -> ThreadPoolExecutor:
+    """进程内共享的解码线程池，线程数为 CPU 核数"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="image-decode")
+        return _pool
+
+
+def _reset_decode_pool():
+    global _pool, _pool_lock
+    # threads of the parent's pool do not exist in a forked child
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_decode_pool)
+
+
+def _as_buffer(raw):
+    # MemoryViewReader (get_object_view) exposes its data without a copy
+    getbuffer = getattr(raw, "getbuffer", None)
+    if getbuffer is not None:
+        return getbuffer()
+    if isinstance(raw, (bytes, bytearray, memoryview)):
+        return raw
+    return raw.read()
+
+
+class ImageDecoder:
+    """可配置的图片解码器
+
+    Args:
+        size(tuple): 目标大小 ``(H, W)`` ，指定时 JPEG 以不小于该大小的最小比例缩小解码
+        mode(str): 输出的 PIL 图片模式，默认为 ``RGB``
+        resize(bool): 为 True 时把解码结果缩放到恰好 ``size`` ，否则交给后续的 transform 处理
+        backend(str): ``auto`` 、``pil`` 或 ``turbojpeg`` ，``auto`` 时 JPEG 在 turbojpeg 可用时使用它
+        output(str): ``pil`` 返回 PIL 图片，``numpy`` 返回 ``(H, W, C)`` 的 uint8 数组
+    """
+
+    # TorchTOSDataset passes the MemoryViewReader from get_object_view instead of bytes
+    accepts_reader = True
+
+    def __init__(
+        self,
+        size: Optional[Tuple[int, int]] = None,
+        mode: str = "RGB",
+        resize: bool = False,
+        backend: str = AUTO,
+        output: str = "pil",
+    ):
+        if backend not in BACKENDS:
+            raise ValueError(f"unsupported backend {backend!r}, expect one of {BACKENDS}")
+        if output not in ("pil", "numpy"):
+            raise ValueError(f"unsupported output {output!r}, expect 'pil' or 'numpy'")
+        if backend == TURBOJPEG_BACKEND and not turbojpeg_available():
+            raise ImportError(
+                "turbojpeg backend requires PyTurboJPEG and libjpeg-turbo, "
+                "please `pip install volcengine_ml_platform[turbojpeg]`",
+            )
+        if resize and size is None:
+            raise ValueError("resize requires size")
+        self.size = size
+        self.mode = mode
+        self.resize = resize
+        self.backend = backend
+        self.output = output
+
+    def _use_turbojpeg(self, data) -> bool:
+        return (
+            self.backend != PIL_BACKEND
+            and self.mode in ("RGB", "L")
+            and bytes(data[:2]) == _JPEG_MAGIC
+            and turbojpeg_available()
+        )
+
+    def _scaling_factor(self, jpeg, data):
+        if self.size is None:
+            return None
+        width, height = jpeg.decode_header(data)[:2]
+        target_h, target_w = self.size
+        best = None
+        for num, denom in jpeg.scaling_factors:
+            if num >= denom:
+                continue
+            # turbojpeg rounds scaled dimensions up
+            if -(-width * num // denom) >= target_w and -(-height * num // denom) >= target_h:
+                if best is None or num / denom < best[0] / best[1]:
+                    best = (num, denom)
+        return best
+
+    def _decode_turbojpeg(self, data) -> np.ndarray:
+        from turbojpeg import TJPF_GRAY
+        from turbojpeg import TJPF_RGB
+
+        jpeg = _load_turbojpeg()
+        pixel_format = TJPF_RGB if self.mode == "RGB" else TJPF_GRAY
+        array = jpeg.decode(data, pixel_format=pixel_format, scaling_factor=self._scaling_factor(jpeg, data))
+        return array[:, :, 0] if self.mode == "L" else array
+
+    def _decode_pil(self, data) -> Image.Image:
+        image = Image.open(MemoryViewReader(data))
+        if self.size is not None:
+            # JPEG only: decode at the smallest 1/2^n scale that is still >= size
+            image.draft(self.mode, (self.size[1], self.size[0]))
+        return image.convert(self.mode)
+
+    def __call__(self, raw):
+        data = _as_buffer(raw)
+        if self._use_turbojpeg(data):
+            result = self._decode_turbojpeg(data)
+            if not self.resize and self.output == "numpy":
+                return result
+            image = Image.fromarray(result)
+        else:
+            image = self._decode_pil(data)
+        if self.resize and image.size != (self.size[1], self.size[0]):
+            image = image.resize((self.size[1], self.size[0]), Image.BILINEAR)
+        return np.asarray(image) if self.output == "numpy" else image
+
+    def decode_batch(self, raws: List) -> List:
+        """在共享的解码线程池中并行解码一批图片，按输入顺序返回"""
+        if len(raws) <= 1:
+            return [self(raw) for raw in raws]
+        return list(_decode_pool().map(self, raws))
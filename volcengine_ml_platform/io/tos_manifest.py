@@ -0,0 +1,203 @@
+"""紧凑的列式 manifest
+
+``ImageDataset.parse_image_manifest`` 为每个样本生成 bucket、key 字符串和完整的标注 dict，数千万样本时
+Python 对象占用数 GB 内存；DataLoader fork 出的 worker 访问这些对象时引用计数的修改又会触发写时复制，
+最终每个 worker 都复制一份。``ManifestStore`` 把同样的信息保存在少数几个 NumPy 数组中：
+
+- bucket 去重后保存一次，每个样本只记录 bucket 的序号
+- 所有 key 拼接成一个字节数组，另用偏移数组定位
+- 标签预先解析为整数数组
+- 原始标注保存为 JSON 字节，访问时才解析
+
+``TorchTOSDataset`` 和 ``IterableTOSDataset`` 可以直接接受 ``ManifestStore`` 代替 ``manifest_info`` 。::
+
+    store = ManifestStore.from_manifest_file("train.manifest", url_keyword="ImageURL")
+    dataset = TorchTOSDataset(store)
+"""
+import json
+from array import array
+from collections.abc import Callable
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+
+from volcengine_ml_platform.io.tos import split_tos_url
+
+# label of samples whose annotation has no label
+NO_LABEL = -1
+
+
+def default_label(annotation) -> int:
+    """从平台标注格式中读取分类标签，与 ``TorchTOSDataset`` 默认的 target 转换一致"""
+    return int(annotation["Result"][0]["Data"][0]["Label"])
+
+
+class ManifestStore:
+    """列式保存的 manifest，可以被 pickle 或 ``save`` 到文件，各数组在 fork 出的进程间共享
+
+    Args:
+        buckets(list): 去重后的 bucket 名
+        bucket_ids(np.ndarray): 每个样本的 bucket 在 ``buckets`` 中的序号
+        keys(np.ndarray): 所有 key 的 UTF-8 字节拼接成的数组
+        key_offsets(np.ndarray): 第 i 个 key 为 ``keys[key_offsets[i]:key_offsets[i + 1]]``
+        labels(np.ndarray): 每个样本的标签，没有标签时为 ``NO_LABEL`` ；为 None 时未解析标签
+        annotations(np.ndarray): 所有标注的 JSON 字节拼接成的数组
+        annotation_offsets(np.ndarray): 标注的偏移，与 ``key_offsets`` 相同
+        ranges(np.ndarray): 可选的 ``(n, 2)`` 数组，每个样本在对象中的 (start, end)
+    """
+
+    def __init__(
+        self,
+        buckets,
+        bucket_ids,
+        keys,
+        key_offsets,
+        labels,
+        annotations,
+        annotation_offsets,
+        ranges=None,
+    ):
+        self.buckets = [str(b) for b in buckets]
+        self.bucket_ids = np.asarray(bucket_ids, dtype=np.uint32)
+        self.keys = np.asarray(keys, dtype=np.uint8)
+        self.key_offsets = np.asarray(key_offsets, dtype=np.uint64)
+        self.labels = None if labels is None else np.asarray(labels, dtype=np.int64)
+        self.annotations = np.asarray(annotations, dtype=np.uint8)
+        self.annotation_offsets = np.asarray(annotation_offsets, dtype=np.uint64)
+        self.ranges = None if ranges is None else np.asarray(ranges, dtype=np.int64).reshape(-1, 2)
+        n = len(self.bucket_ids)
+        assert len(self.key_offsets) == n + 1 and len(self.annotation_offsets) == n + 1
+        assert self.labels is None or len(self.labels) == n
+        assert self.ranges is None or len(self.ranges) == n
+
+    def __len__(self):
+        return len(self.bucket_ids)
+
+    def bucket(self, index: int) -> str:
+        return self.buckets[self.bucket_ids[index]]
+
+    def key(self, index: int) -> str:
+        return self.keys[self.key_offsets[index]:self.key_offsets[index + 1]].tobytes().decode("utf-8")
+
+    def label(self, index: int) -> int:
+        return int(self.labels[index])
+
+    def annotation(self, index: int):
+        """解析并返回第 ``index`` 个样本的原始标注"""
+        start, end = self.annotation_offsets[index], self.annotation_offsets[index + 1]
+        return json.loads(self.annotations[start:end].tobytes())
+
+    def location(self, index: int) -> Tuple[str, str, Optional[int], Optional[int]]:
+        """返回 (bucket, key, start, end)，不是对象中的一段时 start、end 为 None"""
+        if self.ranges is None:
+            return self.bucket(index), self.key(index), None, None
+        start, end = self.ranges[index]
+        return self.bucket(index), self.key(index), int(start), int(end)
+
+    @classmethod
+    def _build(cls, samples, label_fn: Optional[Callable]) -> "ManifestStore":
+        bucket_index: Dict[str, int] = {}
+        bucket_ids = array("I")
+        keys = bytearray()
+        key_offsets = array("Q", [0])
+        labels = array("q")
+        annotations = bytearray()
+        annotation_offsets = array("Q", [0])
+        starts, ends = array("q"), array("q")
+        ranged = None
+        for bucket, key, sample_range, annotation in samples:
+            bucket_ids.append(bucket_index.setdefault(bucket, len(bucket_index)))
+            keys += key.encode("utf-8")
+            key_offsets.append(len(keys))
+            if label_fn is not None:
+                try:
+                    labels.append(label_fn(annotation))
+                except (KeyError, IndexError, TypeError, ValueError):
+                    labels.append(NO_LABEL)
+            annotations += json.dumps(annotation, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            annotation_offsets.append(len(annotations))
+            if ranged is None:
+                ranged = sample_range is not None
+            if ranged:
+                starts.append(sample_range[0])
+                ends.append(sample_range[1])
+        return cls(
+            list(bucket_index),
+            np.frombuffer(bucket_ids, dtype=np.uint32),
+            np.frombuffer(keys, dtype=np.uint8),
+            np.frombuffer(key_offsets, dtype=np.uint64),
+            np.frombuffer(labels, dtype=np.int64) if label_fn is not None else None,
+            np.frombuffer(annotations, dtype=np.uint8),
+            np.frombuffer(annotation_offsets, dtype=np.uint64),
+            np.stack([np.frombuffer(starts, dtype=np.int64), np.frombuffer(ends, dtype=np.int64)], axis=1)
+            if ranged else None,
+        )
+
+    @classmethod
+    def from_manifest_file(
+        cls,
+        manifest_file_path: str,
+        url_keyword: str = "ImageURL",
+        label_fn: Optional[Callable] = default_label,
+    ) -> "ManifestStore":
+        """逐行读取 manifest 文件构建，不会生成每个样本的 Python 对象列表
+
+        Args:
+            manifest_file_path(str): 本地 manifest 文件路径，每行一个 JSON
+            url_keyword(str): 样本 tos url 在 ``Data`` 中的字段名
+            label_fn(callable): 从标注中解析整数标签，为 None 时不解析；解析失败的样本标签为 ``NO_LABEL``
+        """
+
+        def samples():
+            with open(manifest_file_path, encoding="utf-8") as f:
+                for line in f:
+                    manifest_line = json.loads(line)
+                    bucket, key = split_tos_url(manifest_line["Data"][url_keyword])
+                    yield bucket, key, None, manifest_line["Annotation"]
+
+        return cls._build(samples(), label_fn)
+
+    @classmethod
+    def from_manifest_info(cls, manifest_info: Dict, label_fn: Optional[Callable] = default_label) -> "ManifestStore":
+        """从 ``TorchTOSDataset`` 使用的 ``manifest_info`` 转换"""
+        ranges = manifest_info.get("ranges")
+        samples = (
+            (bucket, key, ranges[i] if ranges is not None else None, annotation)
+            for i, (bucket, key, annotation) in enumerate(
+                zip(manifest_info["buckets"], manifest_info["keys"], manifest_info["annotations"]),
+            )
+        )
+        return cls._build(samples, label_fn)
+
+    def save(self, file):
+        """保存到本地路径或可写的 file-like 对象"""
+        arrays = {
+            "buckets": np.array(self.buckets, dtype=str),
+            "bucket_ids": self.bucket_ids,
+            "keys": self.keys,
+            "key_offsets": self.key_offsets,
+            "annotations": self.annotations,
+            "annotation_offsets": self.annotation_offsets,
+        }
+        if self.labels is not None:
+            arrays["labels"] = self.labels
+        if self.ranges is not None:
+            arrays["ranges"] = self.ranges
+        np.savez(file, **arrays)
+
+    @classmethod
+    def load(cls, file) -> "ManifestStore":
+        """从本地路径或可读的 file-like 对象加载"""
+        with np.load(file, allow_pickle=False) as data:
+            return cls(
+                data["buckets"].tolist(),
+                data["bucket_ids"],
+                data["keys"],
+                data["key_offsets"],
+                data["labels"] if "labels" in data else None,
+                data["annotations"],
+                data["annotation_offsets"],
+                data["ranges"] if "ranges" in data else None,
+            )
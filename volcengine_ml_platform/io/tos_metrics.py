@@ -0,0 +1,450 @@
+"""TOS 传输的指标采集
+
+在 botocore 层面记录每个请求的首字节时间（TTFB）、总耗时、传输字节数、重试次数和正在进行的请求数，
+自适应并发控制器还会上报当前并发数和吞吐量。指标写入通过 ``add_sink`` 注册的 sink，没有 sink 时
+所有采集点只做一次判断，开销可以忽略。::
+
+    from volcengine_ml_platform.io import tos_metrics
+    sink = tos_metrics.PrometheusSink()
+    tos_metrics.add_sink(sink)
+    ...
+    print(sink.render())
+
+内置三种 sink：``InMemorySink`` 、输出 Prometheus 文本格式的 ``PrometheusSink`` ，以及安装了
+``opentelemetry-api`` 时可用的 ``OpenTelemetrySink`` 。自定义 sink 继承 ``MetricsSink`` 即可。
+
+指标：
+
+- ``tos_requests_total{operation, status}`` ：请求数，status 为 HTTP 状态码或 ``error``
+- ``tos_retries_total{operation}`` ：重试次数，包括读取中断后的续传
+- ``tos_bytes_total{direction}`` ：传输字节数，direction 为 ``read`` 或 ``write``
+- ``tos_request_ttfb_seconds{operation}`` ：从发出请求到收到响应头的耗时分布
+- ``tos_request_duration_seconds{operation}`` ：请求总耗时分布，``GetObject`` 包括读完响应体的时间
+- ``tos_in_flight_requests`` ：正在进行的请求数
+- ``tos_concurrency_limit`` 、``tos_throughput`` ：``AdaptiveConcurrency`` 的当前并发数及吞吐量（每秒传输量）
+"""
+import bisect
+import io
+import os
+import tempfile
+import threading
+import time
+from typing import Dict
+from typing import Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+REQUESTS = "tos_requests_total"
+RETRIES = "tos_retries_total"
+BYTES = "tos_bytes_total"
+TTFB = "tos_request_ttfb_seconds"
+DURATION = "tos_request_duration_seconds"
+IN_FLIGHT = "tos_in_flight_requests"
+CONCURRENCY_LIMIT = "tos_concurrency_limit"
+THROUGHPUT = "tos_throughput"
+
+_CALL_START = "tos_metrics_call_start"
+_ATTEMPT_START = "tos_metrics_attempt_start"
+
+
+class MetricsSink:
+    """sink 基类，labels 为 ``dict[str, str]``"""
+
+    def counter(self, name: str, value: float, labels: Dict[str, str]):
+        pass
+
+    def histogram(self, name: str, value: float, labels: Dict[str, str]):
+        pass
+
+    def gauge(self, name: str, value: float, labels: Dict[str, str]):
+        pass
+
+
+def request_body_length(request) -> int:
+    """返回 botocore 请求体的字节数，aws-chunked 编码的请求返回编码前的长度"""
+    headers = request.headers
+    length = headers.get("X-Amz-Decoded-Content-Length") or headers.get("Content-Length")
+    if length is not None:
+        return int(length)
+    body = request.body
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    if isinstance(body, io.IOBase) and body.seekable():
+        pos = body.tell()
+        end = body.seek(0, io.SEEK_END)
+        body.seek(pos)
+        return end - pos
+    return 0
+
+
+def _label_key(labels) -> Tuple:
+    return tuple(sorted(labels.items()))
+
+
+class InMemorySink(MetricsSink):
+    """把指标聚合在内存中，可以随时通过 ``value`` 、``histogram_stats`` 、``snapshot`` 读取
+
+    Args:
+        buckets(tuple): 耗时分布的桶边界，单位秒
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._counters: dict = {}
+        self._gauges: dict = {}
+        self._histograms: dict = {}
+
+    def counter(self, name, value, labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge(self, name, value, labels):
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def histogram(self, name, value, labels):
+        key = (name, _label_key(labels))
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                # per-bucket counts, the last one is +Inf, then sum
+                hist = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            hist[0][idx] += 1
+            hist[1] += value
+
+    def value(self, name: str, **labels) -> float:
+        """返回 counter 或 gauge 的值，不指定 labels 时把所有 label 组合的 counter 加起来"""
+        with self._lock:
+            key = (name, _label_key(labels))
+            if key in self._gauges:
+                return self._gauges[key]
+            if labels:
+                return self._counters.get(key, 0)
+            return sum(v for (n, _), v in self._counters.items() if n == name)
+
+    def rate(self, name: str, **labels) -> float:
+        """counter 自 sink 创建以来的平均速率，比如 ``rate("tos_bytes_total", direction="read")`` 为平均下载吞吐量"""
+        elapsed = time.monotonic() - self.started
+        return self.value(name, **labels) / elapsed if elapsed > 0 else 0.0
+
+    def histogram_stats(self, name: str, **labels) -> dict:
+        """返回分布的 count、sum 以及各个桶的累积计数 ``{le: count}``"""
+        with self._lock:
+            hist = self._histograms.get((name, _label_key(labels)))
+            if hist is None:
+                return {"count": 0, "sum": 0.0, "buckets": {}}
+            counts, total = list(hist[0]), hist[1]
+        cumulative, buckets = 0, {}
+        for le, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            buckets[le] = cumulative
+        return {"count": cumulative, "sum": total, "buckets": buckets}
+
+    def snapshot(self) -> dict:
+        """返回所有指标的拷贝：``{"counters": ..., "gauges": ..., "histograms": ...}``"""
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "histograms": {k: (list(v[0]), v[1]) for k, v in self._histograms.items()},
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+        self.started = time.monotonic()
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for k, v in items
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class PrometheusSink(InMemorySink):
+    """在 ``InMemorySink`` 的基础上输出 Prometheus 文本格式，可以由 HTTP 服务返回，或通过 ``write`` 写给
+    node_exporter 的 textfile collector"""
+
+    def render(self) -> str:
+        """返回 Prometheus 文本格式的所有指标"""
+        snap = self.snapshot()
+        lines = []
+        typed = set()
+
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in sorted(snap["counters"].items()):
+            declare(name, "counter")
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for (name, labels), value in sorted(snap["gauges"].items()):
+            declare(name, "gauge")
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for (name, labels), (counts, total) in sorted(snap["histograms"].items()):
+            declare(name, "histogram")
+            cumulative = 0
+            for le, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le_label = (("le", _format_value(le)),)
+                lines.append(f"{name}_bucket{_format_labels(labels, le_label)} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """把指标原子地写入 ``path``"""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tos-metrics-")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+class OpenTelemetrySink(MetricsSink):
+    """把指标写入 OpenTelemetry，需要安装 ``opentelemetry-api``
+
+    Args:
+        meter: OpenTelemetry 的 Meter，默认使用全局 MeterProvider 的 ``volcengine_ml_platform.io.tos``
+    """
+
+    def __init__(self, meter=None):
+        if meter is None:
+            from opentelemetry import metrics
+
+            meter = metrics.get_meter("volcengine_ml_platform.io.tos")
+        self.meter = meter
+        self._lock = threading.Lock()
+        self._instruments: dict = {}
+        self._gauge_values: dict = {}
+
+    def _instrument(self, name, kind):
+        instrument = self._instruments.get(name)
+        if instrument is not None:
+            return instrument
+        with self._lock:
+            instrument = self._instruments.get(name)
+            if instrument is None:
+                if kind == "counter":
+                    instrument = self.meter.create_counter(name)
+                elif kind == "histogram":
+                    unit = "s" if name.endswith("_seconds") else ""
+                    instrument = self.meter.create_histogram(name, unit=unit)
+                elif hasattr(self.meter, "create_gauge"):
+                    instrument = self.meter.create_gauge(name)
+                else:
+                    # opentelemetry-api < 1.23 only has asynchronous gauges
+                    instrument = self.meter.create_observable_gauge(
+                        name, callbacks=[lambda options, name=name: self._observe(name)],
+                    )
+                self._instruments[name] = instrument
+        return instrument
+
+    def _observe(self, name):
+        from opentelemetry.metrics import Observation
+
+        with self._lock:
+            values = [(k, v) for (n, k), v in self._gauge_values.items() if n == name]
+        return [Observation(v, dict(k)) for k, v in values]
+
+    def counter(self, name, value, labels):
+        self._instrument(name, "counter").add(value, attributes=labels)
+
+    def histogram(self, name, value, labels):
+        self._instrument(name, "histogram").record(value, attributes=labels)
+
+    def gauge(self, name, value, labels):
+        instrument = self._instrument(name, "gauge")
+        if hasattr(instrument, "set"):
+            instrument.set(value, attributes=labels)
+        else:
+            with self._lock:
+                self._gauge_values[(name, _label_key(labels))] = value
+
+
+_sinks: tuple = ()
+_sinks_lock = threading.Lock()
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+
+def add_sink(sink: MetricsSink) -> MetricsSink:
+    """注册 sink 并开启指标采集，返回 sink"""
+    global _sinks
+    with _sinks_lock:
+        _sinks = _sinks + (sink,)
+    return sink
+
+
+def remove_sink(sink: MetricsSink):
+    """移除 sink，没有 sink 时停止采集"""
+    global _sinks
+    with _sinks_lock:
+        _sinks = tuple(s for s in _sinks if s is not sink)
+
+
+def enabled() -> bool:
+    return bool(_sinks)
+
+
+def counter(name: str, value: float = 1, **labels):
+    for sink in _sinks:
+        sink.counter(name, value, labels)
+
+
+def histogram(name: str, value: float, **labels):
+    for sink in _sinks:
+        sink.histogram(name, value, labels)
+
+
+def gauge(name: str, value: float, **labels):
+    for sink in _sinks:
+        sink.gauge(name, value, labels)
+
+
+def record_retry(operation: str):
+    if _sinks:
+        counter(RETRIES, operation=operation)
+
+
+def _add_in_flight(delta):
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight += delta
+        value = _in_flight
+    gauge(IN_FLIGHT, value)
+
+
+class MetricsBody:
+    """包装 GetObject 的响应流，统计读取的字节数，读完或关闭时记录请求总耗时"""
+
+    def __init__(self, body, operation, start):
+        self._body = body
+        self._operation = operation
+        self._start = start
+        self._finished = False
+
+    def _account(self, n, requested):
+        if n:
+            counter(BYTES, n, direction="read")
+        elif requested != 0:
+            # end of stream
+            self._finish()
+
+    def read(self, amt=None):
+        data = self._body.read(amt)
+        self._account(len(data), amt)
+        if amt is None or amt < 0:
+            self._finish()
+        return data
+
+    def readinto(self, b):
+        readinto = getattr(self._body, "readinto", None)
+        if readinto is not None:
+            n = readinto(b)
+        else:
+            data = self._body.read(len(b))
+            n = len(data)
+            memoryview(b).cast("B")[:n] = data
+        self._account(n, len(b))
+        return n
+
+    def iter_chunks(self, chunk_size=1048576):
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def __iter__(self):
+        return self.iter_chunks()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self._finish()
+        self._body.close()
+
+    def _finish(self):
+        if not self._finished:
+            self._finished = True
+            histogram(DURATION, time.perf_counter() - self._start, operation=self._operation)
+            _add_in_flight(-1)
+
+    def __getattr__(self, name):
+        return getattr(self._body, name)
+
+
+def install(client):
+    """在 boto3 s3 client 上注册采集指标的事件钩子"""
+
+    def before_call(context, **kwargs):
+        if _sinks:
+            context[_CALL_START] = time.perf_counter()
+            _add_in_flight(1)
+
+    def request_created(request, **kwargs):
+        if _sinks:
+            request.context[_ATTEMPT_START] = time.perf_counter()
+
+    def before_send(request, **kwargs):
+        if _sinks:
+            length = request_body_length(request)
+            if length:
+                counter(BYTES, length, direction="write")
+        # returning a value would short-circuit the request
+
+    def response_received(context, response_dict=None, exception=None, **kwargs):
+        if not _sinks or _ATTEMPT_START not in context:
+            return
+        operation = kwargs["event_name"].rsplit(".", 1)[-1]
+        if response_dict is not None:
+            histogram(TTFB, time.perf_counter() - context[_ATTEMPT_START], operation=operation)
+            counter(REQUESTS, operation=operation, status=str(response_dict["status_code"]))
+        else:
+            counter(REQUESTS, operation=operation, status="error")
+
+    def after_call(http_response, parsed, model, context, **kwargs):
+        start = context.pop(_CALL_START, None)
+        if start is None:
+            return
+        if model.name == "GetObject" and "Body" in parsed and http_response.status_code < 300:
+            # finished when the body has been read
+            parsed["Body"] = MetricsBody(parsed["Body"], model.name, start)
+            return
+        histogram(DURATION, time.perf_counter() - start, operation=model.name)
+        _add_in_flight(-1)
+
+    def after_call_error(context, **kwargs):
+        if context.pop(_CALL_START, None) is not None:
+            _add_in_flight(-1)
+
+    events = client.meta.events
+    events.register("before-call.s3", before_call)
+    events.register("request-created.s3", request_created)
+    events.register("before-send.s3", before_send)
+    events.register("response-received.s3", response_received)
+    events.register("after-call.s3", after_call)
+    events.register("after-call-error.s3", after_call_error)
+
@@ -0,0 +1,366 @@
+"""小文件打包：把数据集中的大量小对象打包成大的 shard 对象
+
+数据集由数百万个几十 KB 的小文件组成时，逐个请求对象的开销远大于数据传输本身。``pack_manifest`` 把
+manifest 中的样本依次写入 tar 格式（与 WebDataset 兼容）的 shard 并上传到 TOS，同时生成紧凑的偏移索引
+``index.npz`` ，其中记录每个样本所在的 shard、数据的字节偏移和大小，以及原始的 manifest 行（保留标注）。
+
+读取时 ``ShardReader`` 既可以按偏移用 Range GET 随机读取单个样本，也可以顺序流式读取整个 shard：::
+
+    index = pack_manifest(manifest_lines, "ImageURL", "tos://bucket/packed/")
+    reader = ShardReader(ShardIndex.from_tos(index_url("tos://bucket/packed/")))
+    image = Image.open(reader.read(0))
+    for i, manifest, data in reader:
+        ...
+
+每个样本在 shard 中对应两个成员：``{序号:09d}{扩展名}`` 为原始数据，``{序号:09d}.json`` 为 manifest 行。
+url 与前面的样本重复时数据只保存一次，重复的样本只有 ``.json`` 成员，索引中的位置指向第一次出现的数据。
+"""
+import io
+import json
+import os
+import tarfile
+import tempfile
+from logging import debug
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+
+from volcengine_ml_platform.io import tos
+from volcengine_ml_platform.io.tos_transfer import MemoryViewReader
+from volcengine_ml_platform.util import dedup
+
+DEFAULT_SHARD_SIZE = 268435456  # 256MiB
+INDEX_FILENAME = "index.npz"
+SHARD_NAME_FORMAT = "shard-{:06d}.tar"
+SAMPLE_NAME_FORMAT = "{:09d}"
+MANIFEST_SUFFIX = ".json"
+
+_BLOCK_SIZE = tarfile.BLOCKSIZE
+
+
+def index_url(tos_prefix: str) -> str:
+    """返回打包到 ``tos_prefix`` 的数据集的索引文件地址"""
+    return tos_prefix.rstrip("/") + "/" + INDEX_FILENAME
+
+
+class ShardIndex:
+    """shard 的偏移索引，所有样本的位置信息保存在几个 NumPy 数组中
+
+    Args:
+        shards(list): 各个 shard 的 tos url
+        shard_ids(np.ndarray): 每个样本所在 shard 的序号
+        offsets(np.ndarray): 每个样本数据在 shard 中的起始字节
+        sizes(np.ndarray): 每个样本数据的字节数
+        manifest(np.ndarray): 所有 manifest 行的 JSON 拼接成的字节数组
+        manifest_offsets(np.ndarray): 第 i 行 manifest 为 ``manifest[manifest_offsets[i]:manifest_offsets[i + 1]]``
+    """
+
+    def __init__(self, shards, shard_ids, offsets, sizes, manifest, manifest_offsets):
+        self.shards = [str(s) for s in shards]
+        self.shard_ids = np.asarray(shard_ids, dtype=np.uint32)
+        self.offsets = np.asarray(offsets, dtype=np.uint64)
+        self.sizes = np.asarray(sizes, dtype=np.uint64)
+        self.manifest = np.asarray(manifest, dtype=np.uint8)
+        self.manifest_offsets = np.asarray(manifest_offsets, dtype=np.uint64)
+        assert len(self.shard_ids) == len(self.offsets) == len(self.sizes) == len(self.manifest_offsets) - 1
+
+    def __len__(self):
+        return len(self.shard_ids)
+
+    def manifest_line(self, index: int) -> dict:
+        """返回第 ``index`` 个样本的原始 manifest 行"""
+        start, end = self.manifest_offsets[index], self.manifest_offsets[index + 1]
+        return json.loads(self.manifest[start:end].tobytes())
+
+    def annotation(self, index: int):
+        return self.manifest_line(index).get("Annotation")
+
+    def location(self, index: int) -> Tuple[str, str, int, int]:
+        """返回样本数据的 (bucket, key, start, end)，``end`` 包含在内，可直接用于 Range GET"""
+        bucket, key = tos.split_tos_url(self.shards[self.shard_ids[index]])
+        start = int(self.offsets[index])
+        return bucket, key, start, start + int(self.sizes[index]) - 1
+
+    def samples_of(self, shard: int) -> np.ndarray:
+        """返回第 ``shard`` 个 shard 中所有样本的序号"""
+        return np.flatnonzero(self.shard_ids == shard)
+
+    def manifest_info(self) -> dict:
+        """转换为 ``TorchTOSDataset`` 的 ``manifest_info`` ，每个样本通过 Range GET 读取"""
+        shards = [tos.split_tos_url(url) for url in self.shards]
+        starts = self.offsets.tolist()
+        ends = (self.offsets + self.sizes - 1).tolist()
+        return {
+            "buckets": [shards[s][0] for s in self.shard_ids.tolist()],
+            "keys": [shards[s][1] for s in self.shard_ids.tolist()],
+            "annotations": [self.annotation(i) for i in range(len(self))],
+            "ranges": list(zip(starts, ends)),
+        }
+
+    def save(self, file):
+        """保存到本地路径或可写的 file-like 对象"""
+        np.savez_compressed(
+            file,
+            shards=np.array(self.shards, dtype=str),
+            shard_ids=self.shard_ids,
+            offsets=self.offsets,
+            sizes=self.sizes,
+            manifest=self.manifest,
+            manifest_offsets=self.manifest_offsets,
+        )
+
+    @classmethod
+    def load(cls, file) -> "ShardIndex":
+        """从本地路径或可读的 file-like 对象加载"""
+        with np.load(file, allow_pickle=False) as data:
+            return cls(
+                data["shards"].tolist(),
+                data["shard_ids"],
+                data["offsets"],
+                data["sizes"],
+                data["manifest"],
+                data["manifest_offsets"],
+            )
+
+    @classmethod
+    def from_tos(cls, url: str, tos_client: Optional[tos.TOSClient] = None) -> "ShardIndex":
+        """从 TOS 加载索引
+
+        Args:
+            url(str): 索引文件的 tos url，参见 ``index_url``
+            tos_client(TOSClient): 为 None 时创建默认的 client
+        """
+        tos_client = tos_client or tos.TOSClient()
+        bucket, key = tos.split_tos_url(url)
+        stream = tos_client.get_object(bucket, key)
+        try:
+            return cls.load(io.BytesIO(stream.read()))
+        finally:
+            stream.close()
+
+
+class _ShardWriter:
+    """把样本依次写入本地的 tar 文件，达到指定大小后上传并开始下一个 shard"""
+
+    def __init__(self, tos_client, bucket, prefix, work_dir, shard_size, max_samples):
+        self.tos_client = tos_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.work_dir = work_dir
+        self.shard_size = shard_size
+        self.max_samples = max_samples
+        self.shards: List[str] = []
+        self.shard_ids: List[int] = []
+        self.offsets: List[int] = []
+        self.sizes: List[int] = []
+        self.manifest = bytearray()
+        self.manifest_offsets = [0]
+        self._tar = None
+        self._path = ""
+        self._samples = 0
+
+    def _open(self):
+        name = SHARD_NAME_FORMAT.format(len(self.shards))
+        self._path = os.path.join(self.work_dir, name)
+        self._tar = tarfile.open(self._path, mode="w", format=tarfile.USTAR_FORMAT)
+        self._samples = 0
+        self.shards.append(f"tos://{self.bucket}/{self.prefix}{name}")
+
+    def _add_member(self, name, data) -> int:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mode = 0o644
+        self._tar.addfile(info, MemoryViewReader(data))
+        # the member data ends at the current offset, padded to a whole block
+        return self._tar.offset - (info.size + _BLOCK_SIZE - 1) // _BLOCK_SIZE * _BLOCK_SIZE
+
+    def add(self, index, ext, data, manifest_line: bytes):
+        if self._tar is None:
+            self._open()
+        name = SAMPLE_NAME_FORMAT.format(index)
+        self.shard_ids.append(len(self.shards) - 1)
+        self.offsets.append(self._add_member(name + ext, data))
+        self.sizes.append(len(data))
+        self._add_member(name + MANIFEST_SUFFIX, manifest_line)
+        self.manifest += manifest_line
+        self.manifest_offsets.append(len(self.manifest))
+        self._added()
+
+    def add_alias(self, index, source, manifest_line: bytes):
+        """添加一个与第 ``source`` 个样本数据相同的样本，只写入 manifest 行"""
+        if self._tar is None:
+            self._open()
+        self.shard_ids.append(self.shard_ids[source])
+        self.offsets.append(self.offsets[source])
+        self.sizes.append(self.sizes[source])
+        self._add_member(SAMPLE_NAME_FORMAT.format(index) + MANIFEST_SUFFIX, manifest_line)
+        self.manifest += manifest_line
+        self.manifest_offsets.append(len(self.manifest))
+        self._added()
+
+    def _added(self):
+        self._samples += 1
+        if self._tar.offset >= self.shard_size or (self.max_samples and self._samples >= self.max_samples):
+            self.flush()
+
+    def flush(self):
+        if self._tar is None:
+            return
+        self._tar.close()
+        self._tar = None
+        url = self.shards[-1]
+        debug("upload shard %s, %d samples", url, self._samples)
+        self.tos_client.upload_file(self._path, *tos.split_tos_url(url))
+        os.remove(self._path)
+
+    def close(self):
+        if self._tar is not None:
+            self._tar.close()
+            self._tar = None
+            os.remove(self._path)
+
+    def index(self) -> ShardIndex:
+        return ShardIndex(
+            self.shards,
+            self.shard_ids,
+            self.offsets,
+            self.sizes,
+            np.frombuffer(self.manifest, dtype=np.uint8),
+            self.manifest_offsets,
+        )
+
+
+def _iter_objects(
+    tos_client,
+    items: Iterable[Tuple[object, str]],
+    parallelism: int,
+) -> Iterator[Tuple[object, memoryview]]:
+    """并发读取 ``items`` 中每个 (附带信息, tos url) 对应的对象，按顺序返回 (附带信息, 数据)
+
+    同时最多有 ``parallelism`` 个请求在进行，``items`` 可以是生成器，不会被一次性读入内存。url 为 None 的
+    元素不读取，数据为 None。
+    """
+
+    def fetch(item):
+        payload, url = item
+        if url is None:
+            return payload, None
+        return payload, tos_client.get_object_view(*tos.split_tos_url(url)).getbuffer()
+
+    return tos.map_ahead(fetch, items, parallelism)
+
+
+def pack_manifest(
+    manifest_lines: Iterable[dict],
+    url_keyword: str,
+    tos_prefix: str,
+    tos_client: Optional[tos.TOSClient] = None,
+    shard_size: int = DEFAULT_SHARD_SIZE,
+    max_samples_per_shard: int = 0,
+    parallelism: int = 32,
+    work_dir: Optional[str] = None,
+    dedup_capacity: int = dedup.DEFAULT_CAPACITY,
+) -> ShardIndex:
+    """把 manifest 中的样本打包成 shard 上传到 ``tos_prefix`` ，索引保存为 ``index_url(tos_prefix)``
+
+    Args:
+        manifest_lines(Iterable[dict]): 解析后的 manifest 行，样本序号即其顺序
+        url_keyword(str): 样本数据的 tos url 在 ``manifest_line["Data"]`` 中的字段名，比如 ``ImageURL``
+        tos_prefix(str): shard 及索引的上传位置，比如 ``tos://bucket/packed/``
+        tos_client(TOSClient): 为 None 时创建默认的 client
+        shard_size(int): 单个 shard 的目标大小，超过后开始下一个 shard
+        max_samples_per_shard(int): 大于 0 时同时限制单个 shard 的样本数
+        parallelism(int): 读取小对象的并发数
+        work_dir(str): 暂存 shard 的本地目录，默认为系统临时目录
+        dedup_capacity(int): 去重时记住的不同 url 数量，url 重复的样本共用同一份数据
+
+    Returns:
+        返回 ``ShardIndex``
+
+    """
+    tos_client = tos_client or tos.TOSClient()
+    bucket, prefix = tos.split_tos_url(tos_prefix)
+    if prefix and not prefix.endswith("/"):
+        prefix += "/"
+    # url -> index of the first sample with that url
+    seen = dedup.RecentKeys(dedup_capacity)
+
+    def items():
+        for i, line in enumerate(manifest_lines):
+            url = line["Data"][url_keyword]
+            source = seen.setdefault(url, i)
+            yield (line, source), url if source == i else None
+
+    with tempfile.TemporaryDirectory(dir=work_dir, prefix=".tos-shards-") as tmp_dir:
+        writer = _ShardWriter(tos_client, bucket, prefix, tmp_dir, shard_size, max_samples_per_shard)
+        try:
+            for i, ((line, source), data) in enumerate(_iter_objects(tos_client, items(), parallelism)):
+                manifest_line = json.dumps(line, ensure_ascii=False).encode("utf-8")
+                if data is None:
+                    writer.add_alias(i, source, manifest_line)
+                    continue
+                ext = os.path.splitext(tos.split_tos_url(line["Data"][url_keyword])[1])[1].lower()
+                writer.add(i, ext, data, manifest_line)
+            writer.flush()
+        finally:
+            writer.close()
+        index = writer.index()
+        index_path = os.path.join(tmp_dir, INDEX_FILENAME)
+        index.save(index_path)
+        tos_client.upload_file(index_path, bucket, prefix + INDEX_FILENAME)
+    debug("packed %d samples into %d shards under %s", len(index), len(index.shards), tos_prefix)
+    return index
+
+
+class ShardReader:
+    """读取 ``pack_manifest`` 生成的 shard
+
+    Args:
+        index(ShardIndex): shard 索引
+        tos_client(TOSClient): 为 None 时在第一次读取时创建，便于在 DataLoader 的子进程中使用
+    """
+
+    def __init__(self, index: ShardIndex, tos_client: Optional[tos.TOSClient] = None):
+        self.index = index
+        self.tos_client = tos_client
+
+    def _client(self) -> tos.TOSClient:
+        if self.tos_client is None:
+            self.tos_client = tos.TOSClient()
+        return self.tos_client
+
+    def __len__(self):
+        return len(self.index)
+
+    def read(self, index: int) -> MemoryViewReader:
+        """用一次 Range GET 读取单个样本的数据，返回值可直接传给 ``PIL.Image.open``"""
+        bucket, key, start, end = self.index.location(index)
+        if end < start:
+            return MemoryViewReader(bytearray())
+        return self._client().get_object_view(bucket, key, start, end)
+
+    def iter_shard(self, shard: int) -> Iterator[Tuple[int, dict, bytes]]:
+        """顺序流式读取整个 shard，依次返回其中样本的 (样本序号, manifest 行, 数据)
+
+        url 与前面的样本重复、数据只保存了一次的样本不会单独返回
+        """
+        bucket, key = tos.split_tos_url(self.index.shards[shard])
+        stream = self._client().get_object(bucket, key)
+        try:
+            with tarfile.open(fileobj=stream, mode="r|") as tar:
+                for member in tar:
+                    name, ext = os.path.splitext(member.name)
+                    if ext == MANIFEST_SUFFIX or not member.isfile():
+                        continue
+                    i = int(name)
+                    yield i, self.index.manifest_line(i), tar.extractfile(member).read()
+        finally:
+            stream.close()
+
+    def __iter__(self) -> Iterator[Tuple[int, dict, bytes]]:
+        for shard in range(len(self.index.shards)):
+            yield from self.iter_shard(shard)
@@ -0,0 +1,154 @@
+"""本地目录与 TOS 前缀增量同步所用的 ETag 计算和本地哈希缓存"""
+import hashlib
+import json
+import math
+import os
+import threading
+from logging import warning
+from typing import Iterable
+
+from volcengine_ml_platform.io.tos_transfer import DEFAULT_CHUNK_SIZE
+from volcengine_ml_platform.io.tos_transfer import DEFAULT_PART_SIZE
+from volcengine_ml_platform.io.tos_transfer import MAX_PART_COUNT
+from volcengine_ml_platform.io.tos_transfer import MIN_PART_SIZE
+from volcengine_ml_platform.io.tos_transfer import READ_BUFFER_SIZE
+from volcengine_ml_platform.util import cache_dir
+
+SYNC_HASH_CACHE_ROOT = ".volcengine_ml_platform/sync_hashes/"
+
+# part sizes used by this SDK, boto3 and common S3 tools, tried in order when
+# matching a multipart ETag
+CANDIDATE_PART_SIZES = (
+    DEFAULT_PART_SIZE,
+    DEFAULT_CHUNK_SIZE,
+    MIN_PART_SIZE,
+    16777216,
+    67108864,
+    104857600,
+)
+
+
+def file_etag(file_path: str, part_size: int = 0) -> str:
+    """计算本地文件上传到 TOS 后的 ETag
+
+    Args:
+        file_path(str): 本地文件路径
+        part_size(int): 为 0 时按整体上传计算（文件 MD5），否则按该分片大小的分片上传计算 ``md5(各分片 md5)-分片数``
+
+    Returns:
+        返回带双引号的 ETag 字符串，与 TOS 返回的格式一致
+
+    """
+    if part_size <= 0:
+        digest = hashlib.md5()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(READ_BUFFER_SIZE), b""):
+                digest.update(block)
+        return f'"{digest.hexdigest()}"'
+
+    part_digests = []
+    with open(file_path, "rb") as f:
+        while True:
+            digest = hashlib.md5()
+            remaining = part_size
+            while remaining > 0:
+                block = f.read(min(READ_BUFFER_SIZE, remaining))
+                if not block:
+                    break
+                digest.update(block)
+                remaining -= len(block)
+            if remaining == part_size:
+                break
+            part_digests.append(digest.digest())
+    combined = hashlib.md5(b"".join(part_digests)).hexdigest()
+    return f'"{combined}-{len(part_digests)}"'
+
+
+def candidate_part_sizes(size: int, part_count: int, preferred: Iterable[int] = ()):
+    """推测产生 ``part_count`` 个分片的分片大小"""
+    seen = set()
+    guesses = list(preferred) + list(CANDIDATE_PART_SIZES)
+    # MultipartUploader grows the part size for very large files
+    guesses.append(math.ceil(size / MAX_PART_COUNT))
+    # tools that split evenly, rounded up to whole MiB
+    guesses.append(math.ceil(size / part_count / 1048576) * 1048576)
+    for part_size in guesses:
+        if part_size <= 0 or part_size in seen:
+            continue
+        seen.add(part_size)
+        if math.ceil(size / part_size) == part_count:
+            yield part_size
+
+
+class LocalHashCache:
+    """以 (相对路径, 大小, mtime) 为 key 缓存本地文件的 ETag，避免每次同步都重新读取未修改的文件
+
+    缓存文件保存在 ``~/.volcengine_ml_platform/sync_hashes/`` 下，每个本地目录一个。
+
+    Args:
+        local_dir(str): 同步的本地目录
+    """
+
+    def __init__(self, local_dir: str):
+        digest = hashlib.sha1(os.path.abspath(local_dir).encode("utf-8")).hexdigest()
+        self.path = os.path.join(cache_dir.HOME_DIR, SYNC_HASH_CACHE_ROOT, digest + ".json")
+        self._lock = threading.Lock()
+        self._entries = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                warning("ignore broken sync hash cache: %s", self.path)
+
+    def etag(self, rel_path: str, file_path: str, stat: os.stat_result, part_size: int = 0) -> str:
+        """返回文件的 ETag，文件未修改时直接使用缓存的结果"""
+        with self._lock:
+            entry = self._entries.get(rel_path)
+            if entry is None or entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+                entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "etags": {}}
+                self._entries[rel_path] = entry
+            etag = entry["etags"].get(str(part_size))
+        if etag is None:
+            etag = file_etag(file_path, part_size)
+            with self._lock:
+                entry["etags"][str(part_size)] = etag
+        return etag
+
+    def matches(
+        self,
+        rel_path: str,
+        file_path: str,
+        stat: os.stat_result,
+        remote_etag: str,
+        preferred_part_sizes: Iterable[int] = (),
+    ) -> bool:
+        """判断本地文件与 ETag 为 ``remote_etag`` 的对象内容是否一致，支持分片上传产生的 ETag"""
+        remote_etag = remote_etag.lower()
+        if not remote_etag.startswith('"'):
+            remote_etag = f'"{remote_etag}"'
+        if "-" not in remote_etag:
+            return self.etag(rel_path, file_path, stat) == remote_etag
+        try:
+            part_count = int(remote_etag.strip('"').rsplit("-", 1)[1])
+        except ValueError:
+            return False
+        for part_size in candidate_part_sizes(stat.st_size, part_count, preferred_part_sizes):
+            if self.etag(rel_path, file_path, stat, part_size) == remote_etag:
+                return True
+        return False
+
+    def retain(self, rel_paths: Iterable[str]):
+        """只保留 ``rel_paths`` 中文件的缓存，丢弃已删除文件的记录"""
+        keep = set(rel_paths)
+        with self._lock:
+            self._entries = {k: v for k, v in self._entries.items() if k in keep}
+
+    def save(self):
+        """把缓存写回磁盘"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with self._lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,134 @@
+"""TOS 传输限速：按读写带宽和请求速率限制进程内的 TOS 访问
+
+限速作用在 botocore 层面，``TOSClient`` 的所有操作（``upload_file``、``download_file``、``download_files``、
+``download_dir``、``get_object`` 等）都会受到限制。可以全局开启：::
+
+    from volcengine_ml_platform.io import tos_throttle
+    tos_throttle.set_default_throttle(tos_throttle.TransferThrottle(
+        read_bytes_per_second=200 * 1024 ** 2,
+        write_bytes_per_second=100 * 1024 ** 2,
+        requests_per_second=500,
+    ))
+
+也可以通过 ``TOSClient(throttle=...)`` 只对单个 client 生效。
+"""
+from typing import Optional
+
+from volcengine_ml_platform.io.tos_metrics import request_body_length
+from volcengine_ml_platform.io.tos_transfer import READ_BUFFER_SIZE
+from volcengine_ml_platform.util.rate_limiter import TokenBucket
+
+
+class TransferThrottle:
+    """读、写带宽及请求速率的令牌桶限速，各项为 None 时不限制
+
+    Args:
+        read_bytes_per_second(float): 下载带宽上限
+        write_bytes_per_second(float): 上传带宽上限
+        requests_per_second(float): 请求速率上限
+    """
+
+    def __init__(
+        self,
+        read_bytes_per_second: Optional[float] = None,
+        write_bytes_per_second: Optional[float] = None,
+        requests_per_second: Optional[float] = None,
+    ):
+        self.read_bucket = TokenBucket(read_bytes_per_second) if read_bytes_per_second else None
+        self.write_bucket = TokenBucket(write_bytes_per_second) if write_bytes_per_second else None
+        self.request_bucket = TokenBucket(requests_per_second) if requests_per_second else None
+
+    def acquire_request(self):
+        if self.request_bucket is not None:
+            self.request_bucket.acquire(1)
+
+    def consume_read(self, n):
+        if self.read_bucket is not None:
+            self.read_bucket.acquire(n)
+
+    def consume_write(self, n):
+        if self.write_bucket is not None:
+            self.write_bucket.acquire(n)
+
+
+class ThrottledBody:
+    """包装 botocore 的 StreamingBody，每读取一段数据就扣除相应的读带宽令牌"""
+
+    def __init__(self, body, throttle: TransferThrottle):
+        self._body = body
+        self._throttle = throttle
+
+    def read(self, amt=None):
+        data = self._body.read(amt)
+        self._throttle.consume_read(len(data))
+        return data
+
+    def readinto(self, b):
+        readinto = getattr(self._body, "readinto", None)
+        if readinto is not None:
+            n = readinto(b)
+        else:
+            data = self._body.read(len(b))
+            n = len(data)
+            memoryview(b).cast("B")[:n] = data
+        self._throttle.consume_read(n)
+        return n
+
+    def iter_chunks(self, chunk_size=READ_BUFFER_SIZE):
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def __iter__(self):
+        return self.iter_chunks()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __getattr__(self, name):
+        return getattr(self._body, name)
+
+
+_default_throttle: Optional[TransferThrottle] = None
+
+
+def set_default_throttle(throttle: Optional[TransferThrottle]):
+    """设置全局限速，对所有未单独指定限速的 ``TOSClient`` 生效，传入 None 取消限速"""
+    global _default_throttle
+    _default_throttle = throttle
+
+
+def get_default_throttle() -> Optional[TransferThrottle]:
+    return _default_throttle
+
+
+def install(client, throttle: Optional[TransferThrottle] = None):
+    """在 boto3 s3 client 上注册限速的事件钩子
+
+    Args:
+        client: boto3 s3 client
+        throttle(TransferThrottle): 为 None 时每次请求都使用当时的全局限速
+    """
+
+    def current():
+        return throttle if throttle is not None else _default_throttle
+
+    def before_send(request, **kwargs):
+        t = current()
+        if t is not None:
+            t.acquire_request()
+            t.consume_write(request_body_length(request))
+        # returning a value would short-circuit the request
+
+    def after_get_object(parsed, **kwargs):
+        t = current()
+        if t is not None and t.read_bucket is not None and "Body" in parsed:
+            parsed["Body"] = ThrottledBody(parsed["Body"], t)
+
+    client.meta.events.register("before-send.s3", before_send)
+    client.meta.events.register("after-call.s3.GetObject", after_get_object)
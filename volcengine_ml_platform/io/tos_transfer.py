@@ -0,0 +1,720 @@
+"""TOS 大文件传输引擎：基于 Range GET 的并发分片下载，以及可断点续传的并发分片上传"""
+import hashlib
+import io
+import json
+import math
+import os
+import queue
+import threading
+import time
+from concurrent.futures import as_completed
+from concurrent.futures import ThreadPoolExecutor
+from logging import debug
+from logging import warning
+
+from botocore.exceptions import ClientError
+from botocore.exceptions import IncompleteReadError
+
+from volcengine_ml_platform.io import tos_compression
+from volcengine_ml_platform.io import tos_metrics
+from volcengine_ml_platform.util import cache_dir
+from volcengine_ml_platform.util import retry
+
+DEFAULT_CHUNK_SIZE = 8388608  # 8MiB
+READ_BUFFER_SIZE = 1048576  # 1MiB
+
+PART_FILE_SUFFIX = ".part"
+STATE_FILE_SUFFIX = ".part.json"
+
+DEFAULT_PART_SIZE = 20971520  # 20MiB
+MIN_PART_SIZE = 5242880  # 5MiB, lower bound of every part except the last one
+MAX_PART_COUNT = 10000
+UPLOAD_CHECKPOINT_ROOT = ".volcengine_ml_platform/upload_checkpoints/"
+
+
+def _pwrite(fd, data, offset, lock):
+    """按偏移量写入文件，不支持 pwrite 的平台退化为加锁的 seek + write"""
+    if hasattr(os, "pwrite"):
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(fd, view, offset)
+            view = view[written:]
+            offset += written
+        return
+    with lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+
+
+def _pread_into(fd, view, offset, lock):
+    """从 ``offset`` 开始把文件内容读满 ``view`` ，返回读取的字节数"""
+    total = 0
+    while total < len(view):
+        if hasattr(os, "preadv"):
+            n = os.preadv(fd, [view[total:]], offset + total)
+        else:
+            with lock:
+                os.lseek(fd, offset + total, os.SEEK_SET)
+                n = os.readv(fd, [view[total:]])
+        if n == 0:
+            break
+        total += n
+    return total
+
+
+def readinto_full(stream, view) -> int:
+    """从 stream 中读取数据直到填满 ``view`` 或读到结尾，返回读取的字节数"""
+    readinto = getattr(stream, "readinto", None)
+    total = 0
+    while total < len(view):
+        if readinto is not None:
+            n = readinto(view[total:])
+        else:
+            # botocore < 1.23 has no StreamingBody.readinto
+            chunk = stream.read(min(READ_BUFFER_SIZE, len(view) - total))
+            n = len(chunk)
+            view[total:total + n] = chunk
+        if not n:
+            break
+        total += n
+    return total
+
+
+class MemoryViewReader(io.RawIOBase):
+    """把 memoryview 包装成只读、可 seek 的 file-like 对象，不复制底层数据
+
+    用作 upload_part 的 Body，以及 ``TOSClient.get_object_view`` 的返回值，``getbuffer()`` 返回底层数据的 memoryview。
+    """
+
+    def __init__(self, view):
+        super().__init__()
+        self._view = memoryview(view).cast("B")
+        self._pos = 0
+
+    def getbuffer(self) -> memoryview:
+        """返回底层数据的 memoryview"""
+        return self._view
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        else:
+            pos = len(self._view) + offset
+        self._pos = max(0, min(pos, len(self._view)))
+        return self._pos
+
+    def readinto(self, b):
+        n = min(len(b), len(self._view) - self._pos)
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def read(self, size=-1):
+        end = len(self._view)
+        if size is not None and size >= 0:
+            end = min(end, self._pos + size)
+        data = self._view[self._pos:end].tobytes()
+        self._pos = end
+        return data
+
+
+def save_stream(stream, target_file_path) -> int:
+    """把 stream 的内容写入 ``target_file_path`` ，先写 ``<target>.part`` 再 rename，返回写入的字节数"""
+    part_path = target_file_path + PART_FILE_SUFFIX
+    total = 0
+    try:
+        with open(part_path, "wb") as f:
+            buffer = memoryview(bytearray(READ_BUFFER_SIZE))
+            while True:
+                n = stream.readinto(buffer)
+                if not n:
+                    break
+                f.write(buffer[:n])
+                total += n
+        os.replace(part_path, target_file_path)
+    except BaseException:
+        _remove_quietly(part_path)
+        raise
+    return total
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def parse_content_range(value: str):
+    """解析 ``bytes <first>-<last>/<total>`` 形式的 ContentRange，返回 (first, last, total)，total 未知时为 None"""
+    span, _, total = value.split(" ")[-1].partition("/")
+    first, _, last = span.partition("-")
+    return int(first), int(last), None if total == "*" else int(total)
+
+
+class ResumableStream(io.RawIOBase):
+    """``get_object`` 的响应流，读取中途连接断开时从已收到的最后一个字节处重新发起 Range 请求继续读取
+
+    续传的请求带上首次响应的 ``IfMatch`` ，保证读到的内容来自同一个对象版本；是否重试以及重试间隔由
+    ``retry_policy`` 决定。
+
+    Args:
+        s3_client: boto3 的 s3 client
+        bucket(str): bucket 名
+        key(str): object 的 key
+        start(int): 起始字节（包含）
+        end(int): 结束字节（包含），为 None 时读到结尾，超出对象大小时读到结尾
+        etag(str): 对象的 ETag，为 None 时使用首次响应的 ETag
+        retry_policy(RetryPolicy): 重试策略，默认使用 ``retry.get_default_retry_policy()``
+
+    ``size`` 为整个对象的字节数。
+    """
+
+    def __init__(self, s3_client, bucket, key, start=0, end=None, etag=None, retry_policy=None):
+        super().__init__()
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self._pos = start
+        self._end = end
+        self._etag = etag
+        self._retry_policy = retry_policy
+        self._body = None
+        self.response = self._open()
+        # the server shortens a range that extends past the end of the object
+        last = start + self.response["ContentLength"] - 1
+        self._end = last if self._end is None else min(self._end, last)
+        self.length = self._end + 1 - start
+        content_range = self.response.get("ContentRange")
+        self.size = parse_content_range(content_range)[2] if content_range else self.response["ContentLength"]
+
+    @property
+    def etag(self):
+        return self._etag
+
+    def _open(self):
+        kwargs = {"Bucket": self.bucket, "Key": self.key}
+        if self._pos > 0 or self._end is not None:
+            kwargs["Range"] = f"bytes={self._pos}-{'' if self._end is None else self._end}"
+        if self._etag:
+            kwargs["IfMatch"] = self._etag
+        rsp = self.s3_client.get_object(**kwargs)
+        if self._etag is None:
+            self._etag = rsp.get("ETag")
+        self._body = rsp["Body"]
+        return rsp
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        view = memoryview(b).cast("B")[:max(0, self._end + 1 - self._pos)]
+        total = 0
+        attempts = 0
+        while total < len(view):
+            try:
+                n = self._read_some(view[total:])
+                if n == 0:
+                    # connection closed before the whole range arrived
+                    raise IncompleteReadError(actual_bytes=self._pos, expected_bytes=self._end + 1)
+            except Exception as e:
+                attempts += 1
+                policy = self._retry_policy or retry.get_default_retry_policy()
+                delay = policy.next_delay(e, attempts) if policy is not None else None
+                if delay is None:
+                    raise
+                debug("resume %s/%s from byte %d after error: %s", self.bucket, self.key, self._pos, e)
+                tos_metrics.record_retry("GetObject")
+                self._body.close()
+                time.sleep(delay)
+                self._open()
+                continue
+            attempts = 0
+            total += n
+            self._pos += n
+        return total
+
+    def _read_some(self, view):
+        readinto = getattr(self._body, "readinto", None)
+        if readinto is not None:
+            return readinto(view)
+        # botocore < 1.23 has no StreamingBody.readinto
+        chunk = self._body.read(min(READ_BUFFER_SIZE, len(view)))
+        view[:len(chunk)] = chunk
+        return len(chunk)
+
+    def read(self, size=-1):
+        remaining = self._end + 1 - self._pos
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        total = 0
+        while total < size:
+            n = self.readinto(view[total:])
+            if not n:
+                break
+            total += n
+        return bytes(view[:total])
+
+    def iter_chunks(self, chunk_size=READ_BUFFER_SIZE):
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def __iter__(self):
+        # same as botocore's StreamingBody
+        return self.iter_chunks()
+
+    def close(self):
+        if self._body is not None:
+            self._body.close()
+        super().close()
+
+
+class ChainedStream(io.RawIOBase):
+    """依次读取 ``streams`` 中的各个流，读完一个并关闭后才取下一个，``streams`` 可以是生成器"""
+
+    def __init__(self, streams):
+        super().__init__()
+        self._streams = iter(streams)
+        self._current = next(self._streams, None)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self._current is not None:
+            n = self._current.readinto(b)
+            if n:
+                return n
+            self._current.close()
+            self._current = next(self._streams, None)
+        return 0
+
+    def close(self):
+        if not self.closed:
+            if self._current is not None:
+                self._current.close()
+            close = getattr(self._streams, "close", None)
+            if close is not None:
+                close()
+        super().close()
+
+
+class RangedDownloader:
+    """把一个对象切成固定大小的分片，并发 Range GET 写入预分配好的本地文件
+
+    下载过程中数据写入 ``<target>.part`` ，``resume`` 时已完成的分片记录在 ``<target>.part.json`` 中，
+    进程中断后再次下载同一对象时只会拉取缺失的分片。所有分片请求都带上 ``IfMatch``
+    ，保证拼出来的文件来自同一个对象版本，下载过程中对象发生变化时请求以 ``PreconditionFailed`` 失败。
+
+    Args:
+        s3_client: boto3 的 s3 client
+        chunk_size(int): 分片大小
+        max_concurrence(int): 并发请求数量
+        retry_policy(RetryPolicy): 分片读取中断时的续传策略，默认使用 ``retry.get_default_retry_policy()``
+    """
+
+    def __init__(self, s3_client, chunk_size=DEFAULT_CHUNK_SIZE, max_concurrence=10, retry_policy=None):
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive")
+        if max_concurrence <= 0:
+            raise ValueError("max_concurrence must be positive")
+        self.s3_client = s3_client
+        self.chunk_size = chunk_size
+        self.max_concurrence = max_concurrence
+        self.retry_policy = retry_policy
+
+    def download(self, bucket, key, target_file_path, etag=None, first_chunk=None, resume=True):
+        """下载对象到 ``target_file_path`` ，返回文件路径
+
+        Args:
+            bucket(str): bucket 名
+            key(str): object 的 key
+            target_file_path(str): 本地保存的目标文件路径
+            etag(str): 指定时只下载该版本的对象
+            first_chunk(ResumableStream): 已经打开的第一个分片（``[0, chunk_size - 1]``）的响应流，
+                直接写入而不再请求，对象大小和 ETag 也取自它的响应，不再 HEAD；由调用方关闭
+            resume(bool): 为 True 时记录已完成的分片，失败后保留 ``.part`` 文件以便续传；
+                为 False 时不写状态文件，失败时删除 ``.part`` 文件
+
+        Raises:
+            IOError: 写入的字节数与对象大小不一致
+            ClientError: 对象的 ETag 与 ``etag`` 不一致，包括下载过程中对象发生了变化
+        """
+        if first_chunk is not None:
+            # the first response already tells the size and the version
+            size = first_chunk.size
+            etag = first_chunk.etag
+            codec = tos_compression.codec_of(first_chunk.response)
+        else:
+            head_kwargs = {"Bucket": bucket, "Key": key}
+            if etag:
+                head_kwargs["IfMatch"] = etag
+            head = self.s3_client.head_object(**head_kwargs)
+            size = head["ContentLength"]
+            etag = head["ETag"]
+            codec = tos_compression.codec_of(head)
+        if codec:
+            # compressed content can only be decoded sequentially
+            debug("download compressed object: bucket %s, key %s, codec %s", bucket, key, codec)
+            stream = ResumableStream(self.s3_client, bucket, key, etag=etag, retry_policy=self.retry_policy)
+            with tos_compression.DecompressingReader(stream, codec) as reader:
+                save_stream(reader, target_file_path)
+            return target_file_path
+        chunk_count = max(1, math.ceil(size / self.chunk_size))
+
+        part_path = target_file_path + PART_FILE_SUFFIX
+        state_path = target_file_path + STATE_FILE_SUFFIX
+        done = self._load_state(state_path, part_path, size, etag) if resume else set()
+        pending = [idx for idx in range(chunk_count) if idx not in done]
+        debug(
+            "ranged download: bucket %s, key %s, size %d, chunks %d, resumed %d",
+            bucket, key, size, chunk_count, len(done),
+        )
+
+        try:
+            written = self._download_chunks(
+                part_path, state_path if resume else None, bucket, key, etag, size, done, pending, first_chunk,
+            )
+            expected = 0
+            for idx in pending:
+                start, end = self._chunk_range(idx, size)
+                expected += max(0, end + 1 - start)
+            if written != expected:
+                raise IOError(
+                    f"size mismatch after download: {target_file_path}, expected {expected} bytes, wrote {written}",
+                )
+            os.replace(part_path, target_file_path)
+        except BaseException:
+            if not resume:
+                _remove_quietly(part_path)
+            raise
+        if resume:
+            _remove_quietly(state_path)
+        return target_file_path
+
+    def _download_chunks(self, part_path, state_path, bucket, key, etag, size, done, pending, first_chunk):
+        """把 ``pending`` 中的分片写入 ``part_path`` ，返回写入的字节数；``state_path`` 为 None 时不记录进度"""
+        fd = os.open(part_path, os.O_RDWR | os.O_CREAT, 0o644)
+        written = 0
+        try:
+            os.ftruncate(fd, size)
+            lock = threading.Lock()
+            workers = min(self.max_concurrence, max(1, len(pending)))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = {}
+                for idx in pending:
+                    if idx == 0 and first_chunk is not None:
+                        futures[pool.submit(self._write_first_chunk, fd, lock, first_chunk, bucket, key, size)] = idx
+                    else:
+                        futures[pool.submit(self._fetch_chunk, fd, lock, bucket, key, etag, size, idx)] = idx
+                try:
+                    for future in as_completed(futures):
+                        written += future.result()
+                        done.add(futures[future])
+                        if state_path is not None:
+                            self._save_state(state_path, size, etag, done)
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+        finally:
+            os.close(fd)
+        return written
+
+    def _chunk_range(self, idx, size):
+        """第 ``idx`` 个分片的 (start, end)，``end`` 包含在内；空对象的分片 ``end < start``"""
+        start = idx * self.chunk_size
+        return start, min(start + self.chunk_size, size) - 1
+
+    @staticmethod
+    def _check_range(response, bucket, key, start, end, size):
+        """确认 Range GET 的响应确实是对象 ``[start, end]`` 这一段，且对象大小没有变化"""
+        length = response.get("ContentLength")
+        if length is not None and length != end + 1 - start:
+            raise IOError(f"unexpected length of {bucket}/{key} range {start}-{end}: {length}")
+        content_range = response.get("ContentRange")
+        if content_range:
+            first, last, total = parse_content_range(content_range)
+            if (first, last) != (start, end) or (total is not None and total != size):
+                raise IOError(
+                    f"unexpected content range of {bucket}/{key}: {content_range}, expect {start}-{end}/{size}",
+                )
+
+    def _fetch_chunk(self, fd, lock, bucket, key, etag, size, idx):
+        start, end = self._chunk_range(idx, size)
+        if end < start:
+            return 0
+        # an interrupted chunk resumes from the last byte received
+        body = ResumableStream(self.s3_client, bucket, key, start, end, etag, self.retry_policy)
+        try:
+            self._check_range(body.response, bucket, key, start, end, size)
+            return self._write_range(fd, lock, body, bucket, key, start, end)
+        finally:
+            body.close()
+
+    def _write_first_chunk(self, fd, lock, body, bucket, key, size):
+        start, end = self._chunk_range(0, size)
+        self._check_range(body.response, bucket, key, start, end, size)
+        return self._write_range(fd, lock, body, bucket, key, start, end)
+
+    @staticmethod
+    def _write_range(fd, lock, body, bucket, key, start, end):
+        buffer = bytearray(min(READ_BUFFER_SIZE, end + 1 - start))
+        view = memoryview(buffer)
+        offset = start
+        while offset <= end:
+            n = body.readinto(view[:end + 1 - offset])
+            if not n:
+                break
+            _pwrite(fd, view[:n], offset, lock)
+            offset += n
+        if offset != end + 1:
+            raise IOError(
+                f"short read on {bucket}/{key} range {start}-{end}: got {offset - start} bytes",
+            )
+        return offset - start
+
+    def _load_state(self, state_path, part_path, size, etag):
+        if not os.path.exists(state_path) or not os.path.exists(part_path):
+            return set()
+        try:
+            with open(state_path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            warning("ignore broken download state file: %s", state_path)
+            return set()
+        if (
+            state.get("etag") != etag
+            or state.get("size") != size
+            or state.get("chunk_size") != self.chunk_size
+        ):
+            debug("object changed since last attempt, restart download: %s", state_path)
+            return set()
+        return set(state.get("done", []))
+
+    def _save_state(self, state_path, size, etag, done):
+        tmp_path = state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "etag": etag,
+                    "size": size,
+                    "chunk_size": self.chunk_size,
+                    "done": sorted(done),
+                },
+                f,
+            )
+        os.replace(tmp_path, state_path)
+
+
+class MultipartUploader:
+    """并发分片上传，支持断点续传
+
+    每个工作线程从缓冲池中取出一块可复用的 ``bytearray`` ，通过 ``preadv``/``readinto`` 把分片读入其中后直接上传，
+    内存占用上限为 ``max_concurrence * part_size`` 。已完成的分片记录在本地 checkpoint 文件中，
+    重新上传同一文件时会通过 ``list_parts`` 确认服务端已有的分片并跳过它们。
+
+    Args:
+        s3_client: boto3 的 s3 client
+        part_size(int): 分片大小，不能小于 5MiB；分片数超过 10000 时自动调大
+        max_concurrence(int): 同时上传的分片数量
+        checkpoint_path(str): checkpoint 文件路径，默认保存在 ``~/.volcengine_ml_platform/upload_checkpoints/`` 下
+        abort_on_failure(bool): 上传出错时是否终止分片上传并删除 checkpoint；为 False 时保留以便之后续传
+    """
+
+    def __init__(
+        self,
+        s3_client,
+        part_size=DEFAULT_PART_SIZE,
+        max_concurrence=10,
+        checkpoint_path=None,
+        abort_on_failure=True,
+    ):
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f"part_size must be at least {MIN_PART_SIZE}")
+        if max_concurrence <= 0:
+            raise ValueError("max_concurrence must be positive")
+        self.s3_client = s3_client
+        self.part_size = part_size
+        self.max_concurrence = max_concurrence
+        self.checkpoint_path = checkpoint_path
+        self.abort_on_failure = abort_on_failure
+
+    def upload(self, file_path, bucket, key):
+        """上传文件，返回 ``complete_multipart_upload`` （小文件为 ``put_object`` ）的结果"""
+        stat = os.stat(file_path)
+        file_size = stat.st_size
+        if file_size <= self.part_size:
+            with open(file_path, mode="rb") as f:
+                return self.s3_client.put_object(Bucket=bucket, Key=key, Body=f)
+
+        part_size = max(self.part_size, math.ceil(file_size / MAX_PART_COUNT))
+        part_count = math.ceil(file_size / part_size)
+        checkpoint_path = self.checkpoint_path or self._default_checkpoint_path(file_path, bucket, key)
+        identity = {
+            "bucket": bucket,
+            "key": key,
+            "file_size": file_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "part_size": part_size,
+        }
+
+        upload_id, done = self._resume(checkpoint_path, identity)
+        if upload_id is None:
+            upload_id = self.s3_client.create_multipart_upload(Bucket=bucket, Key=key)["UploadId"]
+            debug("Multipart upload initiated: %s", upload_id)
+            done = {}
+        self._save_checkpoint(checkpoint_path, identity, upload_id, done)
+        pending = [num for num in range(1, part_count + 1) if num not in done]
+        debug(
+            "multipart upload %s: %d parts, %d already uploaded",
+            upload_id, part_count, len(done),
+        )
+
+        try:
+            self._upload_parts(
+                file_path, bucket, key, upload_id, part_size, file_size,
+                pending, done, checkpoint_path, identity,
+            )
+            rsp = self.s3_client.complete_multipart_upload(
+                Bucket=bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={
+                    "Parts": [
+                        {"PartNumber": num, "ETag": done[num]} for num in sorted(done)
+                    ],
+                },
+            )
+        except Exception:
+            if self.abort_on_failure:
+                self._abort(bucket, key, upload_id, checkpoint_path)
+            raise
+        debug("Multipart upload completed: %s", rsp)
+        self._remove_checkpoint(checkpoint_path)
+        return rsp
+
+    def _upload_parts(
+        self, file_path, bucket, key, upload_id, part_size, file_size,
+        pending, done, checkpoint_path, identity,
+    ):
+        if not pending:
+            return
+        workers = min(self.max_concurrence, len(pending))
+        buffers: queue.Queue = queue.Queue()
+        for _ in range(workers):
+            buffers.put(bytearray(part_size))
+        lock = threading.Lock()
+
+        fd = os.open(file_path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        try:
+
+            def upload_part(num):
+                buf = buffers.get()
+                try:
+                    offset = (num - 1) * part_size
+                    view = memoryview(buf)[:min(part_size, file_size - offset)]
+                    if _pread_into(fd, view, offset, lock) != len(view):
+                        raise IOError(f"file changed during upload: {file_path}")
+                    rsp = self.s3_client.upload_part(
+                        Bucket=bucket,
+                        Key=key,
+                        PartNumber=num,
+                        UploadId=upload_id,
+                        Body=MemoryViewReader(view),
+                    )
+                    return rsp["ETag"]
+                finally:
+                    buffers.put(buf)
+
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(upload_part, num): num for num in pending}
+                try:
+                    for future in as_completed(futures):
+                        done[futures[future]] = future.result()
+                        self._save_checkpoint(checkpoint_path, identity, upload_id, done)
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+        finally:
+            os.close(fd)
+
+    def _resume(self, checkpoint_path, identity):
+        if not os.path.exists(checkpoint_path):
+            return None, {}
+        try:
+            with open(checkpoint_path, encoding="utf-8") as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError):
+            warning("ignore broken upload checkpoint: %s", checkpoint_path)
+            return None, {}
+        if any(checkpoint.get(k) != v for k, v in identity.items()):
+            debug("file changed since last attempt, restart upload: %s", checkpoint_path)
+            return None, {}
+
+        upload_id = checkpoint["upload_id"]
+        recorded = {int(num): etag for num, etag in checkpoint.get("parts", {}).items()}
+        uploaded = {}
+        try:
+            paginator = self.s3_client.get_paginator("list_parts")
+            for page in paginator.paginate(
+                Bucket=identity["bucket"], Key=identity["key"], UploadId=upload_id,
+            ):
+                for part in page.get("Parts", []):
+                    uploaded[part["PartNumber"]] = part["ETag"]
+        except ClientError as e:
+            warning("cannot resume multipart upload %s: %s", upload_id, e)
+            return None, {}
+        # trust only parts that both sides agree on
+        done = {num: etag for num, etag in uploaded.items() if recorded.get(num) == etag}
+        return upload_id, done
+
+    def _save_checkpoint(self, checkpoint_path, identity, upload_id, done):
+        os.makedirs(os.path.dirname(checkpoint_path) or ".", exist_ok=True)
+        checkpoint = dict(identity)
+        checkpoint["upload_id"] = upload_id
+        checkpoint["parts"] = {str(num): etag for num, etag in done.items()}
+        tmp_path = checkpoint_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, checkpoint_path)
+
+    def _remove_checkpoint(self, checkpoint_path):
+        try:
+            os.remove(checkpoint_path)
+        except FileNotFoundError:
+            pass
+
+    def _abort(self, bucket, key, upload_id, checkpoint_path):
+        try:
+            self.s3_client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+            debug("Multipart upload aborted: %s", upload_id)
+        except ClientError as e:
+            warning("failed to abort multipart upload %s: %s", upload_id, e)
+        self._remove_checkpoint(checkpoint_path)
+
+    @staticmethod
+    def _default_checkpoint_path(file_path, bucket, key):
+        digest = hashlib.sha1(
+            f"{os.path.abspath(file_path)}\n{bucket}\n{key}".encode("utf-8"),
+        ).hexdigest()
+        return os.path.join(cache_dir.HOME_DIR, UPLOAD_CHECKPOINT_ROOT, digest + ".json")
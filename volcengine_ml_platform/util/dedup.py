@@ -0,0 +1,41 @@
+import hashlib
+from collections import OrderedDict
+
+DEFAULT_CAPACITY = 262144
+
+
+class RecentKeys:
+    '''remembers a value for at most `capacity` distinct string keys
+
+    Keys are stored as 16-byte blake2b digests. Memory therefore depends on
+    `capacity` only, not on the length or number of keys seen. When full, the
+    key remembered first is forgotten first, so a key that comes back after
+    more than `capacity` other distinct keys is treated as new again.
+    '''
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _digest(key):
+        return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+    def get(self, key, default=None):
+        return self._entries.get(self._digest(key), default)
+
+    def setdefault(self, key, value):
+        '''return the value remembered for `key`, or remember and return `value`'''
+        digest = self._digest(key)
+        found = self._entries.get(digest)
+        if found is not None:
+            return found
+        self._entries[digest] = value
+        if len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+        return value
@@ -0,0 +1,35 @@
+import threading
+import time
+
+
+class TokenBucket:
+    '''thread-safe token bucket
+    rate: float, tokens added per second
+    capacity: float, max burst size, defaults to one second worth of tokens
+
+    acquire() may take more tokens than the bucket holds (e.g. a whole
+    multipart part); the bucket goes into debt and later callers wait for it
+    to be paid back, so the long-term rate is still honoured.
+    '''
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        '''take `amount` tokens, blocking until they are available'''
+        if amount <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
@@ -1,7 +1,12 @@
 import functools
+import random
+import threading
 import time
 import logging
 
+from botocore import exceptions as botocore_exceptions
+from botocore.exceptions import ClientError
+
 
 def retry(count, delay_seconds=0):
     '''retry a given number of times, supports set delay internal
@@ -23,3 +28,165 @@ def retry(count, delay_seconds=0):
             return f(*args, **kwargs)
         return f_retry  # true decorator
     return deco_retry
+
+
+# throttling: the request rate or concurrency is too high, also used by tos_concurrency
+THROTTLE_ERROR_CODES = frozenset([
+    'ServiceUnavailable',
+    'SlowDown',
+    'Throttling',
+    'ThrottlingException',
+    'TooManyRequests',
+    'RequestLimitExceeded',
+    'RequestTimeout',
+    '503',
+    '429',
+])
+THROTTLE_STATUS_CODES = frozenset([429, 503])
+RETRYABLE_ERROR_CODES = THROTTLE_ERROR_CODES | frozenset([
+    'InternalError',
+    'RequestTimeTooSkewed',
+])
+RETRYABLE_STATUS_CODES = THROTTLE_STATUS_CODES | frozenset([408, 500, 502, 504])
+
+_NETWORK_ERRORS = tuple(
+    cls for cls in (
+        botocore_exceptions.ConnectionError,
+        botocore_exceptions.HTTPClientError,
+        botocore_exceptions.IncompleteReadError,
+        getattr(botocore_exceptions, 'ResponseStreamingError', None),
+        ConnectionError,
+        TimeoutError,
+    ) if cls is not None
+)
+
+
+def is_retryable_error(error):
+    '''default classifier: throttling, 5xx and network errors are retryable,
+    other client errors (NoSuchKey, AccessDenied, PreconditionFailed ...) are fatal
+    '''
+    if isinstance(error, ClientError):
+        code = error.response.get('Error', {}).get('Code')
+        status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+        return code in RETRYABLE_ERROR_CODES or status in RETRYABLE_STATUS_CODES
+    return isinstance(error, _NETWORK_ERRORS)
+
+
+class RetryBudget:
+    '''caps retries to a fraction of successful requests, so that a struggling
+    service is not hit by a retry storm
+    ratio: float, retries earned by each successful request
+    min_retries_per_second: float, retries always allowed regardless of traffic
+    max_balance: float, max retries that can be saved up
+    '''
+
+    def __init__(self, ratio=0.2, min_retries_per_second=10, max_balance=100):
+        self.ratio = ratio
+        self.min_retries_per_second = min_retries_per_second
+        self.max_balance = max_balance
+        self._balance = float(max_balance)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._balance = min(self.max_balance, self._balance + self.ratio)
+
+    def try_withdraw(self):
+        with self._lock:
+            now = time.monotonic()
+            self._balance = min(
+                self.max_balance,
+                self._balance + (now - self._last) * self.min_retries_per_second,
+            )
+            self._last = now
+            if self._balance < 1:
+                return False
+            self._balance -= 1
+            return True
+
+
+class RetryPolicy:
+    '''exponential backoff with full jitter
+    max_attempts: int, total attempts including the first one
+    base_delay: float, backoff of the first retry in seconds
+    max_delay: float, upper bound of a single backoff
+    classifier: callable(error) -> bool, whether an error is retryable
+    budget: RetryBudget, shared retry budget, None for unlimited
+
+    can be used as a decorator or through call(); TOSClient also installs it
+    into botocore, so that every request is retried by it
+    '''
+
+    def __init__(
+        self,
+        max_attempts=5,
+        base_delay=0.05,
+        max_delay=20.0,
+        classifier=is_retryable_error,
+        budget=None,
+    ):
+        if max_attempts < 1:
+            raise ValueError('max_attempts must be positive')
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.classifier = classifier
+        self.budget = budget
+
+    def backoff(self, attempts):
+        '''full jitter: uniform(0, min(max_delay, base_delay * 2 ** (attempts - 1)))'''
+        cap = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return random.uniform(0, cap)
+
+    def next_delay(self, error, attempts):
+        '''seconds to wait before retrying after `attempts` failed attempts,
+        or None if the error should be raised
+        '''
+        if attempts >= self.max_attempts or not self.classifier(error):
+            return None
+        if self.budget is not None and not self.budget.try_withdraw():
+            logging.warning('retry budget exhausted, give up: %s', error)
+            return None
+        return self.backoff(attempts)
+
+    def on_success(self):
+        if self.budget is not None:
+            self.budget.deposit()
+
+    def call(self, f, *args, **kwargs):
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                result = f(*args, **kwargs)
+            except Exception as e:
+                delay = self.next_delay(e, attempts)
+                if delay is None:
+                    raise
+                logging.info(
+                    'Retrying function [%s] in %.2fs..., Error: %s',
+                    getattr(f, '__name__', f), delay, e)
+                time.sleep(delay)
+                continue
+            self.on_success()
+            return result
+
+    def __call__(self, f):
+        @functools.wraps(f)
+        def f_retry(*args, **kwargs):
+            return self.call(f, *args, **kwargs)
+        return f_retry
+
+
+_default_policy = RetryPolicy(budget=RetryBudget())
+
+
+def set_default_retry_policy(policy):
+    '''set the policy used by TOSClient instances created without one'''
+    global _default_policy
+    _default_policy = policy
+
+
+def get_default_retry_policy():
+    return _default_policy